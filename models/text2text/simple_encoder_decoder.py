@@ -182,6 +182,9 @@ class SimpleEncoderDecoder(SequentialModel):
 
         # get batch_size (dim 0)
         batch_size = inputs.size(0)
+        # get lengths of (possibly trimmed) input & target sequences (dim 1)
+        input_length = inputs.size(1)
+        target_length = targets.size(1)
 
         # reshape tensors: from [batch_size x max_seq_length] to
         # [max_seq_length x batch_size]
@@ -212,11 +215,16 @@ class SimpleEncoderDecoder(SequentialModel):
         self.decoder_attentions = torch.zeros(
             batch_size, self.max_length, self.max_length).type(self.app_state.dtype)
 
-        # encoder manual loop
-        for ei in range(self.max_length):
-            encoder_output, encoder_hidden = self.encoder(
+        # encoder manual loop - the recurrence of every sentence stops at its
+        # last (non-PAD) word, so its hidden state does not depend on the
+        # padding of the batch, and encoder outputs beyond it stay zero
+        for ei in range(input_length):
+            encoder_output, next_hidden = self.encoder(
                 input_tensor[ei].unsqueeze(-1), encoder_hidden)
-            encoder_outputs[ei] = encoder_output.squeeze()
+            # mask of sentences not finished yet: [batch_size x 1]
+            not_padded = (input_tensor[ei] != PAD_token).unsqueeze(-1)
+            encoder_hidden = torch.where(not_padded, next_hidden, encoder_hidden)
+            encoder_outputs[ei] = encoder_output.squeeze() * not_padded.type(self.app_state.dtype)
 
         # reshape encoder_outputs to be batch_size first: [max_length,
         # batch_size, *] -> [batch_size, max_length, *]
@@ -233,13 +241,13 @@ class SimpleEncoderDecoder(SequentialModel):
 
         # create placeholder for the decoder outputs -> will be the logits
         decoder_outputs = torch.zeros(
-            self.max_length,
+            target_length,
             batch_size,
             self.output_voc_size).type(
             self.app_state.dtype)
 
         if self.training:  # Teacher forcing: Feed the target as the next input
-            for di in range(self.max_length):
+            for di in range(target_length):
                 # base decoder
                 #decoder_output, decoder_hidden = self.decoder(decoder_input, decoder_hidden)
 
@@ -255,7 +263,7 @@ class SimpleEncoderDecoder(SequentialModel):
         else:
             # Without teacher forcing: use its own predictions as the next
             # input
-            for di in range(self.max_length):
+            for di in range(target_length):
                 # base decoder
                 #decoder_output, decoder_hidden = self.decoder(decoder_input, decoder_hidden)
 
@@ -48,9 +48,8 @@ __author__ = "Vincent Albouy, Vincent Marois"
 
 import matplotlib.pyplot as plt
 from torch.utils.data import DataLoader
-from torch.utils.data.sampler import RandomSampler
+from torch.utils.data.sampler import RandomSampler, SequentialSampler
 import torch
-import csv
 
 from problems.problem import DataTuple
 
@@ -86,31 +85,43 @@ class CLEVR(ImageTextToClassProblem):
         self.embedding_type = params['embedding_type']
         self.random_embedding_dim = params['random_embedding_dim']
 
+        # Number of worker processes loading the samples (0 means loading in
+        # the main process) and number of batches prefetched by every worker.
+        params.add_default_params({'num_workers': 0, 'prefetch_factor': 2})
+        self.num_workers = params['num_workers']
+        self.prefetch_factor = params['prefetch_factor']
+
+        # Embed the questions of the whole batch with a single look-up (instead
+        # of one per sample).
+        params.add_default_params({'batch_embedding': True})
+        self.batch_embedding = params['batch_embedding']
+
+        # Layout of the generated feature maps: type of values ('float32' or
+        # 'float16') and compression (None, 'lzf', 'gzip' or 'blosc').
+        params.add_default_params({'feature_dtype': 'float32',
+                                   'feature_compression': None})
+        self.feature_dtype = params['feature_dtype']
+        self.feature_compression = params['feature_compression']
+
         # instantiate CLEVRDataset class
         self.clevr_dataset = CLEVRDataset(
             self.set,
             self.clevr_dir,
             self.clevr_humans,
             self.embedding_type,
-            self.random_embedding_dim)
+            self.random_embedding_dim,
+            self.batch_embedding,
+            self.feature_dtype,
+            self.feature_compression)
+
+        # Persistent DataLoader and its iterator - created on the first batch.
+        self.loader = None
+        self.loader_iter = None
+        # Number of completed passes over the dataset.
+        self.epoch = 0
 
         # to compute the accuracy per family
-        self.family_list = [
-            'query_size',
-            'equal_size',
-            'query_shape',
-            'query_color',
-            'greater_than',
-            'equal_material',
-            'equal_color',
-            'equal_shape',
-            'less_than',
-            'count',
-            'exist',
-            'equal_integer',
-            'query_material']
-        self.tuple_list = [[0, 0] for _ in range(len(self.family_list))]
-        self.dic = dict(zip(self.family_list, self.tuple_list))
+        self.family_list = CLEVRDataset.FAMILIES
         self.categories_transform = {
             'query_size': 'query_attribute',
             'equal_size': 'compare_attribute',
@@ -125,84 +136,143 @@ class CLEVR(ImageTextToClassProblem):
             'exist': 'exist',
             'equal_integer': 'compare_integer',
             'query_material': 'query_attribute'}
-
-    def get_acc_per_family(self, data_tuple, aux_tuple, logits):
+        self.categories_list = ['query_attribute', 'compare_integer',
+                                'count', 'compare_attribute', 'exist']
+        # index of the category of every family
+        self.family_categories = torch.tensor(
+            [self.categories_list.index(self.categories_transform[family])
+             for family in self.family_list])
+
+        # # of correct predictions & questions per family, accumulated over
+        # evaluated batches since the last reset_statistics()
+        self.family_correct = torch.zeros(len(self.family_list), dtype=torch.int64)
+        self.family_total = torch.zeros(len(self.family_list), dtype=torch.int64)
+
+    def accumulate_statistics(self, data_tuple, logits, aux_tuple):
         """
-        Compute the accuracy per family for the current batch. Also accumulates
-        the # of correct predictions & questions per family in self.dic (saved
-        to file).
+        Accumulates the # of correct predictions & questions per family of an
+        evaluated batch (with a single bincount each).
 
         :param data_tuple: DataTuple ((images, questions), targets)
-        :param aux_tuple: (questions_strings, questions_indexes, images_filenames, question_types)
         :param logits: network predictions.
+        :param aux_tuple: (questions_strings, questions_indexes, images_filenames, question_types, families)
 
         """
-
         # get correct predictions
-        pred = logits.max(1, keepdim=True)[1]
-        correct = pred.eq(data_tuple.targets.view_as(pred))
+        pred = logits.max(1)[1]
+        correct = pred.eq(data_tuple.targets).cpu()
 
-        # unpack aux_tuple
-        (s_questions, indexes, imgfiles, question_types) = aux_tuple
-        print('\n')
-        for i in range(correct.size(0)):
-            # update # of questions for the corresponding family
-            self.dic[question_types[i]][1] += 1
-
-            if correct[i] == 1:
-                # update the # of correct predictions for the corresponding
-                # family
-                self.dic[question_types[i]][0] += 1
-
-        for family in self.family_list:
-            if self.dic[family][1] == 0:
-                print('Family: {} - Acc: No questions!'.format(family))
-
-            else:
-                family_accuracy = (self.dic[family][0]) / (self.dic[family][1])
-                print('Family: {} - Acc: {} - Total # of questions: {}'.format(family,
-                                                                               family_accuracy, self.dic[family][1]))
-
-        categories_list = ['query_attribute', 'compare_integer',
-                           'count', 'compare_attribute', 'exist']
-        tuple_list_categories = [[0, 0] for _ in range(len(categories_list))]
-        dic_categories = dict(zip(categories_list, tuple_list_categories))
-        print('\n')
-        for category in categories_list:
-            for family in self.family_list:
-                if self.categories_transform[family] == category:
-                    dic_categories[category][0] += self.dic[family][0]
-                    dic_categories[category][1] += self.dic[family][1]
-
-        for category in categories_list:
-            if dic_categories[category][1] == 0:
-                print('Category: {} - Acc: No questions!'.format(category))
-
-            else:
-                category_accuracy = (
-                    dic_categories[category][0]) / (dic_categories[category][1])
-                print('Category: {} - Acc: {} - Total # of questions: {}'.format(
-                    category, category_accuracy, dic_categories[category][1]))
-
-        with open(self.clevr_dir + '/generated_files/families_acc.csv', 'w') as csv_file:
-            writer = csv.writer(csv_file)
-            for key, value in self.dic.items():
-                writer.writerow([key, value])
+        # skip questions of unknown families
+        families = aux_tuple[4]
+        known = families >= 0
+
+        num_families = len(self.family_list)
+        self.family_total += torch.bincount(families[known], minlength=num_families)
+        self.family_correct += torch.bincount(families[known & correct], minlength=num_families)
+
+    def get_acc_per_family(self):
+        """
+        Computes the accuracy per family & per category, from the counts
+        accumulated by accumulate_statistics.
+
+        :return: Tensors with accuracies per family and per category (NaN if there were no questions).
+
+        """
+        family_acc = self.family_correct.double() / self.family_total.double()
+
+        num_categories = len(self.categories_list)
+        category_correct = torch.bincount(
+            self.family_categories, weights=self.family_correct.double(), minlength=num_categories)
+        category_total = torch.bincount(
+            self.family_categories, weights=self.family_total.double(), minlength=num_categories)
+
+        return family_acc, category_correct / category_total
+
+    def add_statistics(self, stat_col):
+        """
+        Add accuracy, accuracies per family and per category statistics to collector.
+
+        :param stat_col: Statistics collector.
+
+        """
+        super(CLEVR, self).add_statistics(stat_col)
+
+        # (categories 'count' & 'exist' consist of single families of the same
+        # names, so they share the statistics)
+        for name in self.family_list + self.categories_list:
+            stat_col.add_statistic('acc_' + name, '{:6.4f}', aggregation='last')
 
     def collect_statistics(self, stat_col, data_tuple, logits, aux_tuple):
         """
-        Collects accuracy.
+        Collects accuracy of the batch.
+
+        Accuracies per family and per category are not collected for single
+        batches - they are set by collect_accumulated_statistics() for evaluated
+        (validation/test) batches.
 
         :param stat_col: Statistics collector.
         :param data_tuple: Data tuple containing inputs and targets.
         :param logits: Logits being output of the model.
-        :param _: auxiliary tuple (aux_tuple) is not used in this function.
+        :param aux_tuple: auxiliary tuple (containing indexes of question families).
 
         """
         stat_col['acc'] = self.calculate_accuracy(
             data_tuple, logits, aux_tuple)
 
-        self.get_acc_per_family(data_tuple, aux_tuple, logits)
+        for name in self.family_list + self.categories_list:
+            stat_col['acc_' + name] = None
+
+    def collect_accumulated_statistics(self, stat_col):
+        """
+        Collects accuracies per family and per category of all batches
+        accumulated since the last reset_statistics().
+
+        :param stat_col: Statistics collector.
+
+        """
+        family_acc, category_acc = self.get_acc_per_family()
+        for name, acc in zip(self.family_list + self.categories_list,
+                             family_acc.tolist() + category_acc.tolist()):
+            stat_col['acc_' + name] = acc
+
+    def reset_statistics(self):
+        """
+        Resets the # of correct predictions & questions per family, e.g. before a new pass over the validation/test set.
+        """
+        self.family_correct.zero_()
+        self.family_total.zero_()
+
+    def create_loader(self):
+        """
+        Creates the DataLoader iterating over self.clevr_dataset and its
+        iterator.
+
+        The loader is kept between batches: the dataset is shuffled only once
+        per epoch and the worker processes (if any) are started once, each of
+        them opening the hdf5 file with feature maps once.
+
+        """
+        assert len(self.clevr_dataset) >= self.batch_size, \
+            "Batch size ({}) is bigger than the dataset ({})".format(
+                self.batch_size, len(self.clevr_dataset))
+
+        # Options available only when the samples are loaded by workers.
+        worker_options = {}
+        if self.num_workers > 0:
+            worker_options = {'worker_init_fn': CLEVRDataset.worker_init,
+                              'persistent_workers': True,
+                              'prefetch_factor': self.prefetch_factor,
+                              'pin_memory': self.app_state.use_CUDA}
+
+        self.loader = DataLoader(
+            self.clevr_dataset,
+            batch_size=self.batch_size,
+            collate_fn=self.clevr_dataset.collate_data,
+            sampler=RandomSampler(self.clevr_dataset),
+            drop_last=True,
+            num_workers=self.num_workers,
+            **worker_options)
+        self.loader_iter = iter(self.loader)
 
     def generate_batch(self):
         """
@@ -211,29 +281,81 @@ class CLEVR(ImageTextToClassProblem):
         WARNING: WE PASS THE QUESTIONS LENGTH INTO THE DATATUPLE!
 
         :return: - data_tuple: (((images, questions), questions_len), answers)
-                 - aux_tuple: (questions_strings, questions_indexes, images_filenames, question_types) (visualization)
+                 - aux_tuple: (questions_strings, questions_indexes, images_filenames, question_types, families) (visualization)
 
         """
+        # (Re)create the loader, e.g. when batch size was changed.
+        if self.loader is None or self.loader.batch_size != self.batch_size:
+            self.create_loader()
+
+        try:
+            batch = next(self.loader_iter)
+        except StopIteration:
+            # End of epoch - the new iterator reshuffles the dataset.
+            self.epoch += 1
+            self.loader_iter = iter(self.loader)
+            batch = next(self.loader_iter)
+
+        return self.batch_to_tuples(batch)
+
+    @staticmethod
+    def batch_to_tuples(batch):
+        """
+        Packs a batch collated by CLEVRDataset.collate_data into tuples.
 
-        clevr_loader = DataLoader(
-            self.clevr_dataset,
-            batch_size=self.batch_size,
-            collate_fn=self.clevr_dataset.collate_data,
-            sampler=RandomSampler(
-                self.clevr_dataset))
+        :param batch: List of collated tensors and lists.
+        :return: - data_tuple: (((images, questions), questions_len), answers)
+                 - aux_tuple: (questions_strings, questions_indexes, images_filenames, question_types, families)
 
-        images, questions, questions_len, answers, s_questions, indexes, imgfiles, question_types = next(
-            iter(clevr_loader))
+        """
+        images, questions, questions_len, answers, s_questions, indexes, imgfiles, question_types, families = batch
 
         # create data_tuple
         image_text_tuple = ImageTextTuple(images, questions)
         inner_data_tuple = (image_text_tuple, questions_len)
         data_tuple = DataTuple(inner_data_tuple, answers)
 
-        aux_tuple = (s_questions, indexes, imgfiles, question_types)
+        aux_tuple = (s_questions, indexes, imgfiles, question_types, families)
 
         return data_tuple, aux_tuple
 
+    def epoch_size(self):
+        """
+        Returns the number of questions of the set.
+        """
+        return len(self.clevr_dataset)
+
+    def return_epoch_generator(self, batch_size, num_workers=0, prefetch_factor=2):
+        """
+        Returns a generator yielding batches of all questions of the set, in
+        order, exactly once (the last batch can be smaller).
+
+        Uses a separate DataLoader (with SequentialSampler), so that samples
+        are loaded (and prefetched) by workers opening the hdf5 files once.
+
+        :param batch_size: Size of batches.
+        :param num_workers: Number of processes loading samples (DEFAULT: 0, i.e. the main process).
+        :param prefetch_factor: Number of batches prefetched by every worker (DEFAULT: 2).
+
+        """
+        worker_options = {}
+        if num_workers > 0:
+            worker_options = {'worker_init_fn': CLEVRDataset.worker_init,
+                              'prefetch_factor': prefetch_factor,
+                              'pin_memory': self.app_state.use_CUDA}
+
+        loader = DataLoader(
+            self.clevr_dataset,
+            batch_size=batch_size,
+            collate_fn=self.clevr_dataset.collate_data,
+            sampler=SequentialSampler(self.clevr_dataset),
+            drop_last=False,
+            num_workers=num_workers,
+            **worker_options)
+
+        for batch in loader:
+            yield self.batch_to_tuples(batch)
+
     def turn_on_cuda(self, data_tuple, aux_tuple):
         """
         Enables computations on GPU - copies the input and target matrices (from DataTuple) to GPU.
@@ -268,7 +390,7 @@ class CLEVR(ImageTextToClassProblem):
         plt.figure(1)
 
         # unpack aux_tuple
-        (s_questions, indexes, imgfiles, question_types) = aux_tuple
+        (s_questions, indexes, imgfiles, question_types, _) = aux_tuple
 
         question = s_questions[sample_number]
         answer = answers[sample_number]
@@ -326,7 +448,7 @@ class CLEVR(ImageTextToClassProblem):
                 answer[batch_num].data)]
             for batch_num in range(batch_size)]
 
-        (s_questions, indexes, imgfiles, question_types) = aux_tuple
+        (s_questions, indexes, imgfiles, question_types, _) = aux_tuple
         aux_tuple = (s_questions, answer_string, imgfiles,
                      self.set, prediction_string, self.clevr_dir)
 
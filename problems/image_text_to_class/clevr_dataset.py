@@ -49,15 +49,17 @@ clevr_dataset.py: This file contains 1 class:
 """
 __author__ = "Vincent Albouy, Vincent Marois"
 
-import h5py
 import torch
 import pickle
+import numpy as np
 
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, get_worker_info
 
 import os
 
 from problems.utils.language import Language
+from problems.image_text_to_class.clevr_question_store import CLEVRQuestionStore
+from problems.image_text_to_class.clevr_feature_store import CLEVRFeatureStore
 from utils.app_state import AppState
 
 import logging
@@ -75,15 +77,32 @@ class CLEVRDataset(Dataset):
     , and __getitem__, supporting integer indexing in range from 0 to len(self) exclusive.
     """
 
+    # Question families - their indexes identify the families in batches.
+    FAMILIES = [
+        'query_size',
+        'equal_size',
+        'query_shape',
+        'query_color',
+        'greater_than',
+        'equal_material',
+        'equal_color',
+        'equal_shape',
+        'less_than',
+        'count',
+        'exist',
+        'equal_integer',
+        'query_material']
+
     def __init__(self, set, clevr_dir, clevr_humans,
-                 embedding_type='random', random_embedding_dim=300):
+                 embedding_type='random', random_embedding_dim=300, batch_embedding=True,
+                 feature_dtype='float32', feature_compression=None):
         """
         Instantiate a ClevrDataset object:
 
             - Mainly check if the files containing the extracted features & tokenized questions already exist. If not,
             it generates them for the specified sub-set.
-            - self.img contains then the extracted feature maps
-            - self.data contains the tokenized questions, the associated image filenames, the answers & the question string
+            - self.features (CLEVRFeatureStore) contains then the extracted feature maps
+            - self.data (CLEVRQuestionStore) contains the tokenized questions, the associated image filenames, the answers & the question string
 
         The questions are then embedded based on the specified embedding. This embedding is random by default, but
         pretrained ones are possible.
@@ -99,6 +118,13 @@ class CLEVRDataset(Dataset):
 
         :param random_embedding_dim: In the case of random embedding, this is the embedding dimension to use.
 
+        :param batch_embedding: Boolean to indicate whether the questions are embedded by a single look-up per batch \
+        (in collate_data) instead of one per sample (in __getitem__).
+
+        :param feature_dtype: Type of the values of generated feature maps: 'float32' or 'float16'.
+
+        :param feature_compression: Compression of generated feature maps: None, 'lzf', 'gzip' or 'blosc'.
+
         """
         # call base constructor
         super(CLEVRDataset).__init__()
@@ -109,6 +135,9 @@ class CLEVRDataset(Dataset):
         self.clevr_humans = clevr_humans
         self.embedding_type = embedding_type
         self.random_embedding_dim = random_embedding_dim
+        self.batch_embedding = batch_embedding
+        self.feature_dtype = feature_dtype
+        self.feature_compression = feature_compression
 
         # Get access to app state.
         self.app_state = AppState()
@@ -129,32 +158,41 @@ class CLEVRDataset(Dataset):
 
         # checking if the file containing the images feature maps (processed by ResNet101) exists or not
         # For the same self.set, this file is the same for CLEVR & CLEVR-Humans
+        # The raw (memory-mapped) array is used if present (see CLEVRFeatureStore).
         feature_maps_filename = self.clevr_dir + \
-            '/generated_files/{}_CLEVR_features.hdf5'.format(self.set)
-        if os.path.isfile(feature_maps_filename):
+            '/generated_files/{}_CLEVR_features.npy'.format(self.set)
+        if not os.path.isfile(feature_maps_filename):
+            feature_maps_filename = self.clevr_dir + \
+                '/generated_files/{}_CLEVR_features.hdf5'.format(self.set)
+        if os.path.isfile(feature_maps_filename) and not self.extraction_in_progress(feature_maps_filename):
             logger.info('The file {} already exists, loading it.'.format(
                 feature_maps_filename))
 
         else:
-            logger.warning('File {} not found on disk, generating it:'.format(
+            logger.warning('File {} not found on disk (or not completed), generating it:'.format(
                 feature_maps_filename))
             self.generate_feature_maps_file(feature_maps_filename)
 
-        # actually load the file
-        self.h = h5py.File(feature_maps_filename, 'r')
-        self.img = self.h['data']
+        # The file is opened lazily, separately by every process accessing it
+        # (h5py file handles cannot be shared between DataLoader workers).
+        self.feature_maps_filename = feature_maps_filename
+        self.features = None
 
-        # checking if the file containing the tokenized questions (& answers,
+        # checking if the store containing the tokenized questions (& answers,
         # image filename) exists or not
-        questions_filename = self.clevr_dir + '/generated_files/{}_{}_questions.pkl'.format(
-            self.set, 'CLEVR_Humans' if self.clevr_humans else 'CLEVR')
-        if os.path.isfile(questions_filename):
-            logger.info('The file {} already exists, loading it.'.format(
-                questions_filename))
-
-            # load questions
-            with open(questions_filename, 'rb') as questions:
-                self.data = pickle.load(questions)
+        questions_dir = self.questions_store_dir(self.set)
+        questions_filename = questions_dir + '.pkl'
+        if CLEVRQuestionStore.exists(questions_dir) or os.path.isfile(questions_filename):
+            if CLEVRQuestionStore.exists(questions_dir):
+                logger.info('The store {} already exists, loading it.'.format(
+                    questions_dir))
+                self.data = CLEVRQuestionStore(questions_dir)
+            else:
+                # convert the (legacy) pickled list of questions
+                logger.warning('Converting the file {} to the store {}.'.format(
+                    questions_filename, questions_dir))
+                self.data = CLEVRQuestionStore.from_pickle(
+                    questions_filename, questions_dir)
 
             # load word_dics & answer_dics
             with open(self.clevr_dir + '/generated_files/dics.pkl', 'rb') as f:
@@ -193,9 +231,14 @@ class CLEVRDataset(Dataset):
                 self.data, self.word_dic, self.answer_dic = self.generate_questions_dics(
                     self.set, word_dic=None, answer_dic=None)
 
-        # At this point, the objects self.img & self.data contains the feature
+        # At this point, the objects self.features & self.data contains the feature
         # maps & questions
 
+        # map the families of the store to indexes of FAMILIES (-1: unknown family)
+        self.family_indexes = np.array(
+            [self.FAMILIES.index(name) if name in self.FAMILIES else -1
+             for name in self.data.family_names], dtype=np.int64)
+
         # creates the objects for the specified embeddings
         if self.embedding_type == 'random':
             logger.info(
@@ -229,12 +272,15 @@ class CLEVRDataset(Dataset):
                 self.embedding_type))
             # instantiate Language class
             self.language = Language('lang')
-            self.questions = [q['string_question'] for q in self.data]
-            # use the questions set to construct the embeddings vectors
+            self.questions = self.data.strings('string_question')
+            # use the questions set to construct the embeddings vectors (the
+            # vectors of the words of questions are cached in generated_files)
             self.language.build_pretrained_vocab(
-                self.questions, vectors=self.embedding_type)
+                self.questions, cache_dir=self.clevr_dir + '/generated_files',
+                vectors=self.embedding_type)
 
-        # Done! The actual question embedding is handled in __getitem__.
+        # Done! The actual question embedding is handled in __getitem__ or
+        # (for the whole batch) in collate_data.
 
     def __len__(self):
         """
@@ -242,11 +288,71 @@ class CLEVRDataset(Dataset):
         """
         return len(self.data)
 
+    def open_feature_maps(self):
+        """
+        Opens the file containing the feature maps. Called once by the main
+        process or (through worker_init_fn) once per DataLoader worker.
+        """
+        self.features = CLEVRFeatureStore(self.feature_maps_filename)
+
+    @staticmethod
+    def worker_init(worker_id):
+        """
+        Initializes a DataLoader worker: opens the file with feature maps
+        in the worker process.
+
+        :param worker_id: Id of the worker (not used).
+
+        """
+        get_worker_info().dataset.open_feature_maps()
+
     def close(self):
         """
-        Close hdf5 file.
+        Close the file with feature maps.
+        """
+        if self.features is not None:
+            self.features.close()
+            self.features = None
+
+    def read_images(self, ids):
+        """
+        Reads the feature maps of a batch of images at once.
+
+        :param ids: list of indexes of images.
+
+        :return: tensor of feature maps [batch_size x CHANNELS x HEIGHT x WIDTH].
+
+        """
+        if self.features is None:
+            self.open_feature_maps()
+        dtype, _ = self.tensor_types()
+        return torch.from_numpy(self.features.read(ids)).type(dtype)
+
+    def tensor_types(self):
+        """
+        Returns the floating point and integer tensor types of the samples.
+
+        DataLoader workers cannot initialize CUDA, so they always return
+        tensors of the CPU counterparts of the types set in the AppState
+        (these are moved to GPU in CLEVR.turn_on_cuda()).
+
+        :return: Pair of tensor types (float, long).
+
+        """
+        if get_worker_info() is not None:
+            return (getattr(torch, self.app_state.dtype.__name__),
+                    torch.LongTensor)
+        return self.app_state.dtype, self.app_state.LongTensor
+
+    def questions_store_dir(self, set):
+        """
+        Returns the directory of the store of tokenized questions.
+
+        :param set: String to specify which dataset to use: 'train', 'val'
+
         """
-        self.h.close()
+        return self.clevr_dir + '/generated_files/{}_{}_questions'.format(
+            set, 'CLEVR_Humans' if self.clevr_humans else 'CLEVR')
 
     def generate_questions_dics(self, set, word_dic=None, answer_dic=None):
         """
@@ -323,14 +429,12 @@ class CLEVRDataset(Dataset):
         logger.info(
             'Done: constructed words dictionary of length {}, and answers dictionary of length {}'.format(
                 len(word_dic), len(answer_dic)))
-        # save result to file
-        questions_filename = self.clevr_dir + '/generated_files/{}_{}_questions.pkl'.format(
-            set, 'CLEVR_Humans' if self.clevr_humans else 'CLEVR')
-        with open(questions_filename, 'wb') as f:
-            pickle.dump(result, f)
+        # save result to the store
+        questions_dir = self.questions_store_dir(set)
+        result = CLEVRQuestionStore.create(result, questions_dir)
 
         logger.warning(
-            'Saved tokenized questions to file {}.'.format(questions_filename))
+            'Saved tokenized questions to the store {}.'.format(questions_dir))
 
         # save dictionaries to file:
         with open(self.clevr_dir + '/generated_files/dics.pkl', 'wb') as f:
@@ -341,51 +445,36 @@ class CLEVRDataset(Dataset):
         # return everything
         return result, word_dic, answer_dic
 
+    def extraction_in_progress(self, feature_maps_filename):
+        """
+        Checks whether the extraction of feature maps was started, but not
+        completed (e.g. was interrupted), according to its progress ledger.
+
+        :param feature_maps_filename: filename of the feature maps.
+
+        """
+        if not os.path.isfile(feature_maps_filename + '.ledger'):
+            return False
+        from problems.image_text_to_class.extract_feature_maps import is_complete
+        num_images = len(os.listdir(os.path.join(self.clevr_dir, 'images', self.set)))
+        return not is_complete(feature_maps_filename, num_images)
+
     def generate_feature_maps_file(self, feature_maps_filename, batch_size=50):
         """
-        Uses GenerateFeatureMaps to pass the CLEVR images through a pretrained
-        CNN model.
+        Uses extract_feature_maps to pass the CLEVR images through a pretrained
+        CNN model (on GPU if available). An interrupted extraction is resumed.
 
-        :param set: String to specify which dataset to use: 'train', 'val' or 'test'.
         :param feature_maps_filename: filename for saving to file.
         :param batch_size: batch size
 
-        :return: feature maps
-
         """
         # import lines
-        from problems.image_text_to_class.generate_feature_maps import GenerateFeatureMaps
-        from torch.utils.data import DataLoader
-        import tqdm
-
-        # create DataLoader of the images dataset.
-        generate_feature_maps = GenerateFeatureMaps(
-            clevr_dir=self.clevr_dir,
-            set=self.set,
-            cnn_model='resnet101',
-            num_blocks=4)
-        dataloader = DataLoader(generate_feature_maps, batch_size=batch_size)
+        from problems.image_text_to_class.extract_feature_maps import extract_feature_maps
 
-        size = len(dataloader)
-        dataset = iter(dataloader)
-        pbar = tqdm.tqdm(dataset, total=size, unit="batches")
+        extract_feature_maps(self.clevr_dir, self.set, feature_maps_filename,
+                             batch_size=batch_size, dtype=self.feature_dtype,
+                             compression=self.feature_compression)
 
-        # create file to store feature maps.
-        f = h5py.File(feature_maps_filename, 'w', libver='latest')
-        dset = f.create_dataset(
-            'data', (size * batch_size, 1024, 14, 14), dtype='f4')
-
-        with torch.no_grad():
-            for i, image in enumerate(pbar):
-                # move batch to GPU
-                image = image.type(torch.cuda.FloatTensor)
-
-                # forward pass, move output to cpu and store it into the file.
-                features = generate_feature_maps.model(
-                    image).detach().cpu().numpy()
-                dset[i * batch_size:(i + 1) * batch_size] = features
-
-        f.close()
         logger.warning('File {} successfully created.'.format(
             feature_maps_filename))
 
@@ -395,30 +484,39 @@ class CLEVRDataset(Dataset):
 
         :param index: index of the sample to return.
 
-        :return: img: extracted feature maps from the raw image
+        :return: id: index of the image (its feature maps are read for the whole batch in collate_data)
                  tokenized_question: tensor of word indexes
                  len(question): question length
                  answer: index of the answer in the answers dictionary
                  string_question: original question string
                  index: index of the sample
                  imgfile: image filename
+                 question_type: question family
+                 family: index of the question family in FAMILIES (-1 if unknown)
 
         """
-        # load tokenized_question, answer, string_question, image_filename from
+        # load tokenized_question, answer, string_question, image_filename and
+        # the image index (to retrieve the feature maps in self.features) from
         # self.data
-        question, answer, string_question, imgfile, question_type = self.data[index].values(
-        )
-
-        # create the image index to retrieve the feature maps in self.img
-        id = int(imgfile.rsplit('_', 1)[1][:-4])
-
-        img = torch.from_numpy(self.img[id]).type(self.app_state.dtype)
+        question, answer, string_question, imgfile, question_type, id = self.data[index]
+        family = int(self.family_indexes[self.data.family_ids[index]])
+        dtype, _ = self.tensor_types()
+
+        if self.batch_embedding:
+            # only the word indexes - the questions are embedded in collate_data
+            if self.embedding_type == 'random':
+                question = torch.from_numpy(question)
+            else:
+                question = torch.LongTensor(
+                    self.language.sentence_indices(string_question))
 
         # embed question
-        if self.embedding_type == 'random':
-            # embed question:
-            question = self.embed_layer(
-                torch.LongTensor(question)).type(self.app_state.dtype)
+        elif self.embedding_type == 'random':
+            # embed question (the embedding is not trained, so there is no need
+            # to keep the graph - it also could not be passed between workers).
+            with torch.no_grad():
+                question = self.embed_layer(
+                    torch.from_numpy(question)).type(dtype)
 
         else:
             # embed question
@@ -427,7 +525,22 @@ class CLEVRDataset(Dataset):
         question_length = question.shape[0]
 
         # return everything
-        return img, question, question_length, answer, string_question, index, imgfile, question_type
+        return id, question, question_length, answer, string_question, index, imgfile, question_type, family
+
+    def embed_batch(self, questions):
+        """
+        Embeds a batch of questions with a single look-up.
+
+        :param questions: list of tensors of word indexes (sorted by decreasing length).
+
+        :return: Tensor of embedded questions [batch_size x max_len x embedding_dim] (zeros after the ends of \
+        questions).
+
+        """
+        with torch.no_grad():
+            if self.embedding_type == 'random':
+                return Language.embed_padded(questions, self.embed_layer)
+            return self.language.embed_batch(questions)
 
     def collate_data(self, batch):
         """
@@ -436,51 +549,58 @@ class CLEVRDataset(Dataset):
         :param batch: list (?) of samples to combine
 
         :return: images (tensor), padded_tokenized_questions (tensor), questions_lengths (list), answers (tensor),
-                questions_strings (list), indexes (list), imgfiles (list)
+                questions_strings (list), indexes (list), imgfiles (list), question_types (list),
+                families (tensor of indexes of question families in FAMILIES)
 
         """
         # create list placeholders
-        images, lengths, answers, s_questions, indexes, imgfiles, question_types = [
-        ], [], [], [], [], [], []
+        images, lengths, answers, s_questions, indexes, imgfiles, question_types, families = [
+        ], [], [], [], [], [], [], []
         batch_size = len(batch)
+        dtype, long_type = self.tensor_types()
 
         # get max question length, create tensor of shape [batch_size x maxQuestionLength] & sort questions by
         # decreasing length
         max_len = max(map(lambda x: len(x[1]), batch))
         sort_by_len = sorted(batch, key=lambda x: len(x[1]), reverse=True)
 
+        if self.batch_embedding:
+            # pad the word indexes and embed all questions with a single
+            # look-up
+            questions = self.embed_batch([b[1] for b in sort_by_len]).type(dtype)
+
         # create tensor containing the embedded questions
-        if self.embedding_type == 'random':
+        elif self.embedding_type == 'random':
             questions = torch.zeros(
                 batch_size,
                 max_len,
-                self.random_embedding_dim).type(
-                self.app_state.dtype)
+                self.random_embedding_dim).type(dtype)
 
         else:
             # get embedding dimension from the embedding type
             embedding_dim = int(self.embedding_type[-4:-1])
             questions = torch.zeros(
-                batch_size, max_len, embedding_dim).type(self.app_state.dtype)
+                batch_size, max_len, embedding_dim).type(dtype)
 
         # fill in the placeholders
         for i, b in enumerate(sort_by_len):
-            image, question, length, answer, string_question, index, imgfile, question_type = b
+            image_id, question, length, answer, string_question, index, imgfile, question_type, family = b
 
-            images.append(image)
+            images.append(image_id)
             lengths.append(length)
             answers.append(answer)
             s_questions.append(string_question)
             indexes.append(index)
             imgfiles.append(imgfile)
             question_types.append(question_type)
+            families.append(family)
 
-            questions[i, :length, :] = question
+            if not self.batch_embedding:
+                questions[i, :length, :] = question
 
         # return all
-        return torch.stack(images).type(
-            self.app_state.dtype), questions, lengths, torch.tensor(answers).type(
-            self.app_state.LongTensor), s_questions, indexes, imgfiles, question_types
+        return self.read_images(images), questions, lengths, torch.tensor(answers).type(
+            long_type), s_questions, indexes, imgfiles, question_types, torch.tensor(families)
 
 
 if __name__ == '__main__':
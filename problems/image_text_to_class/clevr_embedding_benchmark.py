@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+clevr_embedding_benchmark.py: compares throughput of collation of CLEVR
+batches, with questions embedded one by one (in __getitem__) versus with a
+single look-up per batch (in collate_data). Also checks that both result in
+the same questions.
+
+Run from the root directory of the repository, e.g.:
+
+    python -m problems.image_text_to_class.clevr_embedding_benchmark --CLEVR_dir ~/data/CLEVR_v1.0 --batch_size 64
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import time
+import argparse
+import numpy as np
+import torch
+
+from problems.image_text_to_class.clevr_dataset import CLEVRDataset
+
+
+def measure(dataset, batches):
+    """
+    Measures throughput of collation of batches.
+
+    :param dataset: CLEVRDataset object.
+    :param batches: List of lists of indexes of samples forming batches.
+    :returns: Number of batches collated per second and the questions of the last batch.
+
+    """
+    start = time.perf_counter()
+    for indexes in batches:
+        questions = dataset.collate_data([dataset[i] for i in indexes])[1]
+    return len(batches) / (time.perf_counter() - start), questions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--CLEVR_dir', type=str, required=True,
+                        help='Directory of the CLEVR dataset (with generated_files)')
+    parser.add_argument('--set', type=str, default='val',
+                        help='Set of questions (DEFAULT: val)')
+    parser.add_argument('--embedding_type', type=str, default='random',
+                        help='Type of embedding (DEFAULT: random)')
+    parser.add_argument('--random_embedding_dim', type=int, default=300,
+                        help='Dimension of random embedding (DEFAULT: 300)')
+    parser.add_argument('--batch_size', type=int, default=64,
+                        help='Size of the batch (DEFAULT: 64)')
+    parser.add_argument('--episodes', type=int, default=100,
+                        help='Number of collated batches (DEFAULT: 100)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random generator (DEFAULT: 0)')
+    FLAGS, _ = parser.parse_known_args()
+
+    dataset = CLEVRDataset(FLAGS.set, FLAGS.CLEVR_dir, False,
+                           FLAGS.embedding_type, FLAGS.random_embedding_dim)
+    # The same batches for both variants.
+    np.random.seed(FLAGS.seed)
+    batches = [np.random.choice(len(dataset), FLAGS.batch_size)
+               for _ in range(FLAGS.episodes)]
+
+    # Reference: embedding sample by sample.
+    dataset.batch_embedding = False
+    per_sample, reference = measure(dataset, batches)
+    # Embedding once per batch.
+    dataset.batch_embedding = True
+    per_batch, questions = measure(dataset, batches)
+
+    print('{:>24} {:>24} {:>10} {:>10}'.format(
+        'per sample [batch/s]', 'per batch [batch/s]', 'speedup', 'equal'))
+    print('{:>24.2f} {:>24.2f} {:>10.2f} {:>10}'.format(
+        per_sample, per_batch, per_batch / per_sample,
+        str(torch.equal(reference, questions))))
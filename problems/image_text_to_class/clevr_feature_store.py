@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+clevr_feature_store.py: This file contains 1 class:
+
+- CLEVRFeatureStore: storage of the feature maps of CLEVR images, with batched reads.
+
+It can also be run as a script, converting an existing file with feature maps into another layout, e.g.:
+
+    python -m problems.image_text_to_class.clevr_feature_store train_CLEVR_features.hdf5 train_fp16.hdf5 --dtype float16 --compression lzf
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import argparse
+import numpy as np
+import h5py
+
+
+class CLEVRFeatureStore(object):
+    """
+    Storage of the feature maps [NUM_IMAGES x CHANNELS x HEIGHT x WIDTH] of
+    CLEVR images.
+
+    Two layouts are supported, depending on the extension of the file:
+
+        - .hdf5: dataset 'data' chunked per image, optionally stored as float16 and/or compressed \
+        ('lzf', 'gzip' or 'blosc' - the latter requires the hdf5plugin package),
+        - .npy: raw (uncompressed) array, read through a memory map.
+
+    read() fetches the feature maps of a whole batch: the requested ids are
+    sorted (and deduplicated), read in a single pass over the file and the
+    original order is restored.
+
+    """
+
+    def __init__(self, filename, data=None, writable=False):
+        """
+        Opens the store. Use create() to create a new one.
+
+        :param filename: Name of the file (.hdf5 or .npy).
+        :param data: Array/dataset already created (and opened for writing) by create() (DEFAULT: None).
+        :param writable: Open the existing file for writing (DEFAULT: False).
+
+        """
+        self.filename = filename
+        self.file = None
+
+        if data is not None:
+            self.data = data
+            self.file = getattr(data, 'file', None)
+        elif self.is_raw(filename):
+            self.data = np.load(filename, mmap_mode='r+' if writable else 'r')
+        else:
+            self.file = h5py.File(filename, 'r+' if writable else 'r')
+            self.data = self.file['data']
+
+    @staticmethod
+    def is_raw(filename):
+        """
+        Checks whether the file contains a raw (.npy) array.
+
+        :param filename: Name of the file.
+
+        """
+        return filename.endswith('.npy')
+
+    def __len__(self):
+        """
+        Returns the number of images.
+        """
+        return self.data.shape[0]
+
+    @property
+    def shape(self):
+        """
+        Returns the shape of the stored features.
+        """
+        return self.data.shape
+
+    def read(self, ids):
+        """
+        Reads the feature maps of a batch of images.
+
+        :param ids: List (or array) of indexes of images, possibly repeated.
+        :return: Numpy array [len(ids) x CHANNELS x HEIGHT x WIDTH] (in the order of ids).
+
+        """
+        unique_ids, inverse = np.unique(np.asarray(ids), return_inverse=True)
+
+        if isinstance(self.data, np.ndarray):
+            # Memory map: a single fancy-indexed read.
+            features = self.data[unique_ids]
+        else:
+            # hdf5: fancy indexing of chunked datasets in h5py is very slow,
+            # so runs of consecutive ids are read as slices.
+            features = np.empty((len(unique_ids),) + self.data.shape[1:],
+                                dtype=self.data.dtype)
+            run_starts = np.flatnonzero(np.diff(unique_ids) != 1) + 1
+            start = 0
+            for run in np.split(unique_ids, run_starts):
+                features[start:start + len(run)] = self.data[run[0]:run[-1] + 1]
+                start += len(run)
+
+        return features[inverse]
+
+    def write(self, start, features):
+        """
+        Writes the feature maps of consecutive images.
+
+        :param start: Index of the first image.
+        :param features: Numpy array [N x CHANNELS x HEIGHT x WIDTH].
+
+        """
+        self.data[start:start + features.shape[0]] = features.astype(self.data.dtype)
+
+    def close(self):
+        """
+        Closes the store (flushes the written data).
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        elif isinstance(self.data, np.memmap):
+            self.data.flush()
+        self.data = None
+
+    @classmethod
+    def create(cls, filename, num_images, feature_shape, dtype='float32', compression=None):
+        """
+        Creates a new (empty) store.
+
+        :param filename: Name of the file (.hdf5 or .npy).
+        :param num_images: Number of images.
+        :param feature_shape: Shape of features of a single image, e.g. (1024, 14, 14).
+        :param dtype: Type of stored values: 'float32' or 'float16' (DEFAULT: 'float32').
+        :param compression: None, 'lzf', 'gzip' or 'blosc' (DEFAULT: None). Not available for .npy files.
+        :return: CLEVRFeatureStore object opened for writing.
+
+        """
+        assert dtype in ['float32', 'float16'], "Unsupported dtype %r" % dtype
+        shape = (num_images,) + tuple(feature_shape)
+
+        if cls.is_raw(filename):
+            assert compression is None, "Raw .npy files cannot be compressed"
+            data = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+            return cls(filename, data)
+
+        compression_options = {}
+        if compression == 'blosc':
+            # Optional dependency - registers the blosc filter in h5py.
+            import hdf5plugin
+            compression_options = dict(hdf5plugin.Blosc())
+        elif compression is not None:
+            assert compression in ['lzf', 'gzip'], "Unsupported compression %r" % compression
+            compression_options = {'compression': compression}
+
+        f = h5py.File(filename, 'w', libver='latest')
+        # Chunks of single images - every image is read (and decompressed)
+        # separately from the others.
+        data = f.create_dataset('data', shape, dtype=dtype,
+                                chunks=(1,) + tuple(feature_shape), **compression_options)
+        return cls(filename, data)
+
+    @classmethod
+    def convert(cls, src_filename, dst_filename, dtype='float32', compression=None, chunk_size=256):
+        """
+        Copies the feature maps into a store with another layout.
+
+        :param src_filename: Name of the source file.
+        :param dst_filename: Name of the destination file.
+        :param dtype: Type of stored values: 'float32' or 'float16' (DEFAULT: 'float32').
+        :param compression: None, 'lzf', 'gzip' or 'blosc' (DEFAULT: None).
+        :param chunk_size: Number of images copied at once (DEFAULT: 256).
+
+        """
+        src = cls(src_filename)
+        dst = cls.create(dst_filename, len(src), src.shape[1:], dtype, compression)
+        for start in range(0, len(src), chunk_size):
+            dst.write(start, src.data[start:start + chunk_size])
+        dst.close()
+        src.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src', help='File with feature maps (.hdf5 or .npy)')
+    parser.add_argument('dst', help='Output file (.hdf5 or .npy)')
+    parser.add_argument('--dtype', type=str, default='float16', choices=['float32', 'float16'],
+                        help='Type of stored values (DEFAULT: float16)')
+    parser.add_argument('--compression', type=str, default=None, choices=['lzf', 'gzip', 'blosc'],
+                        help='Compression of .hdf5 files (DEFAULT: None)')
+    FLAGS, _ = parser.parse_known_args()
+
+    CLEVRFeatureStore.convert(FLAGS.src, FLAGS.dst, FLAGS.dtype, FLAGS.compression)
+    print('Converted {} to {}'.format(FLAGS.src, FLAGS.dst))
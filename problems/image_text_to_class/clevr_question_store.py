@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+clevr_question_store.py: This file contains 1 class:
+
+- CLEVRQuestionStore: columnar, memory-mappable storage of the tokenized CLEVR questions.
+
+It can also be run as a script, converting the (legacy) pickled lists of questions, e.g.:
+
+    python -m problems.image_text_to_class.clevr_question_store ~/CLEVR_v1.0/generated_files/train_CLEVR_questions.pkl
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import os
+import shutil
+import pickle
+import argparse
+import tempfile
+import numpy as np
+
+
+class CLEVRQuestionStore(object):
+    """
+    Columnar storage of the tokenized CLEVR questions.
+
+    Instead of a list of per-question dicts, every field is kept in a separate
+    array stored in a .npy file in a common directory:
+
+        - tokens: padded matrix of word indexes [NUM_QUESTIONS x MAX_LENGTH] (0 is padding)
+        - lengths: lengths of the questions [NUM_QUESTIONS]
+        - answers: indexes of the answers [NUM_QUESTIONS]
+        - image_ids: indexes of the images (i.e. of their feature maps) [NUM_QUESTIONS]
+        - family_ids: indexes of the question families (types) [NUM_QUESTIONS]
+        - family_names: names of the question families
+        - strings (question strings and image filenames): offsets [NUM_QUESTIONS + 1] into a single blob of utf-8 bytes.
+
+    The arrays are loaded as read-only memory maps: opening the store is
+    nearly instant and the pages are shared by all the processes (e.g.
+    DataLoader workers or concurrent runs) reading the same files.
+
+    The store is written into a temporary directory, renamed when complete,
+    so interrupted or concurrent conversions never leave a partial store.
+
+    """
+
+    # Names of the string columns.
+    STRING_COLUMNS = ['string_question', 'imgfile']
+
+    # Name of the (empty) file written last, marking a complete store.
+    COMPLETE_FILENAME = 'complete'
+
+    def __init__(self, directory, mmap=True):
+        """
+        Opens the store.
+
+        :param directory: Directory containing the store.
+        :param mmap: Load the arrays as read-only memory maps (DEFAULT: True).
+
+        """
+        self.directory = directory
+        mmap_mode = 'r' if mmap else None
+
+        def load(name):
+            return np.load(os.path.join(directory, name + '.npy'),
+                           mmap_mode=mmap_mode)
+
+        self.tokens = load('tokens')
+        self.lengths = load('lengths')
+        self.answers = load('answers')
+        self.image_ids = load('image_ids')
+        self.family_ids = load('family_ids')
+        # Names of families - small, always loaded into memory.
+        self.family_names = [str(name) for name in np.load(
+            os.path.join(directory, 'family_names.npy'))]
+
+        self.offsets = {}
+        self.blobs = {}
+        for column in self.STRING_COLUMNS:
+            self.offsets[column] = load(column + '_offsets')
+            self.blobs[column] = load(column + '_blob')
+
+    def __len__(self):
+        """
+        Returns the number of questions.
+        """
+        return len(self.lengths)
+
+    @staticmethod
+    def exists(directory):
+        """
+        Checks whether the (complete) store was already created in a given directory.
+
+        :param directory: Directory of the store.
+
+        """
+        return os.path.isfile(os.path.join(directory, CLEVRQuestionStore.COMPLETE_FILENAME))
+
+    def string(self, column, index):
+        """
+        Returns a string of a given question.
+
+        :param column: Name of the string column ('string_question' or 'imgfile').
+        :param index: Index of the question.
+
+        """
+        offsets = self.offsets[column]
+        return bytes(self.blobs[column][offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+    def strings(self, column):
+        """
+        Returns all strings of a given column.
+
+        :param column: Name of the string column ('string_question' or 'imgfile').
+        :return: List of strings.
+
+        """
+        return [self.string(column, index) for index in range(len(self))]
+
+    def question(self, index):
+        """
+        Returns the tokenized question (without padding).
+
+        :param index: Index of the question.
+        :return: Array of word indexes (int64).
+
+        """
+        return self.tokens[index, :self.lengths[index]].astype(np.int64)
+
+    def __getitem__(self, index):
+        """
+        Returns all fields of a given question - in the order of the (legacy)
+        dicts: tokenized_question, answer, string_question, imgfile,
+        question_type, followed by the image index.
+
+        :param index: Index of the question.
+
+        """
+        return (self.question(index),
+                int(self.answers[index]),
+                self.string('string_question', index),
+                self.string('imgfile', index),
+                self.family_names[self.family_ids[index]],
+                int(self.image_ids[index]))
+
+    @staticmethod
+    def image_id(imgfile):
+        """
+        Parses index of the image from its filename (e.g. CLEVR_train_000123.png).
+
+        :param imgfile: Image filename.
+
+        """
+        return int(imgfile.rsplit('_', 1)[1][:-4])
+
+    @classmethod
+    def create(cls, questions, directory):
+        """
+        Creates the store from a list of question dicts (with keys:
+        tokenized_question, answer, string_question, imgfile, question_type).
+
+        :param questions: List of question dicts.
+        :param directory: Directory in which the store will be created (an existing complete store is kept).
+        :return: CLEVRQuestionStore object.
+
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        if not os.path.isdir(parent):
+            os.makedirs(parent, exist_ok=True)
+
+        num_questions = len(questions)
+        lengths = np.array([len(q['tokenized_question']) for q in questions],
+                           dtype=np.int32)
+        max_length = int(lengths.max()) if num_questions > 0 else 0
+
+        # Pad the tokenized questions with zeros.
+        tokens = np.zeros((num_questions, max_length), dtype=np.int32)
+        for i, q in enumerate(questions):
+            tokens[i, :lengths[i]] = q['tokenized_question']
+
+        # Question families are stored as indexes into the list of names.
+        family_names = sorted(set(q['question_type'] for q in questions))
+        family_index = {name: i for i, name in enumerate(family_names)}
+
+        columns = {
+            'tokens': tokens,
+            'lengths': lengths,
+            'answers': np.array([q['answer'] for q in questions], dtype=np.int64),
+            'image_ids': np.array([cls.image_id(q['imgfile']) for q in questions],
+                                  dtype=np.int32),
+            'family_ids': np.array([family_index[q['question_type']] for q in questions],
+                                   dtype=np.int16),
+            'family_names': np.array(family_names, dtype=np.str_)}
+
+        # Strings: offsets into a single blob of bytes.
+        for column in cls.STRING_COLUMNS:
+            encoded = [q[column].encode('utf-8') for q in questions]
+            offsets = np.zeros(num_questions + 1, dtype=np.int64)
+            np.cumsum([len(e) for e in encoded], out=offsets[1:])
+            columns[column + '_offsets'] = offsets
+            columns[column + '_blob'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+        # Write into a temporary directory (next to the store), renamed at once when complete.
+        tmp_directory = tempfile.mkdtemp(
+            prefix=os.path.basename(os.path.abspath(directory)) + '.', suffix='.tmp', dir=parent)
+        try:
+            os.chmod(tmp_directory, 0o755)
+            for name, array in columns.items():
+                np.save(os.path.join(tmp_directory, name + '.npy'), array)
+            open(os.path.join(tmp_directory, cls.COMPLETE_FILENAME), 'w').close()
+
+            if os.path.isdir(directory) and not cls.exists(directory):
+                # Remove a partial store (e.g. of an interrupted conversion).
+                shutil.rmtree(directory, ignore_errors=True)
+            try:
+                os.replace(tmp_directory, directory)
+            except OSError:
+                # Another process has just created the store.
+                if not cls.exists(directory):
+                    raise
+        finally:
+            if os.path.isdir(tmp_directory):
+                shutil.rmtree(tmp_directory)
+
+        return cls(directory)
+
+    @classmethod
+    def from_pickle(cls, pickle_filename, directory=None):
+        """
+        Converts the (legacy) pickled list of question dicts into the store.
+
+        :param pickle_filename: Name of the .pkl file.
+        :param directory: Directory of the store (DEFAULT: pickle_filename without the extension).
+        :return: CLEVRQuestionStore object.
+
+        """
+        if directory is None:
+            directory = os.path.splitext(pickle_filename)[0]
+        with open(pickle_filename, 'rb') as f:
+            questions = pickle.load(f)
+        return cls.create(questions, directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pickles', nargs='+',
+                        help='Pickled lists of questions (e.g. train_CLEVR_questions.pkl) to be converted')
+    FLAGS, _ = parser.parse_known_args()
+
+    for pickle_filename in FLAGS.pickles:
+        store = CLEVRQuestionStore.from_pickle(pickle_filename)
+        print('Converted {} questions from {} to {}'.format(
+            len(store), pickle_filename, store.directory))
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+extract_feature_maps.py: resumable, shardable extraction of the feature maps of CLEVR images.
+
+The images are split into chunks. Every chunk is decoded and resized by a pool of DataLoader workers, passed through
+the pretrained CNN (on GPU or on CPU) and written to the output file (see CLEVRFeatureStore), after which it is
+recorded in the progress ledger (<output>.ledger). An interrupted extraction resumes from the chunks missing in the
+ledger. Several processes (shards) can write to the same output, each processing every num_shards-th chunk, e.g.:
+
+    python -m problems.image_text_to_class.extract_feature_maps --CLEVR_dir ~/data/CLEVR_v1.0 --set train \\
+        --output train_CLEVR_features.hdf5 --shard 0 --num_shards 4 --num_threads 8
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import os
+import fcntl
+import logging
+import argparse
+import contextlib
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from problems.image_text_to_class.generate_feature_maps import GenerateFeatureMaps
+from problems.image_text_to_class.clevr_feature_store import CLEVRFeatureStore
+
+logger = logging.getLogger('CLEVR')
+
+
+@contextlib.contextmanager
+def locked(filename):
+    """
+    Context manager holding an exclusive lock of the output (<filename>.lock)
+    shared by all the shards.
+
+    :param filename: Name of the output file.
+
+    """
+    with open(filename + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_ledger(filename):
+    """
+    Reads the progress ledger: set of (start, stop) ranges of images already written to the output.
+
+    :param filename: Name of the output file.
+
+    """
+    done = set()
+    if os.path.isfile(filename + '.ledger'):
+        with open(filename + '.ledger') as ledger:
+            for line in ledger:
+                fields = line.split()
+                # Skip (possibly) truncated lines.
+                if len(fields) == 2:
+                    done.add((int(fields[0]), int(fields[1])))
+    return done
+
+
+def append_ledger(filename, start, stop):
+    """
+    Records a chunk as written to the output.
+
+    :param filename: Name of the output file.
+    :param start: Index of the first image of the chunk.
+    :param stop: Index following the last image of the chunk.
+
+    """
+    with open(filename + '.ledger', 'a') as ledger:
+        ledger.write('{} {}\n'.format(start, stop))
+        ledger.flush()
+        os.fsync(ledger.fileno())
+
+
+def chunk_ranges(start, stop, chunk_size):
+    """
+    Splits the range of images into chunks.
+
+    :return: List of (start, stop) pairs.
+
+    """
+    return [(s, min(s + chunk_size, stop)) for s in range(start, stop, chunk_size)]
+
+
+def extract_feature_maps(clevr_dir, set, output, batch_size=50, chunk_size=1000,
+                         num_workers=4, num_threads=0, device=None,
+                         dtype='float32', compression=None,
+                         start=0, stop=None, shard=0, num_shards=1):
+    """
+    Extracts the feature maps of (a range of) CLEVR images.
+
+    :param clevr_dir: Directory path to the CLEVR dataset.
+    :param set: String to specify which dataset to use: 'train', 'val' or 'test'.
+    :param output: Name of the output file (.hdf5 or .npy, see CLEVRFeatureStore).
+    :param batch_size: Number of images passed through the CNN at once (DEFAULT: 50).
+    :param chunk_size: Number of images written (and recorded in the ledger) at once (DEFAULT: 1000).
+    :param num_workers: Number of processes decoding and resizing the images (DEFAULT: 4).
+    :param num_threads: Number of threads used by the CNN on CPU (DEFAULT: 0, i.e. torch default).
+    :param device: torch.device on which the CNN is run (DEFAULT: None, i.e. CUDA if available).
+    :param dtype: Type of stored values: 'float32' or 'float16' (DEFAULT: 'float32').
+    :param compression: Compression of .hdf5 output: None, 'lzf', 'gzip' or 'blosc' (DEFAULT: None).
+    :param start: Index of the first image to process (DEFAULT: 0).
+    :param stop: Index following the last image to process (DEFAULT: None, i.e. all images).
+    :param shard: Index of this shard (DEFAULT: 0).
+    :param num_shards: Number of shards writing to the output (DEFAULT: 1).
+
+    """
+    assert 0 <= shard < num_shards, "Shard {} out of range [0, {})".format(shard, num_shards)
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    images = GenerateFeatureMaps(clevr_dir=clevr_dir, set=set,
+                                 cnn_model='resnet101', num_blocks=4, device=device)
+    num_images = len(images)
+    stop = num_images if stop is None else min(stop, num_images)
+
+    # Chunks of this shard that are not in the ledger yet.
+    with locked(output):
+        done = read_ledger(output)
+    chunks = [chunk for chunk in chunk_ranges(start, stop, chunk_size)[shard::num_shards]
+              if chunk not in done]
+    logger.info('Shard {}/{}: {} chunks of images to process'.format(
+        shard, num_shards, len(chunks)))
+    if not chunks:
+        return
+
+    # Batches never cross the boundaries of chunks.
+    batches = [list(range(s, min(s + batch_size, chunk_stop)))
+               for chunk_start, chunk_stop in chunks
+               for s in range(chunk_start, chunk_stop, batch_size)]
+    loader = DataLoader(images, batch_sampler=batches, num_workers=num_workers)
+
+    chunk_index = 0
+    chunk_features = []
+    with torch.no_grad():
+        for batch in loader:
+            features = images.model(batch.to(images.device)).cpu().numpy()
+            chunk_features.append(features)
+
+            chunk_start, chunk_stop = chunks[chunk_index]
+            if sum(f.shape[0] for f in chunk_features) < chunk_stop - chunk_start:
+                continue
+
+            # The whole chunk is ready - write it (the first writer creates the output).
+            with locked(output):
+                if os.path.isfile(output):
+                    store = CLEVRFeatureStore(output, writable=True)
+                else:
+                    store = CLEVRFeatureStore.create(
+                        output, num_images, features.shape[1:], dtype, compression)
+                store.write(chunk_start, np.concatenate(chunk_features))
+                store.close()
+                append_ledger(output, chunk_start, chunk_stop)
+
+            logger.info('Shard {}/{}: written images [{}, {})'.format(
+                shard, num_shards, chunk_start, chunk_stop))
+            chunk_index += 1
+            chunk_features = []
+
+
+def is_complete(output, num_images):
+    """
+    Checks whether the ledger covers all the images, i.e. whether the extraction was completed.
+
+    :param output: Name of the output file.
+    :param num_images: Number of images.
+
+    """
+    with locked(output):
+        done = sorted(read_ledger(output))
+    covered = 0
+    for start, stop in done:
+        if start > covered:
+            return False
+        covered = max(covered, stop)
+    return covered >= num_images
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--CLEVR_dir', type=str, required=True,
+                        help='Directory of the CLEVR dataset')
+    parser.add_argument('--set', type=str, default='train',
+                        help='Set of images (DEFAULT: train)')
+    parser.add_argument('--output', type=str, required=True,
+                        help='Output file (.hdf5 or .npy)')
+    parser.add_argument('--batch_size', type=int, default=50,
+                        help='Number of images passed through the CNN at once (DEFAULT: 50)')
+    parser.add_argument('--chunk_size', type=int, default=1000,
+                        help='Number of images written at once (DEFAULT: 1000)')
+    parser.add_argument('--num_workers', type=int, default=4,
+                        help='Number of processes decoding the images (DEFAULT: 4)')
+    parser.add_argument('--num_threads', type=int, default=0,
+                        help='Number of threads of the CNN on CPU (DEFAULT: 0, i.e. torch default)')
+    parser.add_argument('--cpu', action='store_true',
+                        help='Run the CNN on CPU even if CUDA is available')
+    parser.add_argument('--dtype', type=str, default='float32', choices=['float32', 'float16'],
+                        help='Type of stored values (DEFAULT: float32)')
+    parser.add_argument('--compression', type=str, default=None, choices=['lzf', 'gzip', 'blosc'],
+                        help='Compression of .hdf5 output (DEFAULT: None)')
+    parser.add_argument('--start', type=int, default=0,
+                        help='Index of the first image (DEFAULT: 0)')
+    parser.add_argument('--stop', type=int, default=None,
+                        help='Index following the last image (DEFAULT: all images)')
+    parser.add_argument('--shard', type=int, default=0,
+                        help='Index of this shard (DEFAULT: 0)')
+    parser.add_argument('--num_shards', type=int, default=1,
+                        help='Number of shards writing to the output (DEFAULT: 1)')
+    FLAGS, _ = parser.parse_known_args()
+
+    logging.basicConfig(level=logging.INFO)
+    extract_feature_maps(FLAGS.CLEVR_dir, FLAGS.set, FLAGS.output, FLAGS.batch_size, FLAGS.chunk_size,
+                         FLAGS.num_workers, FLAGS.num_threads,
+                         torch.device('cpu') if FLAGS.cpu else None,
+                         FLAGS.dtype, FLAGS.compression,
+                         FLAGS.start, FLAGS.stop, FLAGS.shard, FLAGS.num_shards)
@@ -43,7 +43,7 @@
 generate-feature_maps.py: This file contains 1 class:
 
 - GenerateFeatureMaps: This class instantiates a specified pretrained CNN model to extract feature maps from images stored in the indicated directory. It also creates a DataLoader to generate batches of these images.
-  This class is used in problems.image_text_to_class.new_clevr_dataset.generate_feature_maps_file.
+  This class is used by problems.image_text_to_class.extract_feature_maps (e.g. through CLEVRDataset.generate_feature_maps_file).
 
 """
 __author__ = "Vincent Marois"
@@ -69,21 +69,23 @@ class GenerateFeatureMaps(Dataset):
     images of the CLEVR dataset.
     """
 
-    def __init__(self, clevr_dir, set, cnn_model='resnet101', num_blocks=4):
+    def __init__(self, clevr_dir, set, cnn_model='resnet101', num_blocks=4, device=None):
         """
-        Creates the pretrained CNN model & move it to CUDA.
-        WARNING: WE ONLY AUTHORIZE USING THIS CLASS ON GPU, TO SPEED UP THE FORWARD PASSES OF THE PRETRAINED CNN.
+        Creates the pretrained CNN model & move it to the device (CUDA if available).
 
         :param clevr_dir: Directory path to the CLEVR dataset.
         :param set: String to specify which dataset to use: 'train', 'val' or 'test'.
         :param cnn_model: pretrained CNN model to use
         :param num_blocks: number of layers to use from the cnn_model.
+        :param device: torch.device on which the CNN is run (DEFAULT: None, i.e. CUDA if available, CPU otherwise).
         """
-        # we only authorize the images processing on GPU.
-        if not torch.cuda.is_available():
-            logger.error(
-                'WARNING: CUDA IS NOT AVAILABLE. NOT AUTHORIZING DO FEATURE MAPS EXTRACTION. EXITING.')
-            exit(1)
+        if device is None:
+            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if device.type == 'cpu':
+            logger.warning(
+                'Extracting the feature maps on CPU - consider running several shards '
+                'of extract_feature_maps in parallel.')
+        self.device = device
 
         # call base constructor
         super(GenerateFeatureMaps, self).__init__()
@@ -113,8 +115,8 @@ class GenerateFeatureMaps(Dataset):
         # build pretrained cnn cut at specified layer
         self.model = torch.nn.Sequential(*layers)
 
-        # move it to CUDA & specify evaluation behavior
-        self.model.cuda()
+        # move it to the device & specify evaluation behavior
+        self.model.to(self.device)
         self.model.eval()
 
         self.length = len(os.listdir(os.path.join(
@@ -71,39 +71,34 @@ class ShapeColorQuery(SortOfCLEVR):
         # Return the question as a string.
         return query.format(color, shape)
 
-    def generate_question_matrix(self, objects):
+    def generate_questions(self, colors, shapes):
         """
         Generates questions tensor: [# of objects * # of Q, 3, encoding]
         where second dimension ("temporal") encodes consecutivelly: shape, color, query
 
-        :param objects: List of objects - abstract scene representation.
-        :return: a 3D tensor [# of questions for the whole scene, 3, num_bits]
+        :param colors: Colors of objects [NUM_OBJECTS].
+        :param shapes: Shapes of objects [NUM_OBJECTS].
+        :return: a 3D tensor [# of questions about the objects, 3, num_bits]
         """
-        # Number of scene questions.
-        num_questions = len(objects) * self.NUM_QUESTIONS
+        num_objects = len(colors)
         # Number of bits in Object and Query vectors.
         num_bits = max(self.NUM_COLORS, self.NUM_SHAPES, self.NUM_QUESTIONS)
 
         # Create query tensor.
-        Q = np.zeros((num_questions, 3, num_bits), dtype=np.bool)
-
-        # Helper matrix - queries for all question types.
-        query_matrix = np.diag(np.ones(num_bits))
-
-        # For every object in the scene.
-        for i, obj in enumerate(objects):
-            # Shape - with special case: query 0 asks about shape, do not
-            # provide answer as part of the query! (+1)
-            Q[i * self.NUM_QUESTIONS +
-                1:(i + 1) * self.NUM_QUESTIONS, 0, obj.shape] = True
-            # Color
-            Q[i * self.NUM_QUESTIONS:(i + 1) * self.NUM_QUESTIONS,
-              1, obj.color] = True
-            # Query.
-            Q[i * self.NUM_QUESTIONS:(i + 1) * self.NUM_QUESTIONS, 2,
-              :num_bits] = query_matrix[:self.NUM_QUESTIONS, :num_bits]
-
-        return Q
+        Q = np.zeros((num_objects, self.NUM_QUESTIONS, 3, num_bits), dtype=np.bool)
+
+        # Helper matrix - one-hot vectors.
+        one_hot = np.eye(num_bits, dtype=bool)
+
+        # Shape - with special case: query 0 asks about shape, do not
+        # provide answer as part of the query! (+1)
+        Q[:, 1:, 0, :] = one_hot[shapes][:, None, :]
+        # Color
+        Q[:, :, 1, :] = one_hot[colors][:, None, :]
+        # Query.
+        Q[:, :, 2, :] = one_hot[:self.NUM_QUESTIONS]
+
+        return Q.reshape(num_objects * self.NUM_QUESTIONS, 3, num_bits)
 
 
 if __name__ == "__main__":
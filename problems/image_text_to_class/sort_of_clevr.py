@@ -26,14 +26,50 @@ import progressbar
 import logging
 logger = logging.getLogger('Sort-of-CLEVR')
 
-import random
 import os
+import functools
+import multiprocessing
 
 import torch
 from problems.problem import DataTuple
+from problems.utils.shared_arrays import dataset_key, shared_array
+from problems.utils.in_memory import EpochSampler
 from problems.image_text_to_class.image_text_to_class_problem import ImageTextToClassProblem, ImageTextTuple, SceneDescriptionTuple, ObjectRepresentation
 
 
+def draw_scene(objects, img_size, grid_size, bg_color, colors):
+    """
+    Draws image on the basis of a given scene representation. Module-level
+    function, so it can be called by the processes of a pool.
+
+    :param objects: List of objects - abstract scene representation.
+    :param img_size: Size of the (square) image.
+    :param grid_size: Size of the grid of object positions.
+    :param bg_color: Color of the background.
+    :param colors: List of (RGB) colors of the objects.
+    :return: Image [img_size, img_size, 3] (uint8).
+
+    """
+    shape_size = int((img_size * 0.9 / grid_size) * 0.7 / 2)
+
+    # Generate image [img_size, img_size, 3]
+    img = Image.new('RGB', (img_size, img_size), color=bg_color)
+    drawer = ImageDraw.Draw(img)
+
+    for obj in objects:
+        # Calculate object position.
+        position = (obj.x - shape_size, obj.y - shape_size,
+                    obj.x + shape_size, obj.y + shape_size)
+        # Draw object.
+        if obj.shape == 1:
+            drawer.ellipse(position, fill=colors[obj.color])
+        else:
+            drawer.rectangle(position, fill=colors[obj.color])
+
+    # Cast to np.
+    return np.array(img)
+
+
 class SortOfCLEVR(ImageTextToClassProblem):
     """
     Sort-of-CLEVR is a simple VQA problem, where the goal is to answer the
@@ -49,6 +85,14 @@ class SortOfCLEVR(ImageTextToClassProblem):
     Additionally it generates:
     - Aux tuple containing the scene graph.
 
+    The HDF5 file stores every scene only once:
+
+    - images: images of scenes [NUM_SCENES x IMG_SIZE x IMG_SIZE x 3],
+    - scene_descriptions: descriptions of scenes [NUM_SCENES],
+    - questions: encoded questions [NUM_QUESTIONS x ...],
+    - answers: encoded answers [NUM_QUESTIONS x NUM_ANSWERS],
+    - scene_ids: indices of the scenes the questions refer to [NUM_QUESTIONS].
+
 
     """
 
@@ -73,6 +117,16 @@ class SortOfCLEVR(ImageTextToClassProblem):
 
         # Shuffle indices.
         self.shuffle = params.get('shuffle', True)
+        # Read the whole dataset into memory at startup.
+        self.preload = params.get('preload', False)
+        # Share the preloaded images with other processes on the node (kept in
+        # shared memory, replaced when the file is regenerated - see shared_arrays.py).
+        self.shared_memory = params.get('shared_memory', False)
+
+        # Number of scenes generated (and written to file) at once.
+        self.generation_block_size = params.get('generation_block_size', 1000)
+        # Number of processes rendering the images (0: the main process).
+        self.generation_workers = params.get('generation_workers', 0)
 
         # Set general color properties.
         self.BG_COLOR = (180, 180, 150)
@@ -126,6 +180,9 @@ class SortOfCLEVR(ImageTextToClassProblem):
             if self.regenerate:
                 raise Exception("Must regenerate... must regenerate...")
             self.data = h5py.File(self.pathfilename, 'r')
+            if 'scene_ids' not in self.data:
+                self.data.close()
+                raise Exception("File in old format (a group per question)")
         except BaseException:
             logger.warning(
                 'File {} in {} not found. Generating new file... '.format(
@@ -141,13 +198,42 @@ class SortOfCLEVR(ImageTextToClassProblem):
             # Load the file.
             self.data = h5py.File(self.pathfilename, 'r')
 
-        logger.info("Loaded {} samples from file {}".format(
-            len(self.data), self.pathfilename))
+        # Questions, answers and scene indices are small - load them into memory.
+        self.questions = self.data['questions'][()].astype(np.float32)
+        self.targets = np.argmax(self.data['answers'][()], axis=1)
+        self.scene_ids = self.data['scene_ids'][()]
+        self.scene_descriptions = [
+            desc.decode('utf-8') if isinstance(desc, bytes) else desc
+            for desc in self.data['scene_descriptions'][()]]
+
+        if self.preload and self.shared_memory:
+            # All images in a contiguous (uint8) array shared by the processes reading the same file.
+            self.images = shared_array(dataset_key(self.pathfilename), 'images',
+                                       lambda: self.data['images'][()])
+            self.data.close()
+        elif self.preload:
+            # Read all images into a contiguous (uint8) array.
+            self.images = self.data['images'][()]
+            self.data.close()
+        else:
+            # Images are read batch by batch.
+            self.images = self.data['images']
+
+        logger.info("Loaded {} samples ({} scenes) from file {}".format(
+            len(self.questions), len(self.images), self.pathfilename))
+
+        self.dataset_size = len(self.questions)
+        # Epoch-based sampling: (optionally) permuted indices walked batch by batch.
+        self.epoch_sampler = EpochSampler(self.dataset_size, self.shuffle)
 
-        # Generate list of indices (strings).
-        self.dataset_size = len(self.data)
-        self.ids = ['{}'.format(i) for i in range(self.dataset_size)]
+    def next_batch_ids(self):
+        """
+        Returns indices of samples forming the next batch (see EpochSampler).
+
+        :return: Array of indices.
 
+        """
+        return self.epoch_sampler.next_batch(self.batch_size)
 
     def generate_batch(self):
         """
@@ -156,37 +242,33 @@ class SortOfCLEVR(ImageTextToClassProblem):
         :return: DataTuple and AuxTuple object.
 
         """
-        # Shuffle indices.
-        if self.shuffle:
-            random.shuffle(self.ids)
-        # Get batch of indices.
-        batch_ids = self.ids[:self.batch_size]
+        return self.generate_batch_from_indices(self.next_batch_ids())
 
-        # Get batch.
-        images = []
-        questions = []
-        answers = []
-        scenes = []
+    def epoch_size(self):
+        """
+        Returns the number of samples.
+        """
+        return self.dataset_size
 
-        for id in batch_ids:
-            group = self.data[id]
+    def generate_batch_from_indices(self, batch_ids):
+        """
+        Generates batch of given samples.
 
-            # Process data
-            images.append((group['image'].value / 255).transpose(2, 1, 0))
-            questions.append(group['question'].value.astype(np.float32))
-            answers.append(group['answer'].value.astype(np.float32))
-            scenes.append(group['scene_description'].value)
+        :param batch_ids: Array of indices of samples.
+        :return: DataTuple and AuxTuple object.
+
+        """
+        # Get batch.
+        batch_scene_ids = self.scene_ids[batch_ids]
+        images = self.read_images(batch_scene_ids)
+        scenes = [self.scene_descriptions[id] for id in batch_scene_ids]
 
         # Generate tuple with inputs
         inputs = ImageTextTuple(
             torch.from_numpy(
-                np.stack(
-                    images, axis=0)).type(
-                torch.FloatTensor), torch.from_numpy(
-                    np.stack(
-                        questions, axis=0)))
-        targets = np.stack(answers, 0)
-        index_targets = torch.from_numpy(np.argmax(targets, axis=1))
+                (images.astype(np.float32) / np.float32(255)).transpose(0, 3, 2, 1)),
+            torch.from_numpy(self.questions[batch_ids]))
+        index_targets = torch.from_numpy(self.targets[batch_ids])
 
         # Add scene decription to aux tuple.
         aux_tuple = SceneDescriptionTuple(scenes)
@@ -194,6 +276,30 @@ class SortOfCLEVR(ImageTextToClassProblem):
         # Return DataTuple(!) and an AuxTuple with scene description.
         return DataTuple(inputs, index_targets), aux_tuple
 
+    def read_images(self, scene_ids):
+        """
+        Reads images of (possibly repeated) scenes in a single pass over the file.
+
+        :param scene_ids: Array of indices of scenes.
+        :return: Array of images [len(scene_ids) x IMG_SIZE x IMG_SIZE x 3] (uint8).
+
+        """
+        if isinstance(self.images, np.ndarray):
+            # Preloaded images.
+            return self.images[scene_ids]
+
+        # Read every scene once, then restore the order of the batch.
+        unique_ids, inverse = np.unique(scene_ids, return_inverse=True)
+        images = np.empty((len(unique_ids),) + self.images.shape[1:], dtype=self.images.dtype)
+        # Fancy indexing of chunked datasets in h5py is very slow, so runs of
+        # consecutive scenes are read as slices.
+        run_starts = np.flatnonzero(np.diff(unique_ids) != 1) + 1
+        start = 0
+        for run in np.split(unique_ids, run_starts):
+            images[start:start + len(run)] = self.images[run[0]:run[-1] + 1]
+            start += len(run)
+        return images[inverse]
+
     def color2str(self, color_code):
         """
         Decodes color and returns it as a string.
@@ -343,25 +449,31 @@ class SortOfCLEVR(ImageTextToClassProblem):
         :param objects: List of objects - abstract scene representation.
 
         """
-        img_size = self.img_size
-        shape_size = int((img_size * 0.9 / self.GRID_SIZE) * 0.7 / 2)
+        return draw_scene(objects, self.img_size, self.GRID_SIZE,
+                          self.BG_COLOR, self.COLOR)
+
+    def scenes2arrays(self, scenes):
+        """
+        Converts a block of scenes into (padded) arrays of object features.
 
-        # Generate image [img_size, img_size, 3]
-        img = Image.new('RGB', (img_size, img_size), color=self.BG_COLOR)
-        drawer = ImageDraw.Draw(img)
+        :param scenes: List of scenes (lists of objects).
+        :return: x, y, colors, shapes [NUM_SCENES x MAX_NUM_OBJECTS] and mask of present objects.
 
-        for obj in objects:
-            # Calculate object position.
-            position = (obj.x - shape_size, obj.y - shape_size,
-                        obj.x + shape_size, obj.y + shape_size)
-            # Draw object.
-            if obj.shape == 1:
-                drawer.ellipse(position, fill=self.COLOR[obj.color])
-            else:
-                drawer.rectangle(position, fill=self.COLOR[obj.color])
+        """
+        num_scenes = len(scenes)
+        x = np.zeros((num_scenes, self.MAX_NUM_OBJECTS))
+        y = np.zeros((num_scenes, self.MAX_NUM_OBJECTS))
+        colors = np.zeros((num_scenes, self.MAX_NUM_OBJECTS), dtype=np.int64)
+        shapes = np.zeros((num_scenes, self.MAX_NUM_OBJECTS), dtype=np.int64)
+        mask = np.zeros((num_scenes, self.MAX_NUM_OBJECTS), dtype=bool)
 
-        # Cast to np.
-        return np.array(img)
+        for i, objects in enumerate(scenes):
+            for j, obj in enumerate(objects):
+                x[i, j], y[i, j] = obj.x, obj.y
+                colors[i, j], shapes[i, j] = obj.color, obj.shape
+                mask[i, j] = True
+
+        return x, y, colors, shapes, mask
 
     def generate_question_matrix(self, objects):
         """
@@ -369,18 +481,26 @@ class SortOfCLEVR(ImageTextToClassProblem):
 
         :param objects: List of objects - abstract scene representation.
         """
-        Q = np.zeros((len(objects) * self.NUM_QUESTIONS,
-                      self.NUM_COLORS + self.NUM_QUESTIONS), dtype=np.bool)
+        _, _, colors, shapes, mask = self.scenes2arrays([objects])
+        return self.generate_questions(colors[mask], shapes[mask])
 
-        for i, obj in enumerate(objects):
-            v = np.zeros(self.NUM_COLORS)
-            v[obj.color] = True
-            Q[i * self.NUM_QUESTIONS:(i + 1) * self.NUM_QUESTIONS,
-              :self.NUM_COLORS] = np.tile(v, (self.NUM_QUESTIONS, 1))
-            Q[i * self.NUM_QUESTIONS:(i + 1) * self.NUM_QUESTIONS,
-              self.NUM_COLORS:] = np.diag(np.ones(self.NUM_QUESTIONS))
+    def generate_questions(self, colors, shapes):
+        """
+        Generates questions about a list of objects (of possibly many scenes):
+        [# of objects * # of Q, # of color + # of Q]
 
-        return Q
+        :param colors: Colors of objects [NUM_OBJECTS].
+        :param shapes: Shapes of objects [NUM_OBJECTS].
+        """
+        num_objects = len(colors)
+        Q = np.zeros((num_objects, self.NUM_QUESTIONS,
+                      self.NUM_COLORS + self.NUM_QUESTIONS), dtype=np.bool)
+        # Color of the object - the same for all its questions.
+        Q[:, :, :self.NUM_COLORS] = np.eye(self.NUM_COLORS, dtype=bool)[colors][:, None, :]
+        # Question type.
+        Q[:, :, self.NUM_COLORS:] = np.eye(self.NUM_QUESTIONS, dtype=bool)
+
+        return Q.reshape(num_objects * self.NUM_QUESTIONS, -1)
 
     def generate_answer_matrix(self, objects):
         """
@@ -389,49 +509,53 @@ class SortOfCLEVR(ImageTextToClassProblem):
 
         :param objects: List of objects - abstract scene representation.
         """
-        A = np.zeros((len(objects) * self.NUM_QUESTIONS,
-                      self.NUM_COLORS + 4), dtype=np.bool)
-        for i, obj in enumerate(objects):
-            # Q1: circle or rectangle?
-            if obj.shape:
-                A[i * self.NUM_QUESTIONS, self.NUM_COLORS + 1] = True
-            else:
-                A[i * self.NUM_QUESTIONS, self.NUM_COLORS] = True
+        return self.generate_answers(*self.scenes2arrays([objects]))
 
-            # Q2: bottom?
-            if obj.y > int(self.img_size / 2):
-                A[i * self.NUM_QUESTIONS + 1, self.NUM_COLORS + 2] = True
-            else:
-                A[i * self.NUM_QUESTIONS + 1, self.NUM_COLORS + 3] = True
+    def generate_answers(self, x, y, colors, shapes, mask):
+        """
+        Generates answers to questions about all objects of a block of scenes
+        at once: [# of objects * # of Q, # of color + 4]
 
-            # Q3: left?
-            if obj.x < int(self.img_size / 2):
-                A[i * self.NUM_QUESTIONS + 2, self.NUM_COLORS + 2] = True
-            else:
-                A[i * self.NUM_QUESTIONS + 2, self.NUM_COLORS + 3] = True
+        :param x: x coordinates of objects [NUM_SCENES x MAX_NUM_OBJECTS].
+        :param y: y coordinates of objects [NUM_SCENES x MAX_NUM_OBJECTS].
+        :param colors: Colors of objects [NUM_SCENES x MAX_NUM_OBJECTS].
+        :param shapes: Shapes of objects [NUM_SCENES x MAX_NUM_OBJECTS].
+        :param mask: Mask of objects present in scenes [NUM_SCENES x MAX_NUM_OBJECTS].
+        """
+        yes, no = self.NUM_COLORS + 2, self.NUM_COLORS + 3
 
-            # Calculate distances.
-            distances = np.array(
-                [((obj.x - other_obj.x) ** 2 + (obj.y - other_obj.y) ** 2)
-                 for other_obj in objects])
-            idx = distances.argsort()
-            # Ids of closest and most distant objects.
-            min_idx = idx[1]
-            max_idx = idx[-1]
+        # Squared distances between all pairs of objects [NUM_SCENES x MAX x MAX].
+        distances = (x[:, :, None] - x[:, None, :]) ** 2 + \
+            (y[:, :, None] - y[:, None, :]) ** 2
+        # Nearest object: ignore the object itself and the missing ones.
+        near = np.where(mask[:, None, :], distances, np.inf)
+        diagonal = np.arange(self.MAX_NUM_OBJECTS)
+        near[:, diagonal, diagonal] = np.inf
+        min_idx = np.argmin(near, axis=2)
+        # Farthest object: the last one in case of ties.
+        far = np.where(mask[:, None, :], distances, -np.inf)[:, :, ::-1]
+        max_idx = self.MAX_NUM_OBJECTS - 1 - np.argmax(far, axis=2)
 
+        # Index of the answer to every question [NUM_SCENES x MAX x NUM_QUESTIONS].
+        answers = np.stack([
+            # Q1: circle or rectangle?
+            self.NUM_COLORS + shapes,
+            # Q2: bottom?
+            np.where(y > int(self.img_size / 2), yes, no),
+            # Q3: left?
+            np.where(x < int(self.img_size / 2), yes, no),
             # Q4: the shape of the nearest object
-            A[i * self.NUM_QUESTIONS + 3,
-              self.NUM_COLORS + objects[min_idx].shape] = True
+            self.NUM_COLORS + np.take_along_axis(shapes, min_idx, axis=1),
             # Q5: the shape of the farthest object
-            A[i * self.NUM_QUESTIONS + 4,
-              self.NUM_COLORS + objects[max_idx].shape] = True
-
+            self.NUM_COLORS + np.take_along_axis(shapes, max_idx, axis=1),
             # Q6: the color of the nearest object
-            A[i * self.NUM_QUESTIONS + 5, objects[min_idx].color] = True
+            np.take_along_axis(colors, min_idx, axis=1),
             # Q7: the color of the farthest object
-            A[i * self.NUM_QUESTIONS + 6, objects[max_idx].color] = True
+            np.take_along_axis(colors, max_idx, axis=1)], axis=2)
 
-        return A
+        # One-hot encode answers about the present objects.
+        A = np.eye(self.NUM_COLORS + 4, dtype=np.bool)[answers[mask]]
+        return A.reshape(-1, self.NUM_COLORS + 4)
 
     def generate_h5py_dataset(self):
         """
@@ -439,8 +563,24 @@ class SortOfCLEVR(ImageTextToClassProblem):
         a HDF5 file.
         """
 
-        # Output file.
+        # Output file - arrays are extended block by block.
         f = h5py.File(self.pathfilename, 'w')
+        datasets = {}
+
+        def append(name, data, chunk_size=4096, **kwargs):
+            if name not in datasets:
+                datasets[name] = f.create_dataset(
+                    name, data=data, maxshape=(None,) + data.shape[1:],
+                    chunks=(chunk_size,) + data.shape[1:], **kwargs)
+            else:
+                dataset = datasets[name]
+                dataset.resize(len(dataset) + len(data), axis=0)
+                dataset[-len(data):] = data
+
+        # Pool of processes rendering the images.
+        pool = multiprocessing.Pool(self.generation_workers) if self.generation_workers > 0 else None
+        draw = functools.partial(draw_scene, img_size=self.img_size, grid_size=self.GRID_SIZE,
+                                 bg_color=self.BG_COLOR, colors=self.COLOR)
 
         # progress bar
         bar = progressbar.ProgressBar(
@@ -449,43 +589,54 @@ class SortOfCLEVR(ImageTextToClassProblem):
                     '=', '[', ']'), ' ', progressbar.Percentage()])
         bar.start()
 
+        num_scenes = 0
         count = 0
 
         while(count < self.dataset_size):
-            # Generate the scene.
-            objects = self.generate_scene_representation()
-            # Generate corresponding image, questions and answers.
-            I = self.generate_image(objects)
-            Q = self.generate_question_matrix(objects)
-            A = self.generate_answer_matrix(objects)
-            # Iterate through all questions generated for a given scene.
-            for j in range(len(objects) * self.NUM_QUESTIONS):
-                # Create new group.
-                id = '{}'.format(count)
-                grp = f.create_group(id)
-
-                # Set data.
-                grp['image'] = I
-                grp['question'] = Q[j, ...]
-                grp['answer'] = A[j, ...]
-                grp['scene_description'] = self.scene2str(objects)
-
-                # Increment counter.
-                count += 1
-
-                # Update progress bar.
-                if count % (self.dataset_size / 100) == 0:
-                    bar.update(count / (self.dataset_size / 100))
-                # Check whether we generated the required number of samples -
-                # break the internal loop.
-                if count >= self.dataset_size:
-                    break
+            # Generate a block of scenes - sequentially, so the dataset depends
+            # only on the seed (and not on the number of workers).
+            scenes = []
+            num_questions = 0
+            while len(scenes) < self.generation_block_size and count + num_questions < self.dataset_size:
+                scenes.append(self.generate_scene_representation())
+                num_questions += len(scenes[-1]) * self.NUM_QUESTIONS
+
+            # Generate corresponding images, questions and answers.
+            if pool is not None:
+                images = pool.map(draw, scenes, chunksize=max(1, len(scenes) // (4 * self.generation_workers)))
+            else:
+                images = [draw(objects) for objects in scenes]
+            x, y, colors, shapes, mask = self.scenes2arrays(scenes)
+            Q = self.generate_questions(colors[mask], shapes[mask])
+            A = self.generate_answers(x, y, colors, shapes, mask)
+            scene_ids = np.repeat(np.arange(num_scenes, num_scenes + len(scenes), dtype=np.int32),
+                                  mask.sum(axis=1) * self.NUM_QUESTIONS)
+
+            # Do not take more than the required number of samples.
+            num_questions = min(len(Q), self.dataset_size - count)
+
+            # Chunks of single images - images are read scene by scene.
+            append('images', np.stack(images), chunk_size=1)
+            append('scene_descriptions', np.array([self.scene2str(objects) for objects in scenes], dtype=object),
+                   dtype=h5py.special_dtype(vlen=str))
+            append('questions', Q[:num_questions])
+            append('answers', A[:num_questions])
+            append('scene_ids', scene_ids[:num_questions])
+
+            # Update progress bar.
+            num_scenes += len(scenes)
+            count += num_questions
+            bar.update(100 * count / self.dataset_size)
+
+        if pool is not None:
+            pool.close()
+            pool.join()
 
         # Finalize the generation.
         bar.finish()
         f.close()
-        logger.info('Generated dataset with {} samples and saved to {}'.format(
-            self.dataset_size, self.pathfilename))
+        logger.info('Generated dataset with {} samples ({} scenes) and saved to {}'.format(
+            self.dataset_size, num_scenes, self.pathfilename))
 
     def show_sample(self, data_tuple, aux_tuple, sample_number=0):
         """
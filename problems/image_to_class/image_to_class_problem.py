@@ -19,9 +19,12 @@
 __author__ = "Younes Bouhadjar"
 
 import numpy as np
+import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from problems.problem import Problem
+from problems.utils.in_memory import load_torchvision_dataset, EpochSampler
 
 
 class ImageToClassProblem(Problem):
@@ -46,6 +49,50 @@ class ImageToClassProblem(Problem):
 
         self.loss_function = nn.CrossEntropyLoss()
 
+    def load_in_memory(self, dataset, start_index, stop_index, shared=False):
+        """
+        Loads (a range of) samples of a torchvision dataset into memory, as a
+        single uint8 tensor of images [N x C x H x W] and a tensor of labels.
+
+        :param dataset: torchvision dataset (MNIST or CIFAR10).
+        :param start_index: Index of the first sample.
+        :param stop_index: Index following the last sample.
+        :param shared: Share the tensors with other processes on the node (see shared_arrays.py) (DEFAULT: False).
+
+        """
+        self.images, self.labels = load_torchvision_dataset(dataset, start_index, stop_index, shared)
+
+        # Epoch-based sampling: permutation of indices walked batch by batch.
+        self.epoch_sampler = EpochSampler(len(self.labels))
+
+    def next_batch_indices(self):
+        """
+        Returns indices of samples (loaded by load_in_memory) forming the next
+        batch (see EpochSampler).
+
+        :return: Array of indices.
+
+        """
+        return self.epoch_sampler.next_batch(self.batch_size)
+
+    def transform_batch(self, images, padding, up_scaling):
+        """
+        Transforms a whole batch of images at once: scales values to [0, 1],
+        (optionally) upscales images to 224 x 224 and pads them.
+
+        :param images: uint8 tensor of images [BATCH_SIZE x C x H x W].
+        :param padding: Padding (left, right, top, bottom).
+        :param up_scaling: Upscale images to 224 x 224 (bilinear interpolation).
+        :return: Float tensor of images.
+
+        """
+        if up_scaling:
+            # Interpolation of uint8 images is much faster than of floats
+            # (and results in values quantized like those of PIL).
+            images = F.interpolate(images, size=(224, 224), mode='bilinear', align_corners=False)
+        images = images.float().div_(255)
+        return F.pad(images, padding, 'constant', 0)
+
     def calculate_accuracy(self, data_tuple, logits, _):
         """ Calculates accuracy equal to mean number of correct classification in a given batch.
         WARNING: Applies mask (from aux_tuple) to logits!
@@ -53,10 +53,18 @@ class MNIST(ImageToClassProblem):
         self.padding = params['padding']
         # up scaling the image to 224, 224 if True
         self.up_scaling = params['up_scaling']
+        # Keep the whole dataset in memory and transform whole batches at once.
+        self.in_memory = params.get('in_memory', True)
+        # Share the in-memory dataset with other processes on the node.
+        self.shared_memory = params.get('shared_memory', False)
 
         # Define transforms
-        train_transform = transforms.Compose([transforms.Resize((224, 224)), transforms.ToTensor(
-        )]) if self.up_scaling else transforms.Compose([transforms.ToTensor()])
+        if self.in_memory:
+            # Transforms are applied to whole batches in generate_batch.
+            train_transform = None
+        else:
+            train_transform = transforms.Compose([transforms.Resize((224, 224)), transforms.ToTensor(
+            )]) if self.up_scaling else transforms.Compose([transforms.ToTensor()])
 
         # load the datasets
         self.train_datasets = datasets.MNIST(
@@ -65,6 +73,11 @@ class MNIST(ImageToClassProblem):
             download=True,
             transform=train_transform)
 
+        if self.in_memory:
+            # Load the split data (for training and validation data) into memory.
+            self.load_in_memory(self.train_datasets, self.start_index, self.stop_index,
+                                shared=self.shared_memory)
+
         # set split data (for training and validation data)
         num_train = len(self.train_datasets)
         indices = list(range(num_train))
@@ -75,8 +88,36 @@ class MNIST(ImageToClassProblem):
         self.mnist_class_names = 'Zero One Two Three Four Five Six Seven Eight Nine'.split(
             ' ')
 
+    def epoch_size(self):
+        """
+        Returns the number of samples (of the split), None if not loaded into memory.
+        """
+        return len(self.labels) if self.in_memory else None
+
+    def generate_batch_from_indices(self, indices):
+        """
+        Generates batch of given samples (loaded into memory), transformed at once.
+
+        :param indices: Indices of samples.
+        :return: DataTuple and LabelAuxTuple.
+
+        """
+        data_padded = self.transform_batch(
+            self.images[indices], self.padding, self.up_scaling)
+        label = self.labels[indices]
+
+        # Generate labels for aux tuple
+        class_names = [self.mnist_class_names[i] for i in label]
+
+        # Return DataTuple(!) and an empty (aux) tuple.
+        return DataTuple(data_padded, label), LabelAuxTuple(class_names)
+
     def generate_batch(self):
 
+        if self.in_memory:
+            # Sample indices and transform the whole batch at once.
+            return self.generate_batch_from_indices(self.next_batch_indices())
+
         # data loader
         train_loader = torch.utils.data.DataLoader(
             self.train_datasets,
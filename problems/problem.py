@@ -115,6 +115,44 @@ class Problem(metaclass=ABCMeta):
         while True:
             yield self.generate_batch()
 
+    def epoch_size(self):
+        """
+        Returns the number of samples of the problem (i.e. of its dataset).
+        Problems generating samples on the fly have no epochs (None).
+
+        To be redefined in inheriting (dataset-backed) classes.
+
+        """
+        return None
+
+    def generate_batch_from_indices(self, indices):
+        """
+        Generates batch of given samples (of a dataset-backed problem).
+
+        To be redefined in inheriting classes supporting exhaustive evaluation.
+
+        :param indices: Array of indices of samples.
+
+        """
+        raise NotImplementedError(
+            "Problem {} does not support generation of batches of given samples".format(self.name))
+
+    def return_epoch_generator(self, batch_size, num_workers=0, prefetch_factor=2):
+        """
+        Returns a generator yielding batches of all samples, in order, exactly
+        once (the last batch can be smaller), e.g. for exhaustive evaluation.
+
+        :param batch_size: Size of batches.
+        :param num_workers: Number of processes generating batches (DEFAULT: 0, i.e. the main process).
+        :param prefetch_factor: Number of batches prefetched by every worker (DEFAULT: 2).
+
+        """
+        from problems.problem_dataset import EpochDataset
+        assert self.epoch_size() is not None, \
+            "Problem {} has no epochs (samples are generated on the fly)".format(self.name)
+        return EpochDataset(self, batch_size).create_loader(
+            num_workers, prefetch_factor, self.app_state.use_CUDA)
+
     def evaluate_loss(self, data_tuple, logits, _):
         """
         Calculates loss between the predictions/logits and targets (from
@@ -158,6 +196,40 @@ class Problem(metaclass=ABCMeta):
         """
         pass
 
+    def accumulate_statistics(self, data_tuple, logits, aux_tuple):
+        """
+        Accumulates statistics of an evaluated (validation/test) batch over the
+        whole pass, i.e. since the last reset_statistics().
+
+        EMPTY - To be redefined in inheriting classes.
+
+        :param data_tuple: Data tuple containing inputs and targets.
+        :param logits: Logits being output of the model.
+        :param aux_tuple: auxiliary tuple (aux_tuple).
+
+        """
+        pass
+
+    def collect_accumulated_statistics(self, stat_col):
+        """
+        Collects statistics accumulated by accumulate_statistics(), e.g. before logging of validation/test results.
+
+        EMPTY - To be redefined in inheriting classes.
+
+        :param stat_col: Statistics collector.
+
+        """
+        pass
+
+    def reset_statistics(self):
+        """
+        Resets statistics accumulated over batches, e.g. before a validation pass.
+
+        EMPTY - To be redefined in inheriting classes.
+
+        """
+        pass
+
     def turn_on_cuda(self, data_tuple, aux_tuple):
         """ Enables computations on GPU - copies the input and target matrices (from DataTuple) to GPU.
         This method has to be overwritten in derived class if one decides to copy other matrices as well.
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""problem_dataset.py: contains adapters generating batches of problems in DataLoader workers"""
+__author__ = "Tomasz Kornuta"
+
+import random
+import multiprocessing
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset, IterableDataset, DataLoader, get_worker_info
+
+
+class ProblemDataset(IterableDataset):
+    """
+    Adapter turning a problem into an (infinite) iterable dataset, so that its
+    batches can be generated in parallel by DataLoader workers.
+
+    Every worker works on its own copy of the problem and yields whole batches
+    (data_tuple, aux_tuple) returned by generate_batch(), passed to the main
+    process unchanged. Workers cannot initialize CUDA, so the problems generate
+    tensors on CPU in workers (moved to GPU by turn_on_cuda() in the main
+    process).
+
+    Workers are seeded differently (numpy and random are seeded with the
+    worker seed set by DataLoader), so they generate different batches.
+
+    Curriculum learning: the main process sets the current episode (see
+    set_episode()) in a shared value, and every worker updates its copy of the
+    problem with that episode before generating a batch. As the batches are
+    prefetched, they can follow the curriculum with a delay of up to
+    num_workers * prefetch_factor episodes.
+
+    """
+
+    def __init__(self, problem):
+        """
+        Constructor.
+
+        :param problem: Problem object (with initialized curriculum learning, if used).
+
+        """
+        super(ProblemDataset, self).__init__()
+        self.problem = problem
+        # Current episode, shared with the workers.
+        self.episode = multiprocessing.Value('l', 0)
+        # Curriculum learning is initialized only for training.
+        self.use_curriculum = hasattr(problem, 'curriculum_params')
+
+    def set_episode(self, episode):
+        """
+        Sets the current episode (used by workers for updating the curriculum learning).
+
+        :param episode: Number of the current episode.
+
+        """
+        self.episode.value = episode
+
+    def __iter__(self):
+        """
+        Yields batches of the problem.
+        """
+        follow_curriculum = self.use_curriculum and get_worker_info() is not None
+        while True:
+            if follow_curriculum:
+                # Follow the curriculum of the main process.
+                self.problem.curriculum_learning_update_params(self.episode.value)
+            yield self.problem.generate_batch()
+
+    @staticmethod
+    def worker_init(worker_id):
+        """
+        Initializes a DataLoader worker: seeds numpy and random with the
+        (different for every worker) torch seed.
+        """
+        seed = torch.initial_seed() % 2**32
+        np.random.seed(seed)
+        random.seed(seed)
+
+    @staticmethod
+    def collate(batch):
+        """
+        Returns the batch (already generated by the problem) unchanged, i.e.
+        keeps the types of data and auxiliary tuples.
+        """
+        return batch
+
+    def create_loader(self, num_workers, prefetch_factor=2, pin_memory=False):
+        """
+        Creates the DataLoader generating batches.
+
+        :param num_workers: Number of worker processes (0: batches are generated in the main process).
+        :param prefetch_factor: Number of batches prefetched by every worker (DEFAULT: 2).
+        :param pin_memory: Copy tensors generated by workers into pinned memory (DEFAULT: False).
+        :return: DataLoader object.
+
+        """
+        assert not (num_workers > 0 and getattr(self.problem, 'num_workers', 0) > 0), \
+            "Problem {} already loads samples with its own workers".format(self.problem.name)
+
+        # Options available only when the batches are generated by workers
+        # (which create tensors on CPU - batches generated in the main process
+        # can be already on GPU, so they are not pinned).
+        worker_options = {}
+        if num_workers > 0:
+            worker_options = {'worker_init_fn': ProblemDataset.worker_init,
+                              'persistent_workers': True,
+                              'prefetch_factor': prefetch_factor,
+                              'pin_memory': pin_memory}
+
+        # batch_size=None: every item is already a whole batch.
+        return DataLoader(self, batch_size=None, collate_fn=ProblemDataset.collate,
+                          num_workers=num_workers, **worker_options)
+
+    @classmethod
+    def batch_generator(cls, problem, params, logger):
+        """
+        Creates the generator of batches of a problem, depending on the
+        (optional) 'dataloader' section of training/testing parameters, e.g.:
+
+            dataloader:
+                num_workers: 4
+                prefetch_factor: 2
+
+        :param problem: Problem object.
+        :param params: Training or testing parameters.
+        :param logger: Logger object.
+        :return: Generator of batches, ProblemDataset object (None when batches are generated by the problem itself).
+
+        """
+        if 'dataloader' not in params:
+            return problem.return_generator(), None
+
+        loader_params = params['dataloader']
+        loader_params.add_default_params({'num_workers': 0, 'prefetch_factor': 2})
+        num_workers = loader_params['num_workers']
+
+        dataset = cls(problem)
+        loader = dataset.create_loader(num_workers, loader_params['prefetch_factor'],
+                                       problem.app_state.use_CUDA)
+        logger.info('Generating batches with DataLoader ({} workers)'.format(num_workers))
+        return loader, dataset
+
+
+class EpochDataset(Dataset):
+    """
+    Adapter turning a dataset-backed problem into a dataset of consecutive
+    batches covering all its samples exactly once (the last batch can be
+    smaller), generated (and prefetched) by DataLoader workers in order.
+
+    """
+
+    def __init__(self, problem, batch_size):
+        """
+        Constructor.
+
+        :param problem: Problem object (implementing epoch_size() and generate_batch_from_indices()).
+        :param batch_size: Size of batches.
+
+        """
+        super(EpochDataset, self).__init__()
+        self.problem = problem
+        self.batch_size = batch_size
+        self.num_samples = problem.epoch_size()
+
+    def __len__(self):
+        """
+        Returns the number of batches.
+        """
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, index):
+        """
+        Generates a batch.
+
+        :param index: Index of the batch.
+
+        """
+        start = index * self.batch_size
+        indices = np.arange(start, min(start + self.batch_size, self.num_samples))
+        return self.problem.generate_batch_from_indices(indices)
+
+    def create_loader(self, num_workers, prefetch_factor=2, pin_memory=False):
+        """
+        Creates the DataLoader generating batches in order.
+
+        :param num_workers: Number of worker processes (0: batches are generated in the main process).
+        :param prefetch_factor: Number of batches prefetched by every worker (DEFAULT: 2).
+        :param pin_memory: Copy tensors generated by workers into pinned memory (DEFAULT: False).
+        :return: DataLoader object.
+
+        """
+        # Batches generated in the main process can be already on GPU (see ProblemDataset.create_loader()).
+        worker_options = {}
+        if num_workers > 0:
+            worker_options = {'prefetch_factor': prefetch_factor,
+                              'pin_memory': pin_memory}
+
+        # batch_size=None: every item is already a whole batch.
+        return DataLoader(self, batch_size=None, shuffle=False, collate_fn=ProblemDataset.collate,
+                          num_workers=num_workers, **worker_options)
@@ -1,4 +1,5 @@
 from .algorithmic import *
 from .text2text import *
 
+from .length_bucket_sampler import LengthBucketSampler
 from .seq_to_seq_problem import SeqToSeqProblem
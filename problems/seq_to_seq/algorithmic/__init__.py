@@ -14,5 +14,6 @@ from .operation_span import OperationSpan
 from .reading_span import ReadingSpan
 from .reverse_recall import ReverseRecall
 from .scratch_pad import ScratchPad
+from .sequence_layout import SequenceLayout
 from .serial_recall import SerialRecall
 from .serial_recall_simplified import SerialRecallSimplified
@@ -25,21 +25,29 @@ import torch.nn as nn
 import torch.nn.functional as F
 from problems.problem import DataTuple
 from problems.seq_to_seq.seq_to_seq_problem import SeqToSeqProblem
+from problems.seq_to_seq.length_bucket_sampler import LengthBucketSampler
+from problems.seq_to_seq.algorithmic.sequence_layout import SequenceLayout
 from utils.loss.masked_bce_with_logits_loss import MaskedBCEWithLogitsLoss
+from utils.app_state import AppState
+from torch.utils.data import get_worker_info
 
 
 _AlgSeqAuxTuple = collections.namedtuple(
-    'AlgSeqAuxTuple', ('mask', 'seq_length', 'num_subsequences'))
+    'AlgSeqAuxTuple', ('mask', 'seq_length', 'num_subsequences', 'padding_mask'))
+# Problems generating sequences of the same length do not need the padding mask.
+_AlgSeqAuxTuple.__new__.__defaults__ = (None,)
 
 
 class AlgSeqAuxTuple(_AlgSeqAuxTuple):
     """
     Tuple used by storing batches of data by algorithmic sequential problems.
-    Contains three elements:
+    Contains four elements:
 
     - mask that might be used for evaluation of the loss function
-    - length of sequence
+    - length of sequence (the longest one in the batch)
     - number of subsequences
+    - padding mask [BATCH_SIZE, SEQ_LENGTH] indicating the items belonging to \
+    a given sample (None when all samples in batch have the same length)
 
     """
     __slots__ = ()
@@ -64,11 +72,26 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         """
         super(AlgorithmicSeqToSeqProblem, self).__init__(params)
 
+        # Flag indicating whether every sample in batch should have a sequence
+        # of different length, padded to the longest one (DEFAULT: False).
+        if 'per_sample_lengths' not in params:
+            params.add_default_params({'per_sample_lengths': False})
+        self.per_sample_lengths = params['per_sample_lengths']
+
+        # Boundaries of buckets grouping similar per-sample lengths in a
+        # batch (DEFAULT: [], i.e. no bucketing).
+        if 'bucket_boundaries' not in params:
+            params.add_default_params({'bucket_boundaries': []})
+        self.bucket_boundaries = params['bucket_boundaries']
+        self.length_sampler = None
+
         # Set default loss function - cross entropy.
         if self.use_mask:
             self.loss_function = MaskedBCEWithLogitsLoss()
         else:
             self.loss_function = nn.BCEWithLogitsLoss()
+        # Padded batches always require the masked version (applying the padding mask).
+        self.padding_loss_function = MaskedBCEWithLogitsLoss()
 
         # Extract "standard" list of parameters for algorithmic tasks.
         self.batch_size = params['batch_size']
@@ -85,12 +108,259 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
             params.add_default_params({'bias': 0.5})
         self.bias = params['bias']
 
+        # Budget of items per batch, i.e. batch_size x max_sequence_length.
+        # If set, the batch size adapts to the (curriculum learning) max
+        # sequence length (DEFAULT: -1, i.e. fixed batch size).
+        if 'batch_token_budget' not in params:
+            params.add_default_params({'batch_token_budget': -1})
+        self.batch_token_budget = params['batch_token_budget']
+        self.adapt_batch_size()
+
+        # Flag indicating whether composite sequences are built in preallocated
+        # buffers (otherwise by concatenation of their segments - kept as a
+        # reference for equivalence checks and benchmarks).
+        self.preallocate_layout = True
+
+        # Backend used for generation of batches: 'numpy' (reference
+        # implementation, DEFAULT) or 'torch' (tensors are created directly on
+        # the device and with the type set in the AppState, using torch RNG).
+        if 'generation_backend' not in params:
+            params.add_default_params({'generation_backend': 'numpy'})
+        self.generation_backend = params['generation_backend']
+        assert self.generation_backend in ['numpy', 'torch'], \
+            "Unknown generation backend %r" % self.generation_backend
+
         # Set initial dtype.
         self.dtype = torch.FloatTensor
 
+    def adapt_batch_size(self):
+        """
+        Sets the batch size so that batch_size x max_sequence_length stays
+        within the token budget (if the budget is set).
+
+        The loss functions average over the (masked) elements, so the loss
+        is normalized in the same way for every effective batch size.
+
+        """
+        if self.batch_token_budget > 0:
+            self.batch_size = max(
+                1, self.batch_token_budget // self.max_sequence_length)
+
+    def generate_sequence_lengths(self):
+        """
+        Draws lengths of sequences, one per sample. Unless per_sample_lengths
+        is set, all samples in batch get the same length.
+
+        :returns: Array of sequence lengths [BATCH_SIZE].
+
+        """
+        if self.per_sample_lengths:
+            if self.bucket_boundaries:
+                return self.get_length_sampler().sample_lengths(self.batch_size)
+            return np.random.randint(
+                self.min_sequence_length, self.max_sequence_length + 1, size=self.batch_size)
+        return np.full(self.batch_size, np.random.randint(
+            self.min_sequence_length, self.max_sequence_length + 1), dtype=np.int64)
+
+    def get_length_sampler(self):
+        """
+        Returns the sampler drawing lengths from buckets, updates its lengths
+        when their range has changed (e.g. by curriculum learning), keeping the
+        statistics of drawn batches.
+
+        :returns: LengthBucketSampler object.
+
+        """
+        lengths = np.arange(self.min_sequence_length,
+                            self.max_sequence_length + 1)
+        if self.length_sampler is None:
+            self.length_sampler = LengthBucketSampler(
+                lengths, self.bucket_boundaries)
+        elif not np.array_equal(self.length_sampler.lengths, lengths):
+            self.length_sampler.set_lengths(lengths)
+        return self.length_sampler
+
+    def sequence_mask(self, lengths, max_length):
+        """
+        Creates a mask [BATCH_SIZE, max_length] with ones for the first
+        lengths[i] items of i-th sample and zeros for the rest.
+
+        :param lengths: Array of lengths [BATCH_SIZE].
+        :param max_length: Length of the (padded) sequence.
+        :returns: Boolean array [BATCH_SIZE, max_length].
+
+        """
+        return np.arange(max_length)[np.newaxis, :] < lengths[:, np.newaxis]
+
+    def item_positions(self, offsets, length):
+        """
+        Returns indices of [BATCH_SIZE, length] consecutive items, starting
+        at a different offset in every sample. To be used for (fancy) indexing
+        of the [BATCH_SIZE, SEQ_LENGTH, ...] arrays.
+
+        :param offsets: Array of offsets [BATCH_SIZE].
+        :param length: Number of consecutive items.
+        :returns: Tuple of (row, column) index arrays.
+
+        """
+        return (np.arange(len(offsets))[:, np.newaxis],
+                offsets[:, np.newaxis] + np.arange(length)[np.newaxis, :])
+
+    def padding_mask(self, lengths, max_length):
+        """
+        Creates the padding mask - only if samples in batch can have different lengths.
+
+        :param lengths: Array of total lengths of samples [BATCH_SIZE].
+        :param max_length: Length of the (padded) sequence.
+        :returns: ByteTensor [BATCH_SIZE, max_length] or None.
+
+        """
+        if not self.per_sample_lengths:
+            return None
+        return self.as_mask(self.sequence_mask(lengths, max_length))
+
+    def tensor_type(self):
+        """
+        Returns dtype and device of tensors created by the torch generation
+        backend - both follow the AppState.
+
+        DataLoader workers cannot initialize CUDA, so they always create
+        tensors on CPU (these are moved to GPU in turn_on_cuda()).
+
+        :returns: Pair of torch.dtype and torch.device.
+
+        """
+        app_state = AppState()
+        on_gpu = app_state.use_CUDA and get_worker_info() is None
+        device = torch.device('cuda' if on_gpu else 'cpu')
+        return app_state.dtype.dtype, device
+
+    def random_bits(self, shape):
+        """
+        Draws random bits from the Bernoulli distribution (with p = bias).
+
+        :param shape: Shape of the array.
+        :returns: Array of bits (numpy array or tensor, depending on the backend).
+
+        """
+        if self.generation_backend == 'torch':
+            dtype, device = self.tensor_type()
+            return torch.bernoulli(torch.full(
+                shape, self.bias, dtype=dtype, device=device))
+        return np.random.binomial(1, self.bias, shape)
+
+    def zeros(self, shape):
+        """
+        Creates a buffer filled with zeros.
+
+        :param shape: Shape of the buffer.
+        :returns: Buffer (numpy array or tensor, depending on the backend).
+
+        """
+        if self.generation_backend == 'torch':
+            dtype, device = self.tensor_type()
+            return torch.zeros(shape, dtype=dtype, device=device)
+        return np.zeros(shape, dtype=np.float32)
+
+    def zeros_mask(self, shape):
+        """
+        Creates a mask filled with zeros.
+
+        :param shape: Shape of the mask.
+        :returns: ByteTensor (on the device if the torch backend is used).
+
+        """
+        if self.generation_backend == 'torch':
+            _, device = self.tensor_type()
+            return torch.zeros(shape, dtype=torch.uint8, device=device)
+        return torch.zeros(shape).type(torch.ByteTensor)
+
+    def as_array(self, array):
+        """
+        Converts a (small, auxiliary) numpy array, e.g. a control marker or a
+        mask of items, so it can be combined with the generated buffers.
+
+        :param array: Numpy array.
+        :returns: Numpy array or tensor, depending on the backend.
+
+        """
+        if self.generation_backend == 'torch':
+            dtype, device = self.tensor_type()
+            return torch.as_tensor(np.asarray(array), dtype=dtype, device=device)
+        return array
+
+    def as_mask(self, array):
+        """
+        Converts a boolean numpy array into mask.
+
+        :param array: Numpy array.
+        :returns: ByteTensor (on the device if the torch backend is used).
+
+        """
+        if self.generation_backend == 'torch':
+            _, device = self.tensor_type()
+            return torch.as_tensor(array.astype(np.uint8), device=device)
+        return torch.from_numpy(array.astype(np.uint8))
+
+    def as_tensor(self, array):
+        """
+        Converts a generated buffer into tensor of type self.dtype. Buffers
+        generated by the torch backend are already of the right type.
+
+        :param array: Numpy array or tensor, depending on the backend.
+        :returns: Tensor.
+
+        """
+        if self.generation_backend == 'torch':
+            return array
+        return torch.from_numpy(array).type(self.dtype)
+
+    def flip(self, array, axis):
+        """
+        Reverses the order of elements along the given axis.
+
+        :param array: Numpy array or tensor, depending on the backend.
+        :param axis: Axis to be flipped.
+        :returns: Flipped array.
+
+        """
+        if self.generation_backend == 'torch':
+            return array.flip(axis)
+        return np.flip(array, axis)
+
+    def roll(self, array, shift, axis):
+        """
+        Rolls (i.e. cyclically shifts) the elements along the given axis.
+
+        :param array: Numpy array or tensor, depending on the backend.
+        :param shift: Number of places by which the elements are shifted.
+        :param axis: Axis along which the elements are shifted.
+        :returns: Rolled array.
+
+        """
+        if self.generation_backend == 'torch':
+            return array.roll(shift, axis)
+        return np.roll(array, shift, axis)
+
+    def evaluate_loss(self, data_tuple, logits, aux_tuple):
+        """ Calculates loss between the logits and targets.
+        WARNING: Applies mask (from aux_tuple) to both logits and targets! If
+        the mask is not used, the padding mask (if present) is applied instead.
+
+        :param logits: Logits being output of the model.
+        :param data_tuple: Data tuple containing inputs and targets.
+        :param aux_tuple: Auxiliary tuple containing mask.
+        """
+        if not self.use_mask and aux_tuple.padding_mask is not None:
+            return self.padding_loss_function(
+                logits, data_tuple.targets, aux_tuple.padding_mask)
+        return super(AlgorithmicSeqToSeqProblem, self).evaluate_loss(
+            data_tuple, logits, aux_tuple)
+
     def calculate_accuracy(self, data_tuple, logits, aux_tuple):
         """ Calculate accuracy equal to mean difference between outputs and targets.
-        WARNING: Applies mask (from aux_tuple) to both logits and targets!
+        WARNING: Applies mask (from aux_tuple) to both logits and targets! If
+        the mask is not used, the padding mask (if present) is applied instead.
 
         :param logits: Logits being output of the model.
         :param data_tuple: Data tuple containing inputs and targets.
@@ -101,6 +371,9 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         if (self.use_mask):
             return self.loss_function.masked_accuracy(
                 logits, data_tuple.targets, aux_tuple.mask)
+        elif aux_tuple.padding_mask is not None:
+            return self.padding_loss_function.masked_accuracy(
+                logits, data_tuple.targets, aux_tuple.padding_mask)
         else:
             return (1 - torch.abs(torch.round(F.sigmoid(logits)) -
                                   data_tuple.targets)).mean()
@@ -117,6 +390,8 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         gpu_inputs = data_tuple.inputs.cuda()
         gpu_targets = data_tuple.targets.cuda()
         gpu_mask = aux_tuple.mask.cuda()
+        gpu_padding_mask = aux_tuple.padding_mask.cuda(
+        ) if aux_tuple.padding_mask is not None else None
 
         # Pack matrices to tuples.
         data_tuple = DataTuple(gpu_inputs, gpu_targets)
@@ -124,7 +399,7 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         # seq_length and num_subsequences are used only in logging, so are
         # passed as they are i.e. stored in CPU.
         aux_tuple = AlgSeqAuxTuple(
-            gpu_mask, aux_tuple.seq_length, aux_tuple.num_subsequences)
+            gpu_mask, aux_tuple.seq_length, aux_tuple.num_subsequences, gpu_padding_mask)
 
         return data_tuple, aux_tuple
 
@@ -135,38 +410,41 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
     #    """
     #    self.max_sequence_length = max_length
 
-    def add_ctrl(self, seq, ctrl, pos):
-        """
-        Adds control channels to a sequence.
+    def create_layout(self, target_bits=None):
         """
-        return np.insert(seq, pos, ctrl, axis=-1)
+        Creates an empty layout of a sequence composed of markers, data
+        subsequences and dummies.
 
-    def augment(self, seq, markers, ctrl_start=None,
-                add_marker_data=False, add_marker_dummy=True):
-        """
-        Creates augmented sequence as well as end marker and a dummy sequence.
-        """
-        ctrl_data, ctrl_dummy, pos = markers
+        :param target_bits: Number of bits of a target item (DEFAULT: None, i.e. data_bits).
+        :returns: SequenceLayout object.
 
-        w = self.add_ctrl(seq, ctrl_data, pos)
-        start = self.add_ctrl(
-            np.zeros((seq.shape[0], 1, seq.shape[2])), ctrl_start, pos)
-        if add_marker_data:
-            w = np.concatenate((start, w), axis=1)
+        """
+        return SequenceLayout(self.batch_size, self.control_bits,
+                              self.data_bits, target_bits)
 
-        start_dummy = self.add_ctrl(
-            np.zeros((seq.shape[0], 1, seq.shape[2])), ctrl_dummy, pos)
-        ctrl_data_select = np.ones(len(ctrl_data))
-        dummy = self.add_ctrl(np.zeros_like(seq), ctrl_data_select, pos)
+    def build_layout(self, layout):
+        """
+        Creates inputs, targets and mask of the sequence described by the layout.
 
-        if add_marker_dummy:
-            dummy = np.concatenate((start_dummy, dummy), axis=1)
+        :param layout: SequenceLayout object.
+        :returns: Tuple of inputs, targets (both of type self.dtype) and mask (ByteTensor).
 
-        return [w, dummy]
+        """
+        if self.generation_backend == 'torch':
+            return layout.build_tensors(*self.tensor_type())
+        if self.preallocate_layout:
+            inputs, targets, mask = layout.build()
+        else:
+            inputs, targets, mask = layout.concatenate()
+        return (torch.from_numpy(inputs).type(self.dtype),
+                torch.from_numpy(targets).type(self.dtype),
+                torch.from_numpy(mask))
 
     def add_statistics(self, stat_col):
         """
-        Add accuracy, seq_length and num_subsequences statistics to collector.
+        Add accuracy, seq_length, max_seq_length and batch_size statistics to
+        collector. Adds also the fraction of padding items (if samples have
+        different lengths) and the index of the length bucket (if used).
 
         :param stat_col: Statistics collector.
 
@@ -175,10 +453,16 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         stat_col.add_statistic('seq_length', '{:d}')
         #stat_col.add_statistic('num_subseq', '{:d}')
         stat_col.add_statistic('max_seq_length', '{:d}')
+        stat_col.add_statistic('batch_size', '{:d}')
+        if self.per_sample_lengths:
+            stat_col.add_statistic('padding', '{:6.4f}')
+        if self.bucket_boundaries:
+            stat_col.add_statistic('bucket', '{:d}')
 
     def collect_statistics(self, stat_col, data_tuple, logits, aux_tuple):
         """
-        Collects accuracy, seq_length and num_subsequences.
+        Collects accuracy, seq_length, max_seq_length, (effective) batch_size
+        and padding/bucket statistics.
 
         :param stat_col: Statistics collector.
         :param data_tuple: Data tuple containing inputs and targets.
@@ -191,6 +475,12 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         stat_col['seq_length'] = aux_tuple.seq_length
         #stat_col['num_subseq'] = aux_tuple.num_subsequences
         stat_col['max_seq_length'] = self.max_sequence_length
+        stat_col['batch_size'] = data_tuple.inputs.size(0)
+        if self.per_sample_lengths and aux_tuple.padding_mask is not None:
+            # Fraction of items being padding.
+            stat_col['padding'] = 1 - aux_tuple.padding_mask.float().mean().item()
+        if self.bucket_boundaries and self.length_sampler is not None:
+            stat_col['bucket'] = int(self.length_sampler.last_bucket)
 
     def show_sample(self, data_tuple, aux_tuple, sample_number=0):
         """
@@ -232,6 +522,8 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         print("\nmask:", aux_tuple.mask[sample_number:sample_number + 1, :])
         print("\nseq_length:", aux_tuple.seq_length)
         print("\nnum_subsequences:", aux_tuple.num_subsequences)
+        if aux_tuple.padding_mask is not None:
+            print("\npadding_mask:", aux_tuple.padding_mask[sample_number:sample_number + 1, :])
 
         # show data.
         params = {'edgecolor': 'black', 'cmap': 'inferno', 'linewidths': 1.4e-3}
@@ -250,7 +542,8 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
         """
         Updates problem parameters according to curriculum learning. In the
         case of algorithmic sequential problems it updates the max sequence
-        length, depending on configuration parameters.
+        length, depending on configuration parameters, and (when the token
+        budget is set) the effective batch size.
 
         :param episode: Number of the current episode.
         :returns: Boolean informing whether curriculum learning is finished (or wasn't active at all).
@@ -275,6 +568,8 @@ class AlgorithmicSeqToSeqProblem(SeqToSeqProblem):
                     curric_done = False
                 # Change max length.
                 self.max_sequence_length = max_length
+                # Keep the token budget (if set) constant.
+                self.adapt_batch_size()
         except KeyError:
             pass
         # Return information whether we finished CL (i.e. reached max sequence
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+backend_equivalence.py: checks the torch generation backend of algorithmic
+problems against the numpy (reference) backend, for every algorithmic problem:
+
+    - with the same random bits (drawn from numpy for both backends), the
+      inputs, targets, masks and auxiliary values must be equal,
+    - with bits drawn from the torch RNG, the batches must have the same
+      shapes and types, binary values, and targets must be null outside of
+      the masks.
+
+Run from the root directory of the repository, e.g.:
+
+    python -m problems.seq_to_seq.algorithmic.backend_equivalence --episodes 20
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import argparse
+import numpy as np
+import torch
+
+from utils.param_interface import ParamInterface
+from problems.seq_to_seq.algorithmic import SerialRecall, SerialRecallSimplified, ReverseRecall, \
+    ManipulationSpatialNot, ManipulationSpatialRotation, ManipulationTemporalSwap, \
+    InterruptionSwapRecall, InterruptionReverseRecall, InterruptionNot, OperationSpan, ReadingSpan, \
+    DistractionCarry, DistractionForget, DistractionIgnore, ScratchPad
+from problems.seq_to_seq.algorithmic.maes_baselines import DualSerialReverseRecallCommandLines, \
+    RepeatReverseRecallCommandLines, RepeatSerialRecallCommandLines, ReverseRecallCommandLines, \
+    SequenceComparisonCommandLines, SequenceEqualityCommandLines, SequenceSymmetryCommandLines, \
+    SerialRecallCommandLines, SkipRecallCommandLines
+
+# Algorithmic problems and their specific parameters.
+PROBLEMS = [
+    (SerialRecall, {'control_bits': 2}),
+    (SerialRecallSimplified, {'control_bits': 1}),
+    (ReverseRecall, {'control_bits': 2}),
+    (ManipulationSpatialNot, {'control_bits': 2}),
+    (ManipulationSpatialRotation, {'control_bits': 2, 'num_bits': 0.5}),
+    (ManipulationTemporalSwap, {'control_bits': 2, 'num_items': 0.5}),
+    (InterruptionSwapRecall, {'control_bits': 4, 'num_rotation': 0.5}),
+    (InterruptionReverseRecall, {'control_bits': 4}),
+    (InterruptionNot, {'control_bits': 4}),
+    (OperationSpan, {'control_bits': 4, 'num_rotation': 0.5}),
+    (ReadingSpan, {'control_bits': 2}),
+    (DistractionCarry, {'control_bits': 4}),
+    (DistractionForget, {'control_bits': 4}),
+    (DistractionIgnore, {'control_bits': 4}),
+    (ScratchPad, {'control_bits': 2}),
+    (DualSerialReverseRecallCommandLines, {'control_bits': 4}),
+    (RepeatReverseRecallCommandLines, {'control_bits': 3}),
+    (RepeatSerialRecallCommandLines, {'control_bits': 3}),
+    (ReverseRecallCommandLines, {'control_bits': 3}),
+    (SequenceComparisonCommandLines, {'control_bits': 3}),
+    (SequenceEqualityCommandLines, {'control_bits': 3}),
+    (SequenceSymmetryCommandLines, {'control_bits': 3}),
+    (SerialRecallCommandLines, {'control_bits': 3}),
+    (SkipRecallCommandLines, {'control_bits': 3, 'seq_start': 0, 'skip_step': 2}),
+]
+
+# Problems supporting per-sample lengths - their seq_length is the number of
+# items (i.e. of unmasked output steps) of the longest sample.
+PER_SAMPLE_LENGTH_PROBLEMS = (SerialRecall, SerialRecallSimplified, ReverseRecall,
+                              ManipulationSpatialNot, ManipulationSpatialRotation, ManipulationTemporalSwap)
+
+
+def create_problem(problem_class, problem_params, backend, FLAGS):
+    """
+    Creates the problem with a given generation backend.
+
+    :param problem_class: Class of the problem.
+    :param problem_params: Problem-specific parameters.
+    :param backend: Generation backend ('numpy' or 'torch').
+    :param FLAGS: Parsed arguments.
+    :returns: Problem object.
+
+    """
+    # Separate section of the registry for every problem and backend.
+    params = ParamInterface(problem_class.__name__ + '_' + backend)
+    params.add_custom_params({'data_bits': FLAGS.data_bits,
+                              'batch_size': FLAGS.batch_size,
+                              'min_sequence_length': 1,
+                              'max_sequence_length': FLAGS.max_sequence_length,
+                              'num_subseq_min': 1,
+                              'num_subseq_max': FLAGS.num_subseq_max,
+                              'per_sample_lengths': FLAGS.per_sample_lengths,
+                              'generation_backend': backend})
+    params.add_custom_params(problem_params)
+    return problem_class(params)
+
+
+def tensors(data_tuple, aux_tuple):
+    """
+    Returns the tensors of a batch: inputs, targets, mask and (optional) padding mask.
+    """
+    return [data_tuple.inputs, data_tuple.targets, aux_tuple.mask, aux_tuple.padding_mask]
+
+
+def check_same_bits(numpy_problem, torch_problem, episodes, seed):
+    """
+    Checks that both backends generate equal batches from the same random bits.
+
+    The torch backend draws the bits from numpy (as the numpy backend does),
+    so both consume the same random numbers.
+
+    :param numpy_problem: Problem with the numpy backend.
+    :param torch_problem: Problem with the torch backend.
+    :param episodes: Number of compared batches.
+    :param seed: Seed of the random generator.
+
+    """
+    dtype, device = torch_problem.tensor_type()
+    torch_problem.random_bits = lambda shape: torch.as_tensor(
+        np.random.binomial(1, torch_problem.bias, shape), dtype=dtype, device=device)
+
+    np.random.seed(seed)
+    reference = [numpy_problem.generate_batch() for _ in range(episodes)]
+    np.random.seed(seed)
+    for episode, (data_tuple, aux_tuple) in enumerate(reference):
+        torch_data_tuple, torch_aux_tuple = torch_problem.generate_batch()
+        assert (aux_tuple.seq_length, aux_tuple.num_subsequences) == \
+            (torch_aux_tuple.seq_length, torch_aux_tuple.num_subsequences), \
+            "Episode {}: different lengths".format(episode)
+        for name, expected, actual in zip(['inputs', 'targets', 'mask', 'padding_mask'],
+                                          tensors(data_tuple, aux_tuple),
+                                          tensors(torch_data_tuple, torch_aux_tuple)):
+            if expected is None:
+                assert actual is None, "Episode {}: unexpected {}".format(episode, name)
+                continue
+            assert torch.equal(expected.cpu().double(), actual.cpu().double()), \
+                "Episode {}: different {}".format(episode, name)
+
+
+def check_invariants(numpy_problem, torch_problem, episodes, seed):
+    """
+    Checks that batches generated with the torch RNG have the same shapes and
+    types as the reference ones, binary values, null targets outside of the
+    masks and sequence lengths consistent with the masks.
+
+    :param numpy_problem: Problem with the numpy backend.
+    :param torch_problem: Problem with the torch backend.
+    :param episodes: Number of checked batches.
+    :param seed: Seed of the random generators.
+
+    """
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    for episode in range(episodes):
+        data_tuple, aux_tuple = numpy_problem.generate_batch()
+        torch_data_tuple, torch_aux_tuple = torch_problem.generate_batch()
+
+        for name, expected, actual in zip(['inputs', 'targets', 'mask', 'padding_mask'],
+                                          tensors(data_tuple, aux_tuple),
+                                          tensors(torch_data_tuple, torch_aux_tuple)):
+            if expected is None:
+                assert actual is None, "Episode {}: unexpected {}".format(episode, name)
+                continue
+            assert expected.dtype == actual.dtype, "Episode {}: different types of {}".format(episode, name)
+            # Lengths are random - compare the batch size and the width of items.
+            assert expected.dim() == actual.dim() and expected.shape[0] == actual.shape[0] and \
+                expected.shape[2:] == actual.shape[2:], "Episode {}: different shapes of {}".format(episode, name)
+            assert ((actual == 0) | (actual == 1)).all(), "Episode {}: {} are not binary".format(episode, name)
+
+        inputs, targets, mask, padding_mask = tensors(torch_data_tuple, torch_aux_tuple)
+        assert inputs.shape[:2] == targets.shape[:2] == mask.shape[:2], \
+            "Episode {}: inconsistent lengths".format(episode)
+
+        # Number of unmasked output steps of every sample.
+        mask = mask.bool()
+        steps = mask.sum(1)
+        if padding_mask is not None:
+            # Samples are padded to the longest one, outputs are never in the padding.
+            padding_mask = padding_mask.bool()
+            assert inputs.shape[1] == int(padding_mask.sum(1).max()), \
+                "Episode {}: batch not padded to its longest sample".format(episode)
+            assert not (mask & ~padding_mask).any(), "Episode {}: mask outside of the padding mask".format(episode)
+        else:
+            assert (steps == steps[0]).all(), "Episode {}: samples of different lengths".format(episode)
+        if isinstance(torch_problem, PER_SAMPLE_LENGTH_PROBLEMS):
+            assert torch_aux_tuple.seq_length == int(steps.max()), \
+                "Episode {}: seq_length {} differs from the number of unmasked steps {}".format(
+                    episode, torch_aux_tuple.seq_length, int(steps.max()))
+        outside = (mask == 0).view(mask.shape[0], mask.shape[1], *([1] * (targets.dim() - 2))).expand_as(targets)
+        assert (targets[outside] == 0).all(), "Episode {}: targets outside of the mask".format(episode)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=16,
+                        help='Size of the batch (DEFAULT: 16)')
+    parser.add_argument('--data_bits', type=int, default=8,
+                        help='Number of data bits (DEFAULT: 8)')
+    parser.add_argument('--max_sequence_length', type=int, default=10,
+                        help='Max length of a subsequence (DEFAULT: 10)')
+    parser.add_argument('--num_subseq_max', type=int, default=4,
+                        help='Max number of subsequences (DEFAULT: 4)')
+    parser.add_argument('--per_sample_lengths', action='store_true',
+                        help='Samples of a batch have different lengths')
+    parser.add_argument('--episodes', type=int, default=20,
+                        help='Number of batches checked for every problem (DEFAULT: 20)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random generators (DEFAULT: 0)')
+    FLAGS, _ = parser.parse_known_args()
+
+    for problem_class, problem_params in PROBLEMS:
+        numpy_problem = create_problem(problem_class, problem_params, 'numpy', FLAGS)
+        torch_problem = create_problem(problem_class, problem_params, 'torch', FLAGS)
+
+        check_invariants(numpy_problem, torch_problem, FLAGS.episodes, FLAGS.seed)
+        check_same_bits(numpy_problem, torch_problem, FLAGS.episodes, FLAGS.seed)
+        print('{:>40}: OK'.format(problem_class.__name__))
@@ -66,12 +66,10 @@ class DistractionCarry(AlgorithmicSeqToSeqProblem):
 
         """
         # define control channel markers
-        pos = [0, 0, 0, 0]
-        ctrl_data = [0, 0, 0, 0]
+        ctrl_x = [1, 0, 0, 0]
+        ctrl_y = [0, 1, 0, 0]
         ctrl_dummy = [0, 0, 1, 0]
         ctrl_inter = [0, 0, 0, 1]
-        # assign markers
-        markers = ctrl_data, ctrl_dummy, pos
 
         # number of sub_sequences
         nb_sub_seq_a = np.random.randint(
@@ -90,72 +88,35 @@ class DistractionCarry(AlgorithmicSeqToSeqProblem):
             size=nb_sub_seq_b)
 
         #  generate subsequences for x and y
-        x = [
-            np.random.binomial(
-                1,
-                self.bias,
-                (self.batch_size,
-                 n,
-                 self.data_bits)) for n in seq_lengths_a]
-        y = [
-            np.random.binomial(
-                1,
-                self.bias,
-                (self.batch_size,
-                 n,
-                 self.data_bits)) for n in seq_lengths_b]
-
-        # create the target
-        target_wo_dummies = np.concatenate([y[-1]] + x, axis=1)
-
-        # add marker at the begging of x and dummies
-        xx = [
-            self.augment(
-                seq,
-                markers,
-                ctrl_start=[
-                    1,
-                    0,
-                    0,
-                    0],
-                add_marker_data=True,
-                add_marker_dummy=False) for seq in x]
-        # add marker at the begging of y and dummies of same length, also a
-        # marker at the begging of dummies is added
-        yy = [self.augment(seq, markers, ctrl_start=[
-                           0, 1, 0, 0], add_marker_data=True) for seq in y]
+        x = [self.random_bits((self.batch_size, n, self.data_bits))
+             for n in seq_lengths_a]
+        y = [self.random_bits((self.batch_size, n, self.data_bits))
+             for n in seq_lengths_b]
+
+        # create the layout of the sequence
+        layout = self.create_layout()
+        for a, b in zip(x, y):
+            # marker at the beginning of x followed by x
+            layout.add_marker(ctrl_x)
+            layout.add_data(a)
+            # marker at the beginning of y followed by y
+            layout.add_marker(ctrl_y)
+            layout.add_data(b)
+
+        # dummies of the last y (with a marker at the beginning)
+        layout.add_marker(ctrl_dummy)
+        layout.add_dummies(y[-1])
 
         # this is a marker to separate dummies of x and y at the end of the
         # sequence
-        inter_seq = self.add_ctrl(
-            np.zeros((self.batch_size, 1, self.data_bits)), ctrl_inter, pos)
+        layout.add_marker(ctrl_inter)
 
-        # data which contains all xs and all ys
-        data_1 = [arr for a, b in zip(xx, yy) for arr in a[:-1] + b[:-1]]
-
-        # dummies of y and xs
-        data_2 = [yy[-1][-1]] + [inter_seq] + [a[-1] for a in xx]
-
-        # concatenate all parts of the inputs
-        inputs = np.concatenate(data_1 + data_2, axis=1)
+        # dummies of xs
+        for a in x:
+            layout.add_dummies(a)
 
         # PyTorch variables
-        inputs = torch.from_numpy(inputs).type(self.dtype)
-        target_wo_dummies = torch.from_numpy(
-            target_wo_dummies).type(self.dtype)
-
-        # create the mask
-        mask_all = inputs[:, :, 0:self.control_bits] == 1
-        mask = mask_all[..., 0]
-        for i in range(self.control_bits):
-            mask = mask_all[..., i] * mask
-
-        # rest ctrl channel of dummies
-        inputs[:, mask[0], 0:self.control_bits] = 0
-
-        # Create the target with the dummies
-        targets = torch.zeros_like(inputs[:, :, self.control_bits:])
-        targets[:, mask[0], :] = target_wo_dummies
+        inputs, targets, mask = self.build_layout(layout)
 
         # Return tuples.
         data_tuple = DataTuple(inputs, targets)
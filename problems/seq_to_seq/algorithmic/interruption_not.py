@@ -77,12 +77,10 @@ class InterruptionNot(AlgorithmicSeqToSeqProblem):
 
         """
         # define control channel markers
-        pos = [0, 0, 0, 0]
-        ctrl_data = [0, 0, 0, 0]
+        ctrl_x = [1, 0, 0, 0]
+        ctrl_y = [0, 1, 0, 0]
         ctrl_dummy = [0, 0, 1, 0]
         ctrl_inter = [0, 0, 0, 1]
-        # assign markers
-        markers = ctrl_data, ctrl_dummy, pos
 
         # number of sub_sequences
         nb_sub_seq_a = np.random.randint(
@@ -101,66 +99,36 @@ class InterruptionNot(AlgorithmicSeqToSeqProblem):
             size=nb_sub_seq_b)
 
         #  generate subsequences for x and y
-        x = [
-            np.random.binomial(
-                1,
-                self.bias,
-                (self.batch_size,
-                 n,
-                 self.data_bits)) for n in seq_lengths_a]
-        y = [
-            np.random.binomial(
-                1,
-                self.bias,
-                (self.batch_size,
-                 n,
-                 self.data_bits)) for n in seq_lengths_b]
+        x = [self.random_bits((self.batch_size, n, self.data_bits))
+             for n in seq_lengths_a]
+        y = [self.random_bits((self.batch_size, n, self.data_bits))
+             for n in seq_lengths_b]
         # NOT y
-        yr = [np.logical_not(yr) for yr in y]
-
-        # create the target
-        target = np.concatenate(yr + x, axis=1)
-
-        # add marker at the begging of x and dummies of same length,  also a
-        # marker at the begging of dummies is added
-        xx = [self.augment(seq, markers, ctrl_start=[
-                           1, 0, 0, 0], add_marker_data=True) for seq in x]
-        # add marker at the begging of y and dummies of same length, also a
-        # marker at the begging of dummies is added
-        yy = [self.augment(seq, markers, ctrl_start=[
-                           0, 1, 0, 0], add_marker_data=True) for seq in y]
+        yr = [1 - b for b in y]
+
+        # create the layout of the sequence
+        layout = self.create_layout()
+        for a, b, br in zip(x, y, yr):
+            # marker at the beginning of x followed by x
+            layout.add_marker(ctrl_x)
+            layout.add_data(a)
+            # marker at the beginning of y followed by y
+            layout.add_marker(ctrl_y)
+            layout.add_data(b)
+            # marker at the beginning of dummies of y
+            layout.add_marker(ctrl_dummy)
+            layout.add_dummies(br)
 
         # this is a marker to separate dummies of x and y at the end of the
         # sequence
-        inter_seq = self.add_ctrl(
-            np.zeros((self.batch_size, 1, self.data_bits)), ctrl_inter, pos)
-
-        # data which contains all xs and all ys plus dummies of ys
-        data_1 = [arr for a, b in zip(xx, yy) for arr in a[:-1] + b]
+        layout.add_marker(ctrl_inter)
 
         # dummies of xs
-        data_2 = [a[-1][:, 1:, :] for a in xx]
-
-        # concatenate all parts of the inputs
-        inputs = np.concatenate(data_1 + [inter_seq] + data_2, axis=1)
+        for a in x:
+            layout.add_dummies(a)
 
         # PyTorch variables
-        inputs = torch.from_numpy(inputs).type(self.dtype)
-        target = torch.from_numpy(target).type(self.dtype)
-
-        # create the mask
-        mask_all = inputs[:, :, 0:self.control_bits] == 1
-        mask = mask_all[..., 0]
-        for i in range(self.control_bits):
-            mask = mask_all[..., i] * mask
-
-        # rest ctrl channel of dummies
-        inputs[:, mask[0], 0:self.control_bits] = 0
-
-        # Create the target with the dummies
-        target_with_dummies = torch.zeros_like(
-            inputs[:, :, self.control_bits:])
-        target_with_dummies[:, mask[0], :] = target
+        inputs, target_with_dummies, mask = self.build_layout(layout)
 
         # Return data tuple.
         data_tuple = DataTuple(inputs, target_with_dummies)
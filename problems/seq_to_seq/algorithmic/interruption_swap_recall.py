@@ -79,8 +79,7 @@ class InterruptionSwapRecall(AlgorithmicSeqToSeqProblem):
         # Modulo items shift with length of the sequence.
         rotation = int(rotation % seq_length)
         # apply the shift
-        seq = np.concatenate(
-            (seq[:, rotation:, :], seq[:, :rotation, :]), axis=1)
+        seq = self.roll(seq, -rotation, 1)
         return seq
 
     def generate_batch(self):
@@ -98,14 +97,11 @@ class InterruptionSwapRecall(AlgorithmicSeqToSeqProblem):
 
         """
         # define control channel markers
-        pos = [0, 0, 0, 0]
-        ctrl_data = [0, 0, 0, 0]
+        ctrl_x = [1, 0, 0, 0]
+        ctrl_y = [0, 1, 0, 0]
         ctrl_dummy = [0, 0, 1, 0]
         ctrl_inter = [0, 0, 0, 1]
 
-        # assign markers
-        markers = ctrl_data, ctrl_dummy, pos
-
         # number of sub_sequences
         nb_sub_seq_a = np.random.randint(
             self.num_subseq_min, self.num_subseq_max + 1)
@@ -123,73 +119,34 @@ class InterruptionSwapRecall(AlgorithmicSeqToSeqProblem):
             size=nb_sub_seq_b)
 
         #  generate subsequences for x and y
-        x = [
-            np.random.binomial(
-                1,
-                self.bias,
-                (self.batch_size,
-                 n,
-                 self.data_bits)) for n in seq_lengths_a]
-        y = [
-            np.random.binomial(
-                1,
-                self.bias,
-                (self.batch_size,
-                 n,
-                 self.data_bits)) for n in seq_lengths_b]
-
-        # create the target
-        target = np.concatenate(y + x, axis=1)
-
-        # add marker at the begging of x and dummies of same length,  also a
-        # marker at the begging of dummies is added
-        xx = [self.augment(seq, markers, ctrl_start=[
-                           1, 0, 0, 0], add_marker_data=True) for seq in x]
-        # add dummies to y of same length,  also a marker at the begging of dummies is added
-        # TODO: ctrl_start is not needed here, this is replaced by ctrl_xy
-        yy = [self.augment(seq, markers, ctrl_start=[0, 1, 0, 0],
-                           add_marker_data=False) for seq in y]
+        x = [self.random_bits((self.batch_size, n, self.data_bits))
+             for n in seq_lengths_a]
+        y = [self.random_bits((self.batch_size, n, self.data_bits))
+             for n in seq_lengths_b]
+
+        # create the layout of the sequence
+        layout = self.create_layout()
+        for a, b in zip(x, y):
+            # marker at the beginning of x followed by x
+            layout.add_marker(ctrl_x)
+            layout.add_data(a)
+            # marker between sub sequence x and y followed by rotated y
+            layout.add_marker(ctrl_y)
+            layout.add_data(self.rotate(b, self.rotation, b.shape[1]))
+            # marker at the beginning of dummies of y
+            layout.add_marker(ctrl_dummy)
+            layout.add_dummies(b)
 
         # this is a marker to separate dummies of x and y at the end of the
         # sequence
-        inter_seq = self.add_ctrl(
-            np.zeros((self.batch_size, 1, self.data_bits)), ctrl_inter, pos)
-        ctrl_xy = np.zeros_like(ctrl_data)
-        ctrl_xy[1] = 1
-        # this is a marker between sub sequence x and y
-        inter_xy = self.add_ctrl(
-            np.zeros((self.batch_size, 1, self.data_bits)), ctrl_xy, pos)
-
-        # data which contains all xs and all rotated ys plus dummies of ys
-        data_1 = [
-            arr for a, b in zip(xx, yy)
-            for arr in a[: -1] + [inter_xy] +
-            [self.rotate(b[0],
-                         self.rotation, b[0].shape[1])] + [b[1]]]
+        layout.add_marker(ctrl_inter)
 
         # dummies of xs
-        data_2 = [a[-1][:, 1:, :] for a in xx]
-
-        # concatenate all parts of the inputs
-        inputs = np.concatenate(data_1 + [inter_seq] + data_2, axis=1)
+        for a in x:
+            layout.add_dummies(a)
 
         # PyTorch variables
-        inputs = torch.from_numpy(inputs).type(self.dtype)
-        target = torch.from_numpy(target).type(self.dtype)
-
-        # create the mask
-        mask_all = inputs[:, :, 0:self.control_bits] == 1
-        mask = mask_all[..., 0]
-        for i in range(self.control_bits):
-            mask = mask_all[..., i] * mask
-
-        # rest ctrl channel of dummies
-        inputs[:, mask[0], 0:self.control_bits] = 0
-
-        # Create the target with the dummies
-        target_with_dummies = torch.zeros_like(
-            inputs[:, :, self.control_bits:])
-        target_with_dummies[:, mask[0], :] = target
+        inputs, target_with_dummies, mask = self.build_layout(layout)
 
         # Return data tuple.
         data_tuple = DataTuple(inputs, target_with_dummies)
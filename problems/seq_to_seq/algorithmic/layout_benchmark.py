@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+layout_benchmark.py: compares throughput of generation of batches of composite
+algorithmic problems, with sequences built in preallocated buffers versus by
+concatenation of their segments.
+
+Run from the root directory of the repository, e.g.:
+
+    python -m problems.seq_to_seq.algorithmic.layout_benchmark --batch_size 64 --episodes 200
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import time
+import argparse
+import numpy as np
+
+from utils.param_interface import ParamInterface
+from problems.seq_to_seq.algorithmic import InterruptionSwapRecall, InterruptionReverseRecall, \
+    InterruptionNot, OperationSpan, ReadingSpan, DistractionCarry, DistractionForget, \
+    DistractionIgnore, ScratchPad
+from problems.seq_to_seq.algorithmic.maes_baselines import SequenceComparisonCommandLines, \
+    SequenceEqualityCommandLines, SequenceSymmetryCommandLines, SkipRecallCommandLines
+
+# Composite problems and their specific parameters.
+PROBLEMS = [
+    (InterruptionSwapRecall, {'control_bits': 4, 'num_rotation': 0.5}),
+    (InterruptionReverseRecall, {'control_bits': 4}),
+    (InterruptionNot, {'control_bits': 4}),
+    (OperationSpan, {'control_bits': 4, 'num_rotation': 0.5}),
+    (ReadingSpan, {'control_bits': 2}),
+    (DistractionCarry, {'control_bits': 4}),
+    (DistractionForget, {'control_bits': 4}),
+    (DistractionIgnore, {'control_bits': 4}),
+    (ScratchPad, {'control_bits': 2}),
+    (SequenceComparisonCommandLines, {'control_bits': 3}),
+    (SequenceEqualityCommandLines, {'control_bits': 3}),
+    (SequenceSymmetryCommandLines, {'control_bits': 3}),
+    (SkipRecallCommandLines, {'control_bits': 3, 'seq_start': 0, 'skip_step': 2}),
+]
+
+
+def measure(problem, episodes, seed):
+    """
+    Measures throughput of generation of batches.
+
+    :param problem: Problem object.
+    :param episodes: Number of batches to be generated.
+    :param seed: Seed of the random generator (the same for both layouts).
+    :returns: Number of batches generated per second.
+
+    """
+    np.random.seed(seed)
+    start = time.perf_counter()
+    for _ in range(episodes):
+        problem.generate_batch()
+    return episodes / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=64,
+                        help='Size of the batch (DEFAULT: 64)')
+    parser.add_argument('--data_bits', type=int, default=8,
+                        help='Number of data bits (DEFAULT: 8)')
+    parser.add_argument('--max_sequence_length', type=int, default=10,
+                        help='Max length of a subsequence (DEFAULT: 10)')
+    parser.add_argument('--num_subseq_max', type=int, default=4,
+                        help='Max number of subsequences (DEFAULT: 4)')
+    parser.add_argument('--episodes', type=int, default=200,
+                        help='Number of batches generated by every problem (DEFAULT: 200)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random generator (DEFAULT: 0)')
+    FLAGS, _ = parser.parse_known_args()
+
+    print('{:>32} {:>18} {:>18} {:>10}'.format(
+        'problem', 'concat [batch/s]', 'prealloc [batch/s]', 'speedup'))
+    for problem_class, problem_params in PROBLEMS:
+        # Separate section of the registry for every problem.
+        params = ParamInterface(problem_class.__name__)
+        params.add_custom_params({'data_bits': FLAGS.data_bits,
+                                  'batch_size': FLAGS.batch_size,
+                                  'min_sequence_length': 1,
+                                  'max_sequence_length': FLAGS.max_sequence_length,
+                                  'num_subseq_min': 1,
+                                  'num_subseq_max': FLAGS.num_subseq_max,
+                                  'predict_inverse': True})
+        params.add_custom_params(problem_params)
+        problem = problem_class(params)
+
+        # Reference: concatenation of segments.
+        problem.preallocate_layout = False
+        concat = measure(problem, FLAGS.episodes, FLAGS.seed)
+        # Preallocated buffers.
+        problem.preallocate_layout = True
+        prealloc = measure(problem, FLAGS.episodes, FLAGS.seed)
+
+        print('{:>32} {:>18.2f} {:>18.2f} {:>10.2f}'.format(
+            problem_class.__name__, concat, prealloc, prealloc / concat))
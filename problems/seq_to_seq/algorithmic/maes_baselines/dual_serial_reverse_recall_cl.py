@@ -96,59 +96,53 @@ class DualSerialReverseRecallCommandLines(AlgorithmicSeqToSeqProblem):
 
         # Generate batch of random bit sequences [BATCH_SIZE x SEQ_LENGTH X
         # DATA_BITS]
-        bit_seq = np.random.binomial(
-            1, self.bias, (self.batch_size, seq_length, self.data_bits))
+        bit_seq = self.random_bits(
+            (self.batch_size, seq_length, self.data_bits))
 
         # 1. Generate inputs.
         # Generate input:  [BATCH_SIZE, 3*SEQ_LENGTH+3, CONTROL_BITS+DATA_BITS]
-        inputs = np.zeros([self.batch_size,
-                           3 * seq_length + 3,
-                           self.control_bits + self.data_bits],
-                          dtype=np.float32)
+        inputs = self.zeros([self.batch_size,
+                             3 * seq_length + 3,
+                             self.control_bits + self.data_bits])
         # Set start main control marker.
-        inputs[:, 0, 0:self.control_bits] = np.tile(
-            marker_start_main, (self.batch_size, 1))
+        inputs[:, 0, 0:self.control_bits] = self.as_array(marker_start_main)
 
         # Set bit sequence.
         inputs[:, 1:seq_length + 1,
                self.control_bits:self.control_bits + self.data_bits] = bit_seq
 
         # Set start aux serial recall control marker.
-        inputs[:, seq_length + 1, 0:self.control_bits] = np.tile(
-            marker_start_aux_serial, (self.batch_size, 1))
+        inputs[:, seq_length + 1, 0:self.control_bits] = self.as_array(
+            marker_start_aux_serial)
         inputs[:,
                seq_length + 2:2 * seq_length + 2,
-               0:self.control_bits] = np.tile(ctrl_aux,
-                                              (self.batch_size,
-                                               seq_length,
-                                               1))
+               0:self.control_bits] = self.as_array(ctrl_aux)
 
         # Set start aux serial reverse control marker.
-        inputs[:, 2 * seq_length + 2, 0:self.control_bits] = np.tile(
-            marker_start_aux_reverse, (self.batch_size, 1))
+        inputs[:, 2 * seq_length + 2, 0:self.control_bits] = self.as_array(
+            marker_start_aux_reverse)
         inputs[:, 2 * seq_length + 3:3 * seq_length + 3,
-               0:self.control_bits] = np.tile(ctrl_aux, (self.batch_size, seq_length, 1))
+               0:self.control_bits] = self.as_array(ctrl_aux)
 
         # 2. Generate targets.
         # Generate target:  [BATCH_SIZE, 3*SEQ_LENGTH+3, DATA_BITS] (only data
         # bits!)
-        targets = np.zeros([self.batch_size, 3 * seq_length + 3,
-                            self.data_bits], dtype=np.float32)
+        targets = self.zeros([self.batch_size, 3 * seq_length + 3,
+                              self.data_bits])
         # Set bit sequence for serial recall.
         targets[:, seq_length + 2:2 * seq_length + 2, :] = bit_seq
         # Set bit sequence for reverse recall.
-        targets[:, 2 * seq_length + 3:, :] = np.fliplr(bit_seq)
+        targets[:, 2 * seq_length + 3:, :] = self.flip(bit_seq, 1)
 
         # 3. Generate mask.
         # Generate target mask: [BATCH_SIZE, 3*SEQ_LENGTH+3]
-        mask = torch.zeros([self.batch_size, 3 * seq_length + 3]
-                           ).type(torch.ByteTensor)
+        mask = self.zeros_mask([self.batch_size, 3 * seq_length + 3])
         mask[:, seq_length + 2:2 * seq_length + 2] = 1
         mask[:, 2 * seq_length + 3:] = 1
 
         # PyTorch variables.
-        ptinputs = torch.from_numpy(inputs).type(self.dtype)
-        pttargets = torch.from_numpy(targets).type(self.dtype)
+        ptinputs = self.as_tensor(inputs)
+        pttargets = self.as_tensor(targets)
 
         # Return tuples.
         data_tuple = DataTuple(ptinputs, pttargets)
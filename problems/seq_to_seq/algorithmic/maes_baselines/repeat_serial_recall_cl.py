@@ -101,18 +101,16 @@ class RepeatSerialRecallCommandLines(AlgorithmicSeqToSeqProblem):
 
         # Generate batch of random bit sequences [BATCH_SIZE x SEQ_LENGTH X
         # DATA_BITS]
-        bit_seq = np.random.binomial(
-            1, self.bias, (self.batch_size, seq_length, self.data_bits))
+        bit_seq = self.random_bits(
+            (self.batch_size, seq_length, self.data_bits))
 
         # 1. Generate inputs.
         # Generate input:  [BATCH_SIZE, 3*SEQ_LENGTH+3, CONTROL_BITS+DATA_BITS]
-        inputs = np.zeros([self.batch_size,
-                           (recall_number + 1) * (seq_length + 1),
-                           self.control_bits + self.data_bits],
-                          dtype=np.float32)
+        inputs = self.zeros([self.batch_size,
+                             (recall_number + 1) * (seq_length + 1),
+                             self.control_bits + self.data_bits])
         # Set start main control marker.
-        inputs[:, 0, 0:self.control_bits] = np.tile(
-            marker_start_main, (self.batch_size, 1))
+        inputs[:, 0, 0:self.control_bits] = self.as_array(marker_start_main)
 
         # Set bit sequence.
         inputs[:, 1:seq_length + 1,
@@ -122,23 +120,17 @@ class RepeatSerialRecallCommandLines(AlgorithmicSeqToSeqProblem):
             # Set start aux serial recall control marker.
             inputs[:,
                    (r + 1) * (seq_length + 1),
-                   0:self.control_bits] = np.tile(marker_start_aux,
-                                                  (self.batch_size,
-                                                   1))
+                   0:self.control_bits] = self.as_array(marker_start_aux)
             inputs[:,
                    (r + 1) * (seq_length + 1) + 1:(r + 2) * (seq_length + 1),
-                   0:self.control_bits] = np.tile(ctrl_aux,
-                                                  (self.batch_size,
-                                                   seq_length,
-                                                   1))
+                   0:self.control_bits] = self.as_array(ctrl_aux)
 
         # 2. Generate targets.
         # Generate target:  [BATCH_SIZE, 3*SEQ_LENGTH+3, DATA_BITS] (only data
         # bits!)
-        targets = np.zeros([self.batch_size,
-                            (recall_number + 1) * (seq_length + 1),
-                            self.data_bits],
-                           dtype=np.float32)
+        targets = self.zeros([self.batch_size,
+                              (recall_number + 1) * (seq_length + 1),
+                              self.data_bits])
         # Set bit sequence for serial recall.
         for r in range(recall_number):
             targets[:, (r + 1) * (seq_length + 1) + 1:(r + 2) *
@@ -146,15 +138,15 @@ class RepeatSerialRecallCommandLines(AlgorithmicSeqToSeqProblem):
 
         # 3. Generate mask.
         # Generate target mask: [BATCH_SIZE, 3*SEQ_LENGTH+3]
-        mask = torch.zeros([self.batch_size, (recall_number + 1) *
-                            (seq_length + 1)]).type(torch.ByteTensor)
+        mask = self.zeros_mask([self.batch_size, (recall_number + 1) *
+                                (seq_length + 1)])
         for r in range(recall_number):
             mask[:, (r + 1) * (seq_length + 1) +
                  1:(r + 2) * (seq_length + 1)] = 1
 
         # PyTorch variables.
-        ptinputs = torch.from_numpy(inputs).type(self.dtype)
-        pttargets = torch.from_numpy(targets).type(self.dtype)
+        ptinputs = self.as_tensor(inputs)
+        pttargets = self.as_tensor(targets)
 
         # Return tuples.
         data_tuple = DataTuple(ptinputs, pttargets)
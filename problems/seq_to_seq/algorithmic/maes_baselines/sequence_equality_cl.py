@@ -64,37 +64,25 @@ class SequenceEqualityCommandLines(AlgorithmicSeqToSeqProblem):
 
         """
         # define control channel markers
-        # pos = [0, 0, 0]
-        pos = np.zeros(self.control_bits)  # [0, 0, 0]
-
-        # ctrl_data = [0, 0, 0]
-        ctrl_data = np.zeros(self.control_bits)  # [0, 0, 0]
-
-        # ctrl_dummy = [0, 0, 0 ]
-        ctrl_dummy = np.zeros(self.control_bits)
-
         # ctrl_inter = [0, 1, 0]
         ctrl_inter = np.zeros(self.control_bits)
         ctrl_inter[1] = 1  # [0, 1, 0]
 
         # ctrl_y = [0, 0, 1]
         ctrl_y = np.zeros(self.control_bits)
-        ctrl_y[2] = 1  # [0, 1, 0]
+        ctrl_y[2] = 1  # [0, 0, 1]
 
         # ctrl_start = [1, 0, 0]
         ctrl_start = np.zeros(self.control_bits)
         ctrl_start[0] = 1  # [1, 0, 0]
 
-        # assign markers
-        markers = ctrl_data, ctrl_dummy, pos
-
         # set the sequence length of each marker
         seq_length = np.random.randint(
             low=self.min_sequence_length, high=self.max_sequence_length + 1)
 
         #  generate subsequences for x and y
-        x = [np.array(np.random.binomial(
-            1, self.bias, (self.batch_size, seq_length, self.data_bits)))]
+        x = [self.random_bits(
+            (self.batch_size, seq_length, self.data_bits))]
 
         # Generate the second sequence which is either a scrambled version of the first
         # or exactly identical with approximately 50% probability (technically the scrambling
@@ -102,81 +90,44 @@ class SequenceEqualityCommandLines(AlgorithmicSeqToSeqProblem):
 
         # First generate a random binomial of the same size as x, this will be
         # used be used with an xor operation to scamble x to get y
-        xor_scrambler = np.array(np.random.binomial(1, self.bias, x[0].shape))
+        xor_scrambler = self.random_bits(x[0].shape)
 
         # Create a mask that will set entire batches of the xor_scrambler to zero. The batches that are zero
         # will force the xor to return the original x for that batch
-        scrambler_mask = np.array(np.random.binomial(
-            1, self.bias, (self.batch_size,)))
-        xor_scrambler = np.array(
-            xor_scrambler * scrambler_mask[:, np.newaxis, np.newaxis])
+        scrambler_mask = self.random_bits((self.batch_size,))
+        xor_scrambler = xor_scrambler * scrambler_mask[:, np.newaxis, np.newaxis]
 
-        aux_seq = np.array(np.logical_xor(x[0], xor_scrambler))
+        aux_seq = (x[0] + xor_scrambler) % 2
 
         # if the xor scambler is all zeros then x and y will be the same so
         # target will be true
-        actual_target = np.array(np.any(xor_scrambler, axis=(1, 2)))
+        actual_target = xor_scrambler.sum(2).sum(1) > 0
 
         if self.predict_inverse:
             # if the xor scambler is all zeros then x and y will be the same so
             # target will be true
             actual_target = actual_target[:, np.newaxis, np.newaxis]
         else:
-            actual_target = np.logical_not(
-                actual_target[:, np.newaxis, np.newaxis])
-
-        # create the target
-        seq_length_tdummies = 2 * seq_length + 1
-        dummies_target = np.zeros(
-            [self.batch_size, seq_length_tdummies, 1], dtype=np.float32)
-        target = np.concatenate((dummies_target, actual_target), axis=1)
-
-        # data of x and dummies
-        xx = [
-            self.augment(
-                seq,
-                markers,
-                ctrl_start=ctrl_start,
-                add_marker_data=True,
-                add_marker_dummy=False) for seq in x]
-
-        # data of x
-        data_1 = [arr for a in xx for arr in a[:-1]]
-
-        # this is a marker between sub sequence x and dummies
-        inter_seq = [self.add_ctrl(
-            np.zeros((self.batch_size, 1, self.data_bits)), ctrl_inter, pos)]
-        # Second Sequence for comparison
-
-        markers2 = ctrl_y, ctrl_dummy, pos
-        yy = [self.augment(aux_seq, markers2, ctrl_start=ctrl_y,
-                           add_marker_data=False, add_marker_dummy=False)]
-        data_2 = [arr for a in yy for arr in a[:-1]]
-        data_2[0][:, -1, 0:self.control_bits] = np.ones(len(ctrl_dummy))
-
-        recall_seq = [self.add_ctrl(
-            np.zeros((self.batch_size, 1, self.data_bits)), ctrl_dummy, pos)]
-        dummy_data = [
-            self.add_ctrl(
-                np.zeros(
-                    (self.batch_size, 1, self.data_bits)), np.ones(
-                    len(ctrl_dummy)), pos)]
-
-        inputs = np.concatenate(data_1 + inter_seq + data_2, axis=1)
+            actual_target = actual_target[:, np.newaxis, np.newaxis] == 0
+
+        # create the layout of the sequence
+        layout = self.create_layout(target_bits=1)
+
+        # marker at the beginning of x followed by x
+        layout.add_marker(ctrl_start)
+        layout.add_data(x[0])
+
+        # this is a marker between sub sequence x and the second sequence
+        layout.add_marker(ctrl_inter)
+
+        # Second sequence for comparison - the output is expected on its
+        # last item
+        layout.add_data(aux_seq[:, :-1, :], ctrl=ctrl_y)
+        layout.add_dummies(actual_target, ctrl=ctrl_y,
+                           data=aux_seq[:, -1:, :])
 
         # PyTorch variables
-        inputs = torch.from_numpy(inputs).type(self.dtype)
-        target = torch.from_numpy(target).type(self.dtype)
-        # TODO: batch might have different sequence lengths
-        mask_all = inputs[..., 0:self.control_bits] == 1
-        mask = mask_all[..., 0]
-        for i in range(self.control_bits):
-            mask = mask_all[..., i] * mask
-
-        # TODO: fix the batch indexing
-        # rest channel values of data dummies
-        inputs[:, mask[0], 0:self.control_bits] = torch.tensor(
-            ctrl_y).type(self.dtype)
+        inputs, target, mask = self.build_layout(layout)
 
         # Return tuples.
         data_tuple = DataTuple(inputs, target)
@@ -72,17 +72,12 @@ class SkipRecallCommandLines(AlgorithmicSeqToSeqProblem):
         assert(self.max_sequence_length > self.seq_start)
 
         # define control channel markers
-        pos = np.zeros(self.control_bits)  # [0, 0, 0]
-        ctrl_data = np.zeros(self.control_bits)  # [0, 0, 0]
         ctrl_inter = np.zeros(self.control_bits)
         ctrl_inter[1] = 1  # [0, 1, 0]
         ctrl_y = np.zeros(self.control_bits)
         ctrl_y[2] = 1  # [0, 0, 1]
-        ctrl_dummy = np.ones(self.control_bits)  # [1, 1, 1]
         ctrl_start = np.zeros(self.control_bits)
         ctrl_start[0] = 1  # [1, 0, 0]
-        # assign markers
-        markers = ctrl_data, ctrl_dummy, pos
 
         # Set sequence length
         seq_length = np.random.randint(
@@ -90,66 +85,27 @@ class SkipRecallCommandLines(AlgorithmicSeqToSeqProblem):
 
         # Generate batch of random bit sequences [BATCH_SIZE x SEQ_LENGTH X
         # DATA_BITS]
-        bit_seq = np.random.binomial(
-            1, self.bias, (self.batch_size, seq_length, self.data_bits))
+        bit_seq = self.random_bits(
+            (self.batch_size, seq_length, self.data_bits))
 
         # Generate target by indexing through the array
-        target_seq = np.array(bit_seq[:, self.seq_start::self.skip_length, :])
-
-        #  generate subsequences for x and y
-        x = [np.array(bit_seq)]
-        # data of x and dummies
-        xx = [
-            self.augment(
-                seq,
-                markers,
-                ctrl_start=ctrl_start,
-                add_marker_data=True,
-                add_marker_dummy=False) for seq in x]
-
-        # data of x
-        data_1 = [arr for a in xx for arr in a[:-1]]
+        target_seq = bit_seq[:, self.seq_start::self.skip_length, :]
+
+        # create the layout of the sequence
+        layout = self.create_layout()
+
+        # marker at the beginning of x followed by x
+        layout.add_marker(ctrl_start)
+        layout.add_data(bit_seq)
 
         # this is a marker between sub sequence x and dummies
-        #inter_seq = [add_ctrl(np.zeros((self.batch_size, 1, self.data_bits)), ctrl_inter, pos)]
+        layout.add_marker(ctrl_inter)
 
         # dummies output
-        markers2 = ctrl_dummy, ctrl_dummy, pos
-        yy = [
-            self.augment(
-                np.zeros(
-                    target_seq.shape),
-                markers2,
-                ctrl_start=ctrl_inter,
-                add_marker_data=True,
-                add_marker_dummy=False)]
-        data_2 = [arr for a in yy for arr in a[:-1]]
-
-        # add dummies to target
-        seq_length_tdummies = seq_length + 2
-        dummies_target = np.zeros(
-            [self.batch_size, seq_length_tdummies, self.data_bits],
-            dtype=np.float32)
-        targets = np.concatenate((dummies_target, target_seq), axis=1)
-
-        inputs = np.concatenate(data_1 + data_2, axis=1)
+        layout.add_dummies(target_seq, ctrl=ctrl_y)
 
         # PyTorch variables
-        inputs = torch.from_numpy(inputs).type(self.dtype)
-        targets = torch.from_numpy(targets).type(self.dtype)
-        # TODO: batch might have different sequence lengths
-        mask_all = inputs[..., 0:self.control_bits] == 1
-        mask = mask_all[..., 0]
-        for i in range(self.control_bits):
-            mask = mask_all[..., i] * mask
-        # TODO: fix the batch indexing
-        # rest channel values of data dummies
-        #inputs[:, mask[0], 0:self.control_bits] = ctrl_dummy
-        # TODO: fix the batch indexing
-        # rest channel values of data dummies
-
-        inputs[:, mask[0], 0:self.control_bits] = torch.tensor(
-            ctrl_y).type(self.dtype)
+        inputs, targets, mask = self.build_layout(layout)
 
         # Return tuples.
         data_tuple = DataTuple(inputs, targets)
@@ -63,35 +63,39 @@ class ManipulationSpatialRotation(AlgorithmicSeqToSeqProblem):
         :return: Output [BATCH_SIZE, 2*SEQ_LENGTH+2, DATA_BITS],
         :return: Mask [BATCH_SIZE, 2*SEQ_LENGTH+2]
 
-        TODO: every item in batch has now the same seq_length.
+        If per_sample_lengths is set, every sample has a sequence of different
+        length, padded (with zeros) to the longest one.
 
         """
-        # Set sequence length.
-        seq_length = np.random.randint(
-            self.min_sequence_length, self.max_sequence_length + 1)
+        # Set sequence lengths - one per sample [BATCH_SIZE].
+        seq_lengths = self.generate_sequence_lengths()
+        # Length of the longest sequence - the rest will be padded.
+        seq_length = int(seq_lengths.max())
 
         # Generate batch of random bit sequences [BATCH_SIZE x SEQ_LENGTH X
         # DATA_BITS]
-        bit_seq = np.random.binomial(
-            1, self.bias, (self.batch_size, seq_length, self.data_bits))
+        bit_seq = self.random_bits(
+            (self.batch_size, seq_length, self.data_bits))
+        # Clear the items exceeding the sequence lengths of given samples.
+        items_mask = self.sequence_mask(seq_lengths, seq_length)
+        bit_seq *= self.as_array(items_mask[:, :, np.newaxis])
 
         # Generate input:  [BATCH_SIZE, 2*SEQ_LENGTH+2, CONTROL_BITS+DATA_BITS]
-        inputs = np.zeros([self.batch_size,
-                           2 * seq_length + 2,
-                           self.control_bits + self.data_bits],
-                          dtype=np.float32)
+        inputs = self.zeros([self.batch_size,
+                             2 * seq_length + 2,
+                             self.control_bits + self.data_bits])
         # Set start control marker.
         inputs[:, 0, 0] = 1  # Memorization bit.
         # Set bit sequence.
         inputs[:, 1:seq_length + 1,
                self.control_bits:self.control_bits + self.data_bits] = bit_seq
-        # Set end control marker.
-        inputs[:, seq_length + 1, 1] = 1  # Recall bit.
+        # Set end control marker - right after the sequence of every sample.
+        inputs[np.arange(self.batch_size), seq_lengths + 1, 1] = 1  # Recall bit.
 
         # Generate target:  [BATCH_SIZE, 2*SEQ_LENGTH+2, DATA_BITS] (only data
         # bits!)
-        targets = np.zeros([self.batch_size, 2 * seq_length + 2,
-                            self.data_bits], dtype=np.float32)
+        targets = self.zeros([self.batch_size, 2 * seq_length + 2,
+                              self.data_bits])
 
         # Rotate sequence by shifting the bits to right: data_bits >> num_bits
         num_bits = -self.num_bits
@@ -104,22 +108,23 @@ class ManipulationSpatialRotation(AlgorithmicSeqToSeqProblem):
         num_bits = int(num_bits % self.data_bits)
 
         # Apply items shift
-        bit_seq = np.concatenate(
-            (bit_seq[:, :, num_bits:], bit_seq[:, :, :num_bits]), axis=2)
-        targets[:, seq_length + 2:, :] = bit_seq
+        bit_seq = self.roll(bit_seq, -num_bits, 2)
+        targets[self.item_positions(seq_lengths + 2, seq_length)] = bit_seq
 
         # Generate target mask: [BATCH_SIZE, 2*SEQ_LENGTH+2]
-        mask = torch.zeros([self.batch_size, 2 * seq_length + 2]
-                           ).type(torch.ByteTensor)
-        mask[:, seq_length + 2:] = 1
+        mask = self.as_mask(
+            self.sequence_mask(2 * seq_lengths + 2, 2 * seq_length + 2) &
+            ~self.sequence_mask(seq_lengths + 2, 2 * seq_length + 2))
+        # Generate padding mask: [BATCH_SIZE, 2*SEQ_LENGTH+2]
+        padding_mask = self.padding_mask(2 * seq_lengths + 2, 2 * seq_length + 2)
 
         # PyTorch variables.
-        ptinputs = torch.from_numpy(inputs).type(self.dtype)
-        pttargets = torch.from_numpy(targets).type(self.dtype)
+        ptinputs = self.as_tensor(inputs)
+        pttargets = self.as_tensor(targets)
 
         # Return tuples.
         data_tuple = DataTuple(ptinputs, pttargets)
-        aux_tuple = AlgSeqAuxTuple(mask, seq_length, 1)
+        aux_tuple = AlgSeqAuxTuple(mask, seq_length, 1, padding_mask)
 
         return data_tuple, aux_tuple
 
@@ -53,12 +53,8 @@ class ReadingSpan(AlgorithmicSeqToSeqProblem):
         """
 
         # define control channel markers
-        pos = [0, 0]
-        ctrl_data = [0, 0]
-        ctrl_dummy = [0, 1]
+        ctrl_x = [1, 0]
         ctrl_inter = [0, 1]
-        # assign markers
-        markers = ctrl_data, ctrl_dummy, pos
 
         # number sub sequences
         num_sub_seq = np.random.randint(
@@ -71,58 +67,25 @@ class ReadingSpan(AlgorithmicSeqToSeqProblem):
             size=num_sub_seq)
 
         #  generate subsequences for x and y
-        x = [
-            np.random.binomial(
-                1,
-                self.bias,
-                (self.batch_size,
-                 n,
-                 self.data_bits)) for n in seq_length]
-        x_last = [a[:, None, -1, :] for a in x]
-
-        # create the target
-        seq_length_tdummies = sum(seq_length) + seq_length.shape[0] + 1
-        dummies_target = np.zeros(
-            [self.batch_size, seq_length_tdummies, self.data_bits],
-            dtype=np.float32)
-        targets = np.concatenate([dummies_target] + x_last, axis=1)
-
-        # data of x and dummies
-        xx = [
-            self.augment(
-                seq,
-                markers,
-                ctrl_start=[
-                    1,
-                    0],
-                add_marker_data=True,
-                add_marker_dummy=False) for seq in x]
-
-        # data of x
-        data_1 = [arr for a in xx for arr in a[:-1]]
+        x = [self.random_bits((self.batch_size, n, self.data_bits))
+             for n in seq_length]
 
-        # this is a marker between sub sequence x and dummies
-        inter_seq = self.add_ctrl(
-            np.zeros((self.batch_size, 1, self.data_bits)), ctrl_inter, pos)
+        # create the layout of the sequence
+        layout = self.create_layout()
+        for a in x:
+            # marker at the beginning of x followed by x
+            layout.add_marker(ctrl_x)
+            layout.add_data(a)
 
-        # dummies of x
-        x_dummy_last = [a[:, None, -1, :] for b in xx for a in b[-1:]]
+        # this is a marker between sub sequence x and dummies
+        layout.add_marker(ctrl_inter)
 
-        # concatenate all parts of the inputs
-        inputs = np.concatenate(data_1 + [inter_seq] + x_dummy_last, axis=1)
+        # dummies of the last items of xs
+        for a in x:
+            layout.add_dummies(a[:, None, -1, :])
 
         # PyTorch variables
-        inputs = torch.from_numpy(inputs).type(self.dtype)
-        targets = torch.from_numpy(targets).type(self.dtype)
-        # TODO: batch might have different sequence lengths
-        mask_all = inputs[..., 0:self.control_bits] == 1
-        mask = mask_all[..., 0]
-        for i in range(self.control_bits):
-            mask = mask_all[..., i] * mask
-
-        # TODO: fix the batch indexing
-        # rest channel values of data dummies
-        inputs[:, mask[0], 0:self.control_bits] = 0
+        inputs, targets, mask = self.build_layout(layout)
 
         # Return tuples.
         data_tuple = DataTuple(inputs, targets)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""sequence_layout.py: contains builder of sequences composed of markers, data segments and dummies"""
+__author__ = "Tomasz Kornuta"
+
+import collections
+import numpy as np
+import torch
+
+
+_Segment = collections.namedtuple(
+    'Segment', ('offset', 'length', 'ctrl', 'data', 'targets', 'masked'))
+
+
+class SequenceLayout(object):
+    """
+    Builder of sequences of composite algorithmic problems.
+
+    The sequence is described as a succession of segments (markers, data
+    subsequences and dummies), each one with its own control bits. Dummies are
+    the items on which the model is supposed to output the targets, so they
+    form the mask. Only the layout is stored when segments are added: the
+    final length is known before any buffer is created, so build() allocates
+    the inputs, targets and mask once and writes every segment into them
+    exactly once.
+
+    """
+
+    def __init__(self, batch_size, control_bits, data_bits, target_bits=None):
+        """
+        Initializes an empty layout.
+
+        :param batch_size: Size of the batch.
+        :param control_bits: Number of control bits of an item.
+        :param data_bits: Number of data bits of an input item.
+        :param target_bits: Number of bits of a target item (DEFAULT: data_bits).
+
+        """
+        self.batch_size = batch_size
+        self.control_bits = control_bits
+        self.data_bits = data_bits
+        self.target_bits = data_bits if target_bits is None else target_bits
+
+        # List of segments and the total length of the sequence.
+        self.segments = []
+        self.length = 0
+
+    def add_segment(self, length, ctrl=None, data=None,
+                    targets=None, masked=False):
+        """
+        Appends a segment to the layout.
+
+        :param length: Number of items in the segment.
+        :param ctrl: Control bits set in all items of the segment (DEFAULT: None, i.e. zeros).
+        :param data: Data bits [BATCH_SIZE, length, DATA_BITS] (DEFAULT: None, i.e. zeros).
+        :param targets: Targets [BATCH_SIZE, length, TARGET_BITS] (DEFAULT: None, i.e. zeros).
+        :param masked: Flag indicating whether the segment belongs to the mask.
+        :returns: Offset of the segment in the sequence.
+
+        """
+        offset = self.length
+        self.segments.append(
+            _Segment(offset, length, ctrl, data, targets, masked))
+        self.length += length
+        return offset
+
+    def add_marker(self, ctrl):
+        """
+        Appends a single item with given control bits and no data.
+
+        :param ctrl: Control bits of the marker.
+        :returns: Offset of the marker in the sequence.
+
+        """
+        return self.add_segment(1, ctrl=ctrl)
+
+    def add_data(self, data, ctrl=None):
+        """
+        Appends a subsequence of data items.
+
+        :param data: Data bits [BATCH_SIZE, LENGTH, DATA_BITS].
+        :param ctrl: Control bits (DEFAULT: None, i.e. zeros).
+        :returns: Offset of the subsequence in the sequence.
+
+        """
+        return self.add_segment(data.shape[1], ctrl=ctrl, data=data)
+
+    def add_dummies(self, targets=None, length=None, ctrl=None, data=None):
+        """
+        Appends dummy items, i.e. the ones that belong to the mask and on which
+        the targets are expected.
+
+        :param targets: Targets [BATCH_SIZE, LENGTH, TARGET_BITS] (DEFAULT: None, i.e. zeros).
+        :param length: Number of items (DEFAULT: None, i.e. taken from targets).
+        :param ctrl: Control bits (DEFAULT: None, i.e. zeros).
+        :param data: Data bits [BATCH_SIZE, LENGTH, DATA_BITS] (DEFAULT: None, i.e. zeros).
+        :returns: Offset of the dummies in the sequence.
+
+        """
+        if length is None:
+            length = targets.shape[1]
+        return self.add_segment(length, ctrl=ctrl, data=data,
+                                targets=targets, masked=True)
+
+    def build(self):
+        """
+        Creates the inputs, targets and mask - every segment is written into
+        the preallocated buffers exactly once.
+
+        :returns: Tuple of numpy arrays: inputs [BATCH_SIZE, LENGTH, CONTROL_BITS+DATA_BITS], \
+        targets [BATCH_SIZE, LENGTH, TARGET_BITS] and mask [BATCH_SIZE, LENGTH] (uint8).
+
+        """
+        inputs = np.zeros([self.batch_size, self.length,
+                           self.control_bits + self.data_bits], dtype=np.float32)
+        targets = np.zeros([self.batch_size, self.length,
+                            self.target_bits], dtype=np.float32)
+        mask = np.zeros([self.batch_size, self.length], dtype=np.uint8)
+
+        self.write_segments(inputs, targets, mask, lambda ctrl: ctrl)
+        return inputs, targets, mask
+
+    def build_tensors(self, dtype, device):
+        """
+        Creates the inputs, targets and mask directly as tensors of a given
+        type on a given device - data and targets of segments must be tensors
+        (on the same device) as well.
+
+        :param dtype: Type of inputs and targets (e.g. torch.float32).
+        :param device: Device on which the tensors are created.
+        :returns: Tuple of inputs, targets and mask (uint8) tensors.
+
+        """
+        inputs = torch.zeros([self.batch_size, self.length,
+                              self.control_bits + self.data_bits], dtype=dtype, device=device)
+        targets = torch.zeros([self.batch_size, self.length,
+                               self.target_bits], dtype=dtype, device=device)
+        mask = torch.zeros([self.batch_size, self.length],
+                           dtype=torch.uint8, device=device)
+
+        self.write_segments(inputs, targets, mask, lambda ctrl: torch.as_tensor(
+            np.asarray(ctrl), dtype=dtype, device=device))
+        return inputs, targets, mask
+
+    def write_segments(self, inputs, targets, mask, as_ctrl):
+        """
+        Writes every segment into the (zeroed) buffers.
+
+        :param inputs: Buffer for inputs [BATCH_SIZE, LENGTH, CONTROL_BITS+DATA_BITS].
+        :param targets: Buffer for targets [BATCH_SIZE, LENGTH, TARGET_BITS].
+        :param mask: Buffer for mask [BATCH_SIZE, LENGTH].
+        :param as_ctrl: Function converting control bits to the type of buffers.
+
+        """
+        for segment in self.segments:
+            items = slice(segment.offset, segment.offset + segment.length)
+            if segment.ctrl is not None:
+                inputs[:, items, 0:len(segment.ctrl)] = as_ctrl(segment.ctrl)
+            if segment.data is not None:
+                inputs[:, items, self.control_bits:] = segment.data
+            if segment.targets is not None:
+                targets[:, items, :] = segment.targets
+            if segment.masked:
+                mask[:, items] = 1
+
+    def concatenate(self):
+        """
+        Creates the inputs, targets and mask in the way the composite problems
+        used to, i.e. by inserting control bits into every segment, marking
+        dummies with all control bits set, concatenating the segments and then
+        recovering the mask from the control bits. Kept as a reference for
+        the equivalence checks and benchmarks of build().
+
+        :returns: Tuple of numpy arrays (the same as returned by build()).
+
+        """
+        pos = [0] * self.control_bits
+        ctrl_dummy = np.ones(self.control_bits)
+
+        # Augment every segment with control bits.
+        parts = []
+        for segment in self.segments:
+            data = segment.data
+            if data is None:
+                data = np.zeros(
+                    (self.batch_size, segment.length, self.data_bits))
+            ctrl = segment.ctrl
+            if ctrl is None:
+                ctrl = np.zeros(self.control_bits)
+            if segment.masked:
+                ctrl = ctrl_dummy
+            parts.append(np.insert(data, pos, ctrl, axis=-1))
+        inputs = np.concatenate(parts, axis=1).astype(np.float32)
+
+        # Find the dummies.
+        mask_all = inputs[:, :, 0:self.control_bits] == 1
+        mask = mask_all[..., 0]
+        for i in range(self.control_bits):
+            mask = mask_all[..., i] * mask
+
+        # Reset control bits of the dummies.
+        inputs[:, mask[0], 0:self.control_bits] = 0
+        for segment in self.segments:
+            if segment.masked and segment.ctrl is not None:
+                inputs[:, segment.offset:segment.offset + segment.length,
+                       0:len(segment.ctrl)] = segment.ctrl
+
+        # Scatter the targets into the dummies.
+        target = np.concatenate(
+            [segment.targets if segment.targets is not None else
+             np.zeros((self.batch_size, segment.length, self.target_bits))
+             for segment in self.segments if segment.masked], axis=1)
+        targets = np.zeros([self.batch_size, self.length,
+                            self.target_bits], dtype=np.float32)
+        targets[:, mask[0], :] = target
+
+        return inputs, targets, mask.astype(np.uint8)
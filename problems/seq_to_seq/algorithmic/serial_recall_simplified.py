@@ -66,48 +66,56 @@ class SerialRecallSimplified(AlgorithmicSeqToSeqProblem):
         :return: Output [BATCH_SIZE, 2*SEQ_LENGTH, DATA_BITS],
         :return: Mask [BATCH_SIZE, 2*SEQ_LENGTH]
 
-        TODO: every item in batch has now the same seq_length.
+        If per_sample_lengths is set, every sample has a sequence of different
+        length, padded (with zeros) to the longest one.
 
         """
-        # Set sequence length.
-        seq_length = np.random.randint(
-            self.min_sequence_length, self.max_sequence_length + 1)
+        # Set sequence lengths - one per sample [BATCH_SIZE].
+        seq_lengths = self.generate_sequence_lengths()
+        # Length of the longest sequence - the rest will be padded.
+        seq_length = int(seq_lengths.max())
 
         # Generate batch of random bit sequences [BATCH_SIZE x SEQ_LENGTH X
         # DATA_BITS]
-        bit_seq = np.random.binomial(
-            1, self.bias, (self.batch_size, seq_length, self.data_bits))
+        bit_seq = self.random_bits(
+            (self.batch_size, seq_length, self.data_bits))
+        # Clear the items exceeding the sequence lengths of given samples.
+        bit_seq *= self.as_array(
+            self.sequence_mask(seq_lengths, seq_length)[:, :, np.newaxis])
+
+        # Generate target mask: [BATCH_SIZE, 2*SEQ_LENGTH]
+        mask = self.sequence_mask(2 * seq_lengths, 2 * seq_length) & \
+            ~self.sequence_mask(seq_lengths, 2 * seq_length)
 
         # Generate input:  [BATCH_SIZE, 2*SEQ_LENGTH, CONTROL_BITS+DATA_BITS]
-        inputs = np.zeros([self.batch_size, 2 *
-                           seq_length, self.control_bits +
-                           self.data_bits], dtype=np.float32)
+        inputs = self.zeros([self.batch_size, 2 *
+                             seq_length, self.control_bits +
+                             self.data_bits])
         # Set memorization bit for the whole bit sequence that need to be
         # memorized.
-        inputs[:, seq_length:, 0] = 1
+        inputs[:, :, 0] = self.as_array(mask)
         # Set bit sequence.
         inputs[:, :seq_length, self.control_bits:self.control_bits +
                self.data_bits] = bit_seq
 
         # Generate target:  [BATCH_SIZE, 2*SEQ_LENGTH, DATA_BITS] (only data
         # bits!)
-        targets = np.zeros([self.batch_size, 2 * seq_length,
-                            self.data_bits], dtype=np.float32)
-        # Set bit sequence.
-        targets[:, seq_length:, :] = bit_seq
+        targets = self.zeros([self.batch_size, 2 * seq_length,
+                              self.data_bits])
+        # Set bit sequence - right after the sequence of every sample.
+        targets[self.item_positions(seq_lengths, seq_length)] = bit_seq
 
-        # Generate target mask: [BATCH_SIZE, 2*SEQ_LENGTH]
-        mask = torch.zeros([self.batch_size, 2 * seq_length]
-                           ).type(torch.ByteTensor)
-        mask[:, seq_length:] = 1
+        mask = self.as_mask(mask)
+        # Generate padding mask: [BATCH_SIZE, 2*SEQ_LENGTH]
+        padding_mask = self.padding_mask(2 * seq_lengths, 2 * seq_length)
 
         # PyTorch variables.
-        ptinputs = torch.from_numpy(inputs).type(self.dtype)
-        pttargets = torch.from_numpy(targets).type(self.dtype)
+        ptinputs = self.as_tensor(inputs)
+        pttargets = self.as_tensor(targets)
 
         # Return tuples.
         data_tuple = DataTuple(ptinputs, pttargets)
-        aux_tuple = AlgSeqAuxTuple(mask, seq_length, 1)
+        aux_tuple = AlgSeqAuxTuple(mask, seq_length, 1, padding_mask)
 
         return data_tuple, aux_tuple
 
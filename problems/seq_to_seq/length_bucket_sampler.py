@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""length_bucket_sampler.py: contains sampler grouping sequences of similar lengths into batches"""
+__author__ = "Tomasz Kornuta"
+
+import numpy as np
+
+
+class LengthBucketSampler(object):
+    """
+    Sampler drawing batches of items of similar lengths, shared by sequential
+    problems.
+
+    The population of items (e.g. samples of a dataset or possible values of
+    sequence length) is split into buckets using the provided length
+    boundaries. For every batch a single bucket is drawn with probability
+    proportional to its size, then all items are drawn (uniformly) from that
+    bucket. Hence every item is still drawn with the same probability, i.e.
+    the overall length distribution is preserved, whereas padding to the
+    longest sequence in batch (and the resulting useless steps of recurrent
+    models) is limited to the width of a bucket.
+
+    Buckets are indexed by the configured boundaries (i.e. the i-th bucket
+    always covers the same range of lengths), empty buckets are kept with
+    probability 0.
+
+    """
+
+    def __init__(self, lengths, boundaries, replacement=True):
+        """
+        Initializes the sampler: assigns items to buckets.
+
+        :param lengths: Array of lengths of items in the population.
+        :param boundaries: List of (ascending) lengths separating the buckets, \
+        e.g. [5, 10] results in buckets: [.., 5), [5, 10) and [10, ..].
+        :param replacement: Draw items with replacement (DEFAULT: True). Without \
+        replacement batches drawn from buckets smaller than batch size are smaller.
+
+        """
+        self.boundaries = sorted(boundaries)
+        self.replacement = replacement
+
+        # Bucket statistics: number of batches drawn from every bucket.
+        self.bucket_counts = np.zeros(len(self.boundaries) + 1, dtype=np.int64)
+        self.last_bucket = -1
+
+        self.set_lengths(lengths)
+
+    def set_lengths(self, lengths):
+        """
+        Assigns a new population of items to the buckets (e.g. when the range
+        of lengths was changed by curriculum learning), keeping the statistics
+        of drawn batches.
+
+        :param lengths: Array of lengths of items in the population.
+
+        """
+        self.lengths = np.asarray(lengths)
+
+        # Assign items to buckets (some of them can be empty).
+        bucket_ids = np.digitize(self.lengths, self.boundaries)
+        self.buckets = [np.flatnonzero(bucket_ids == b)
+                        for b in range(len(self.boundaries) + 1)]
+
+        # Probability of drawing a given bucket - proportional to its size.
+        sizes = np.array([len(bucket) for bucket in self.buckets])
+        self.probabilities = sizes / sizes.sum()
+
+    def sample(self, batch_size):
+        """
+        Draws indices of items forming a single batch.
+
+        :param batch_size: Size of the batch.
+        :returns: Array of indices of items (all belonging to a single bucket).
+
+        """
+        self.last_bucket = np.random.choice(
+            len(self.buckets), p=self.probabilities)
+        self.bucket_counts[self.last_bucket] += 1
+
+        bucket = self.buckets[self.last_bucket]
+        if self.replacement:
+            return np.random.choice(bucket, size=batch_size)
+        return np.random.choice(
+            bucket, size=min(batch_size, len(bucket)), replace=False)
+
+    def sample_lengths(self, batch_size):
+        """
+        Draws lengths of items forming a single batch.
+
+        :param batch_size: Size of the batch.
+        :returns: Array of lengths.
+
+        """
+        return self.lengths[self.sample(batch_size)]
+
+    def bucket_ranges(self):
+        """
+        Returns list of configured ranges of lengths [low, high) of buckets (None for unbounded ends).
+        """
+        return list(zip([None] + self.boundaries, self.boundaries + [None]))
+
+    def summarize(self):
+        """
+        Summarizes the buckets: ranges of lengths, sizes and numbers of drawn batches.
+
+        :returns: Summary string.
+
+        """
+        summary_str = ''
+        for index, ((low, high), bucket, p, count) in enumerate(zip(
+                self.bucket_ranges(), self.buckets, self.probabilities, self.bucket_counts)):
+            summary_str += 'bucket {} [{}, {}): items {}; probability {:.4f}; batches {}\n'.format(
+                index, '..' if low is None else low, '..' if high is None else high, len(bucket), p, count)
+        return summary_str
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+bleu.py: BLEU score computed on tensors of word indexes, for a whole batch at once.
+
+Follows nltk.translate.bleu_score (single reference, uniform weights of 1-4 grams, smoothing method1):
+sentence_bleu() corresponds to bleu_from_counts(*bleu_counts(...)), corpus_bleu() to CorpusBLEU.
+Running the module compares both against nltk on random sequences.
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import torch
+
+
+def sequence_lengths(indexes, pad_token=0, eos_token=2):
+    """
+    Computes the lengths of sequences, i.e. positions of the first EOS (or PAD) token.
+
+    :param indexes: Tensor of word indexes [BATCH_SIZE x SEQ_LENGTH].
+    :param pad_token: Index of the PAD token (DEFAULT: 0).
+    :param eos_token: Index of the EOS token (DEFAULT: 2).
+    :return: Tensor of lengths [BATCH_SIZE].
+
+    """
+    stop = (indexes == eos_token) | (indexes == pad_token)
+    # argmax returns the first maximal value - i.e. the first stop token.
+    first_stop = stop.long().argmax(dim=1)
+    return torch.where(stop.any(dim=1), first_stop,
+                       torch.full_like(first_stop, indexes.size(1)))
+
+
+def ngram_counts(hypotheses, hyp_lengths, references, ref_lengths, n):
+    """
+    Counts the n-grams of hypotheses and the ones matching the references
+    (with counts clipped by the reference counts).
+
+    :param hypotheses: Tensor of predicted word indexes [BATCH_SIZE x HYP_LENGTH].
+    :param hyp_lengths: Lengths of hypotheses [BATCH_SIZE].
+    :param references: Tensor of reference word indexes [BATCH_SIZE x REF_LENGTH].
+    :param ref_lengths: Lengths of references [BATCH_SIZE].
+    :param n: Order of n-grams.
+    :return: Number of matching n-grams [BATCH_SIZE], number of n-grams of hypotheses [BATCH_SIZE].
+
+    """
+    batch_size = hypotheses.size(0)
+    if hypotheses.size(1) < n or references.size(1) < n:
+        total = (hyp_lengths - n + 1).clamp(min=0)
+        return torch.zeros_like(total), total
+
+    # n-grams at all positions [BATCH_SIZE x NUM_NGRAMS x n], masks of the ones within the sequences.
+    hyp_ngrams = hypotheses.unfold(1, n, 1)
+    ref_ngrams = references.unfold(1, n, 1)
+    hyp_valid = torch.arange(hyp_ngrams.size(1), device=hypotheses.device).expand(
+        batch_size, -1) <= (hyp_lengths - n).unsqueeze(1)
+    ref_valid = torch.arange(ref_ngrams.size(1), device=references.device).expand(
+        batch_size, -1) <= (ref_lengths - n).unsqueeze(1)
+
+    # Pairwise equality of n-grams of hypotheses with themselves and with references.
+    hyp_hyp = (hyp_ngrams.unsqueeze(2) == hyp_ngrams.unsqueeze(1)).all(dim=-1) & hyp_valid.unsqueeze(1)
+    hyp_ref = (hyp_ngrams.unsqueeze(2) == ref_ngrams.unsqueeze(1)).all(dim=-1) & ref_valid.unsqueeze(1)
+    hyp_count = hyp_hyp.sum(dim=2)
+    ref_count = hyp_ref.sum(dim=2)
+
+    # Count every distinct n-gram once: at its first occurrence.
+    earlier = torch.ones_like(hyp_hyp[0]).tril(diagonal=-1)
+    first = hyp_valid & ~(hyp_hyp & earlier).any(dim=2)
+
+    matches = (torch.min(hyp_count, ref_count) * first.long()).sum(dim=1)
+    return matches, hyp_valid.long().sum(dim=1)
+
+
+def bleu_counts(hypotheses, references, max_n=4, pad_token=0, eos_token=2):
+    """
+    Computes the statistics of BLEU score of every pair of sequences of a batch.
+    Sequences end at the first EOS (or PAD) token.
+
+    :param hypotheses: Tensor of predicted word indexes [BATCH_SIZE x HYP_LENGTH].
+    :param references: Tensor of reference word indexes [BATCH_SIZE x REF_LENGTH].
+    :param max_n: Maximal order of n-grams (DEFAULT: 4).
+    :param pad_token: Index of the PAD token (DEFAULT: 0).
+    :param eos_token: Index of the EOS token (DEFAULT: 2).
+    :return: numerators [BATCH_SIZE x max_n], denominators [BATCH_SIZE x max_n] of modified precisions, \
+    lengths of hypotheses [BATCH_SIZE], lengths of references [BATCH_SIZE].
+
+    """
+    hyp_lengths = sequence_lengths(hypotheses, pad_token, eos_token)
+    ref_lengths = sequence_lengths(references, pad_token, eos_token)
+
+    numerators = []
+    denominators = []
+    for n in range(1, max_n + 1):
+        matches, total = ngram_counts(hypotheses, hyp_lengths, references, ref_lengths, n)
+        numerators.append(matches)
+        # As in nltk: the denominator is at least 1.
+        denominators.append(total.clamp(min=1))
+
+    return torch.stack(numerators, dim=-1), torch.stack(denominators, dim=-1), hyp_lengths, ref_lengths
+
+
+def bleu_from_counts(numerators, denominators, hyp_lengths, ref_lengths, epsilon=0.1):
+    """
+    Computes BLEU score(s) from the statistics returned by bleu_counts()
+    (per sentence) or from their sums (corpus).
+
+    :param numerators: Numerators of modified precisions [... x max_n].
+    :param denominators: Denominators of modified precisions [... x max_n].
+    :param hyp_lengths: Lengths of hypotheses [...].
+    :param ref_lengths: Lengths of references [...].
+    :param epsilon: Added to null numerators (smoothing method1, DEFAULT: 0.1).
+    :return: Tensor of BLEU scores [...] (float64).
+
+    """
+    numerators = numerators.double()
+    denominators = denominators.double()
+    hyp_lengths = hyp_lengths.double()
+    ref_lengths = ref_lengths.double()
+
+    # Smoothing: epsilon counts of n-grams with no matches.
+    precisions = torch.where(numerators == 0, epsilon / denominators, numerators / denominators)
+    # Uniform weights: geometric mean of precisions.
+    score = torch.exp(torch.log(precisions).mean(dim=-1))
+
+    # Brevity penalty.
+    penalty = torch.where(hyp_lengths > ref_lengths, torch.ones_like(hyp_lengths),
+                          torch.exp(1 - ref_lengths / hyp_lengths.clamp(min=1)))
+    penalty = torch.where(hyp_lengths == 0, torch.zeros_like(penalty), penalty)
+
+    # No matching unigrams: score is 0.
+    return torch.where(numerators[..., 0] == 0, torch.zeros_like(score), score * penalty)
+
+
+class CorpusBLEU(object):
+    """
+    Accumulator of the statistics of BLEU score over batches, returning the
+    corpus-level BLEU score (e.g. of the whole validation or test set).
+
+    """
+
+    def __init__(self, max_n=4):
+        """
+        Constructor.
+
+        :param max_n: Maximal order of n-grams (DEFAULT: 4).
+
+        """
+        self.max_n = max_n
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the accumulated statistics.
+        """
+        self.numerators = torch.zeros(self.max_n, dtype=torch.int64)
+        self.denominators = torch.zeros(self.max_n, dtype=torch.int64)
+        self.hyp_length = torch.zeros((), dtype=torch.int64)
+        self.ref_length = torch.zeros((), dtype=torch.int64)
+
+    def accumulate(self, numerators, denominators, hyp_lengths, ref_lengths):
+        """
+        Adds the statistics of a batch (returned by bleu_counts()).
+        """
+        self.numerators += numerators.sum(dim=0).cpu()
+        self.denominators += denominators.sum(dim=0).cpu()
+        self.hyp_length += hyp_lengths.sum().cpu()
+        self.ref_length += ref_lengths.sum().cpu()
+
+    def score(self):
+        """
+        Returns the corpus-level BLEU score (0 if nothing was accumulated).
+        """
+        return bleu_from_counts(self.numerators, self.denominators.clamp(min=1),
+                                self.hyp_length, self.ref_length).item()
+
+
+if __name__ == "__main__":
+    """
+    Compares the scores with nltk.
+    """
+    from nltk.translate.bleu_score import sentence_bleu, corpus_bleu, SmoothingFunction
+
+    torch.manual_seed(0)
+    batch_size, seq_length, vocab_size = 200, 15, 8
+    # Small vocabulary (many matches), EOS (2) at random positions, followed by PAD (0).
+    hypotheses = torch.randint(3, vocab_size, (batch_size, seq_length))
+    references = torch.randint(3, vocab_size, (batch_size, seq_length))
+    references[:100] = hypotheses[:100].roll(1, dims=1)
+    for indexes in [hypotheses, references]:
+        lengths = torch.randint(0, seq_length + 1, (batch_size,))
+        for i, length in enumerate(lengths.tolist()):
+            if length < seq_length:
+                indexes[i, length] = 2
+                indexes[i, length + 1:] = 0
+
+    counts = bleu_counts(hypotheses, references)
+    scores = bleu_from_counts(*counts)
+    corpus = CorpusBLEU()
+    corpus.accumulate(*counts)
+
+    def words(indexes):
+        length = sequence_lengths(indexes.unsqueeze(0))[0].item()
+        return [str(index) for index in indexes[:length].tolist()]
+
+    smoothing = SmoothingFunction().method1
+    hyps = [words(h) for h in hypotheses]
+    refs = [[words(r)] for r in references]
+    nltk_scores = torch.tensor([sentence_bleu(r, h, smoothing_function=smoothing)
+                                for h, r in zip(hyps, refs)], dtype=torch.float64)
+    nltk_corpus = corpus_bleu(refs, hyps, smoothing_function=smoothing)
+
+    print('Max difference of sentence scores: ', (scores - nltk_scores).abs().max().item())
+    print('Corpus score: {} (nltk: {})'.format(corpus.score(), nltk_corpus))
+    assert torch.allclose(scores, nltk_scores, atol=1e-12)
+    assert abs(corpus.score() - nltk_corpus) < 1e-12
@@ -47,9 +47,11 @@ __author__ = "Vincent Marois"
 import collections
 import unicodedata
 import re
+import numpy as np
 import torch
 import torch.nn as nn
 from problems.seq_to_seq.seq_to_seq_problem import SeqToSeqProblem
+from problems.seq_to_seq.text2text.bleu import bleu_counts, bleu_from_counts, CorpusBLEU
 
 _TextAuxTuple = collections.namedtuple(
     'TextAuxTuple',
@@ -73,6 +75,42 @@ class TextAuxTuple(_TextAuxTuple):
     __slots__ = ()
 
 
+class LazySentences(object):
+    """
+    Read-only list of the sentences of a batch, viewing the (shared) list of
+    pairs of sentences. Sentences are retrieved only when accessed, e.g. for
+    computing the BLEU score or for visualization.
+
+    """
+
+    def __init__(self, pairs, indexes, side):
+        """
+        Constructor.
+
+        :param pairs: list of pairs of sentences.
+        :param indexes: indexes of the pairs forming the batch.
+        :param side: 0 for input sentences, 1 for output sentences.
+
+        """
+        self.pairs = pairs
+        self.indexes = indexes
+        self.side = side
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.pairs[int(self.indexes[i])][self.side]
+
+    def __iter__(self):
+        return (self.pairs[int(index)][self.side] for index in self.indexes)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 # global tokens
 PAD_token = 0
 SOS_token = 1
@@ -102,14 +140,20 @@ class TextToTextProblem(SeqToSeqProblem):
         # padding elements.
         self.loss_function = nn.NLLLoss(size_average=True, ignore_index=0)
 
+        # statistics of BLEU score accumulated over all batches
+        self.corpus_bleu = CorpusBLEU()
+
     def compute_BLEU_score(self, data_tuple, logits, aux_tuple):
         """
         Compute BLEU score in order to evaluate the translation quality
         (equivalent of accuracy) Reference paper:
-        http://www.aclweb.org/anthology/P02-1040.pdf Implementation inspired
-        from https://machinelearningmastery.com/calculate-bleu-score-for-text-
-        python/ To deal with the batch, we accumulate the individual bleu score
-        for each pair of sentences and average over the batch size.
+        http://www.aclweb.org/anthology/P02-1040.pdf To deal with the batch,
+        we compute the individual bleu score for each pair of sentences and
+        average over the batch size.
+
+        The scores are computed on the tensors of indexes (see bleu.py), with
+        the same results as nltk sentence_bleu() (with smoothing method1).
+        Predicted and target sentences end at their first EOS (or PAD) token.
 
         :param data_tuple: DataTuple(input_tensors, target_tensors)
         :param logits: predictions of the model
@@ -117,35 +161,26 @@ class TextToTextProblem(SeqToSeqProblem):
 
         :return: Average BLEU Score for the batch ( 0 < BLEU < 1)
 
+        """
+        counts = self.compute_BLEU_counts(data_tuple, logits)
+        return round(bleu_from_counts(*counts).mean().item(), 4)
+
+    def compute_BLEU_counts(self, data_tuple, logits):
+        """
+        Computes the statistics of BLEU score (n-gram matches & lengths) of
+        every pair of predicted and target sentences of the batch.
+
+        :param data_tuple: DataTuple(input_tensors, target_tensors)
+        :param logits: predictions of the model
+
+        :return: tuple of tensors (see bleu.bleu_counts())
+
         """
         # get most probable words indexes for the batch
-        _, top_indexes = logits.topk(k=1, dim=-1)
-        logits = top_indexes.squeeze()
-        batch_size = logits.shape[0]
-
-        from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-
-        # retrieve target sentences from TextAuxTuple
-        targets_text = []
-        for sentence in aux_tuple.outputs_text:
-            targets_text.append(sentence.split())
-
-        # retrieve text sentences from the logits (which should be tensors of
-        # indexes)
-        logits_text = []
-        for logit in logits:
-            logits_text.append(
-                [aux_tuple.output_lang.index2word[index.item()]
-                 for index in logit])
-
-        bleu_score = 0
-        for i in range(batch_size):
-            # compute bleu score and use a smoothing function
-            bleu_score += sentence_bleu([targets_text[i]],
-                                        logits_text[i],
-                                        smoothing_function=SmoothingFunction().method1)
-
-        return round(bleu_score / batch_size, 4)
+        predictions = logits.argmax(dim=-1)
+
+        return bleu_counts(predictions, data_tuple.targets,
+                           pad_token=PAD_token, eos_token=EOS_token)
 
     def evaluate_loss(self, data_tuple, logits, aux_tuple):
         """
@@ -176,16 +211,20 @@ class TextToTextProblem(SeqToSeqProblem):
 
     def add_statistics(self, stat_col):
         """
-        Add BLEU score to collector.
+        Add BLEU score (of the batch & of all batches so far) to collector.
 
         :param stat_col: Statistics collector.
 
         """
         stat_col.add_statistic('bleu_score', '{:4.5f}')
+        stat_col.add_statistic('corpus_bleu_score', '{:4.5f}', aggregation='last')
 
     def collect_statistics(self, stat_col, data_tuple, logits, aux_tuple):
         """
-        Collects BLEU score.
+        Collects BLEU score of the batch.
+
+        The corpus-level BLEU score is not collected for single batches - it is
+        set by collect_accumulated_statistics() for evaluated (validation/test) batches.
 
         :param stat_col: Statistics collector.
         :param data_tuple: Data tuple containing inputs and targets.
@@ -193,9 +232,35 @@ class TextToTextProblem(SeqToSeqProblem):
         :param aux_tuple: auxiliary tuple (aux_tuple).
 
         """
+        counts = self.compute_BLEU_counts(data_tuple, logits)
+        stat_col['bleu_score'] = round(bleu_from_counts(*counts).mean().item(), 4)
+        stat_col['corpus_bleu_score'] = None
+
+    def accumulate_statistics(self, data_tuple, logits, aux_tuple):
+        """
+        Accumulates BLEU statistics of an evaluated batch into the corpus-level BLEU score.
+
+        :param data_tuple: Data tuple containing inputs and targets.
+        :param logits: Logits being output of the model.
+        :param aux_tuple: auxiliary tuple (aux_tuple).
+
+        """
+        self.corpus_bleu.accumulate(*self.compute_BLEU_counts(data_tuple, logits))
 
-        stat_col['bleu_score'] = self.compute_BLEU_score(
-            data_tuple, logits, aux_tuple)
+    def collect_accumulated_statistics(self, stat_col):
+        """
+        Collects corpus-level BLEU score of all batches accumulated since the last reset_statistics().
+
+        :param stat_col: Statistics collector.
+
+        """
+        stat_col['corpus_bleu_score'] = self.corpus_bleu.score()
+
+    def reset_statistics(self):
+        """
+        Resets the statistics of corpus-level BLEU score, e.g. before a new pass over the validation/test set.
+        """
+        self.corpus_bleu.reset()
 
     def show_sample(self, data_tuple, aux_tuple, sample_number=0):
         """
@@ -312,6 +377,37 @@ class TextToTextProblem(SeqToSeqProblem):
         return [self.tensors_from_pair(
             pair, input_lang, output_lang, max_seq_length) for pair in pairs]
 
+    def padded_tensors_from_pairs(self, pairs, input_lang,
+                                  output_lang, max_seq_length):
+        """
+        Creates contiguous tensors of (padded) indexes of all pairs of
+        sentences, along with the lengths of sequences.
+
+        :param pairs: list of sentences pairs
+        :param input_lang: instance of the class Lang, having a word2index dict, representing the input language.
+        :param output_lang: instance of the class Lang, having a word2index dict, representing the output language.
+        :param max_seq_length: Maximum length for the list of indexes (passed to indexes_from_sentence())
+
+        :return: tensors of input & target indexes [NUM_PAIRS x max_seq_length] (kept on CPU, batches are moved to \
+        GPU in turn_on_cuda()), arrays of input & target lengths (including the EOS token).
+
+        """
+        inputs = np.zeros((len(pairs), max_seq_length), dtype=np.int64)
+        targets = np.zeros((len(pairs), max_seq_length), dtype=np.int64)
+        input_lengths = np.zeros(len(pairs), dtype=np.int64)
+        target_lengths = np.zeros(len(pairs), dtype=np.int64)
+
+        for i, pair in enumerate(pairs):
+            inputs[i] = self.indexes_from_sentence(
+                input_lang, pair[0], max_seq_length)
+            targets[i] = self.indexes_from_sentence(
+                output_lang, pair[1], max_seq_length)
+            input_lengths[i] = len(pair[0].split(' ')) + 1
+            target_lengths[i] = len(pair[1].split(' ')) + 1
+
+        return torch.from_numpy(inputs), torch.from_numpy(targets), \
+            input_lengths, target_lengths
+
 
 class Lang(object):
     """
@@ -348,6 +444,35 @@ class Lang(object):
         # tokens.
         self.n_words = 3
 
+    @classmethod
+    def from_vocabulary(cls, name, words, counts):
+        """
+        Creates the language from an existing vocabulary (e.g. loaded from
+        cache), without processing the sentences.
+
+        :param name: string to name the language (e.g. french, english)
+        :param words: list of all words, ordered by their indexes (starting with PAD, SOS, EOS).
+        :param counts: list of occurrences of words (starting from the word following EOS).
+        :return: Lang object.
+
+        """
+        lang = cls(name)
+        lang.index2word = dict(enumerate(words))
+        lang.word2index = {word: index for index, word in enumerate(words)}
+        lang.word2count = dict(zip(words[3:], (int(count) for count in counts)))
+        lang.n_words = len(words)
+        return lang
+
+    def vocabulary(self):
+        """
+        Returns the vocabulary of the language (see from_vocabulary()).
+
+        :return: list of words ordered by their indexes, list of occurrences of words (starting from the word following EOS).
+
+        """
+        words = [self.index2word[index] for index in range(self.n_words)]
+        return words, [self.word2count[word] for word in words[3:]]
+
     def add_sentence(self, sentence):
         """
         Process a sentence using add_word().
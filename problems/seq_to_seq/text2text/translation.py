@@ -46,15 +46,18 @@ __author__ = "Vincent Marois"
 
 import os
 import random
+import hashlib
 
 # fix the random seed for results repeatability
 # random.seed(0)
 
+import numpy as np
 import torch
 import errno
 
 from problems.problem import DataTuple
-from problems.seq_to_seq.text2text.text_to_text_problem import TextToTextProblem, Lang, TextAuxTuple
+from problems.seq_to_seq.length_bucket_sampler import LengthBucketSampler
+from problems.seq_to_seq.text2text.text_to_text_problem import TextToTextProblem, Lang, TextAuxTuple, LazySentences
 
 
 class Translation(TextToTextProblem):
@@ -101,7 +104,9 @@ class Translation(TextToTextProblem):
         self.input_lang = None  # will be a Lang instance
         self.output_lang = None  # will be a Lang instance
         self.pairs = []  # will be used to constitute TextAuxTuple
-        self.tensor_pairs = []  # will be used to constitute DataTuple
+        # padded indexes of all pairs (will be used to constitute DataTuple)
+        self.inputs = None
+        self.targets = None
 
         # for datasets storage & handling
         self.root = os.path.expanduser(params['data_folder'])
@@ -116,17 +121,45 @@ class Translation(TextToTextProblem):
         # switch between training & inference datasets
         self.use_train_data = params['use_train_data']
 
+        # cache the preprocessed corpus (pairs, vocabularies & indexes) on disk
+        # (DEFAULT: True)
+        if 'cache_preprocessing' not in params:
+            params.add_default_params({'cache_preprocessing': True})
+        self.cache_preprocessing = params['cache_preprocessing']
+
         # create corresponding Lang instances using the names
         self.input_lang = Lang('eng')
         self.output_lang = Lang(self.output_lang_name)
 
-        # preprocess source data
+        # preprocess source data (or load it from cache)
         self.download()
-        self.input_lang, self.output_lang, self.pairs = self.prepare_data()
-
-        # create tensors of indexes from string pairs
-        self.tensor_pairs = self.tensors_from_pairs(
-            self.pairs, self.input_lang, self.output_lang, self.max_sequence_length)
+        cache_file = self.cache_filename()
+        if self.cache_preprocessing and self._check_cache(cache_file):
+            print('Loading preprocessed corpus from', cache_file)
+            input_lengths, target_lengths = self.load_cache(cache_file)
+        else:
+            self.input_lang, self.output_lang, self.pairs = self.prepare_data()
+
+            # create contiguous tensors of indexes from string pairs
+            self.inputs, self.targets, input_lengths, target_lengths = self.padded_tensors_from_pairs(
+                self.pairs, self.input_lang, self.output_lang, self.max_sequence_length)
+
+            if self.cache_preprocessing:
+                self.save_cache(cache_file, input_lengths, target_lengths)
+                print('Preprocessed corpus cached in', cache_file)
+        # length of a pair: number of words (+ EOS) of the longer sentence
+        self.lengths = np.maximum(input_lengths, target_lengths)
+
+        # boundaries of buckets grouping pairs of similar lengths in a batch
+        # (DEFAULT: [], i.e. no bucketing)
+        if 'bucket_boundaries' not in params:
+            params.add_default_params({'bucket_boundaries': []})
+        self.bucket_boundaries = params['bucket_boundaries']
+        self.length_sampler = None
+        if self.bucket_boundaries:
+            self.length_sampler = LengthBucketSampler(
+                self.lengths, self.bucket_boundaries, replacement=False)
+            print("Length buckets:\n" + self.length_sampler.summarize())
 
     def prepare_data(self):
         """
@@ -186,6 +219,100 @@ class Translation(TextToTextProblem):
 
         return self.input_lang, self.output_lang, self.pairs
 
+    def source_filename(self):
+        """
+        Returns the path to the processed file (training or inference set) the pairs are read from.
+        """
+        return os.path.join(self.root, self.processed_folder,
+                            self.training_file if self.use_train_data else self.test_file)
+
+    def cache_filename(self):
+        """
+        Returns the path to the cache of the preprocessed corpus. The name of
+        the file contains a hash of all parameters affecting the
+        preprocessing: languages, training size, set, max sequence length,
+        english prefixes & reversal.
+        """
+        eng_prefixes = None if self.eng_prefixes is None else list(self.eng_prefixes)
+        key = repr((self.output_lang_name, self.training_size, self.use_train_data,
+                    self.max_sequence_length, eng_prefixes, self.reverse))
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+        return os.path.splitext(self.source_filename())[0] + '_' + digest + '.npz'
+
+    def _check_cache(self, cache_file):
+        """
+        Check if the cache exists and is not older than the file the pairs are read from.
+
+        :param cache_file: Path to the cache.
+
+        """
+        return os.path.isfile(cache_file) and \
+            os.path.getmtime(cache_file) >= os.path.getmtime(self.source_filename())
+
+    def save_cache(self, cache_file, input_lengths, target_lengths):
+        """
+        Saves the preprocessed corpus in a (compressed) .npz file: the strings
+        (pairs & vocabularies) are stored as blobs of utf-8 bytes, the indexes
+        as int32 arrays.
+
+        :param cache_file: Path to the cache.
+        :param input_lengths: Lengths of input sequences (including EOS).
+        :param target_lengths: Lengths of target sequences (including EOS).
+
+        """
+        def blob(strings):
+            return np.frombuffer('\n'.join(strings).encode('utf-8'), dtype=np.uint8)
+
+        input_words, input_counts = self.input_lang.vocabulary()
+        output_words, output_counts = self.output_lang.vocabulary()
+
+        # write to a temporary file first - concurrent runs never read a partial cache
+        tmp_file = cache_file + '.%d.tmp' % os.getpid()
+        with open(tmp_file, 'wb') as f:
+            np.savez_compressed(
+                f,
+                pairs=blob(p[0] + '\t' + p[1] for p in self.pairs),
+                input_lang=np.array(self.input_lang.name),
+                output_lang=np.array(self.output_lang.name),
+                input_words=blob(input_words),
+                output_words=blob(output_words),
+                input_counts=np.array(input_counts, dtype=np.int64),
+                output_counts=np.array(output_counts, dtype=np.int64),
+                inputs=self.inputs.cpu().numpy().astype(np.int32),
+                targets=self.targets.cpu().numpy().astype(np.int32),
+                input_lengths=input_lengths.astype(np.int32),
+                target_lengths=target_lengths.astype(np.int32))
+        os.replace(tmp_file, cache_file)
+
+    def load_cache(self, cache_file):
+        """
+        Loads the preprocessed corpus (see save_cache()): sets pairs, Lang() instances & tensors of indexes.
+
+        :param cache_file: Path to the cache.
+        :return: lengths of input & target sequences (including EOS).
+
+        """
+        def strings(blob):
+            return blob.tobytes().decode('utf-8').split('\n')
+
+        with np.load(cache_file) as cache:
+            self.pairs = [pair.split('\t') for pair in strings(cache['pairs'])]
+            self.input_lang = Lang.from_vocabulary(
+                str(cache['input_lang']), strings(cache['input_words']), cache['input_counts'])
+            self.output_lang = Lang.from_vocabulary(
+                str(cache['output_lang']), strings(cache['output_words']), cache['output_counts'])
+            self.inputs = torch.from_numpy(cache['inputs'].astype(np.int64))
+            self.targets = torch.from_numpy(cache['targets'].astype(np.int64))
+            input_lengths = cache['input_lengths'].astype(np.int64)
+            target_lengths = cache['target_lengths'].astype(np.int64)
+
+        print("Loaded %s sentence pairs" % len(self.pairs))
+        print("Number of words in I/O languages:")
+        print(self.input_lang.name, ':', self.input_lang.n_words)
+        print(self.output_lang.name, ':', self.output_lang.n_words)
+
+        return input_lengths, target_lengths
+
     def _check_exists(self):
         """
         Check if the training & inference datasets (of the specified training
@@ -322,43 +449,112 @@ class Translation(TextToTextProblem):
 
     def generate_batch(self):
         """
-        Generates a batch  of size [BATCH_SIZE, MAX_SEQUENCE_LENGTH].
+        Generates a batch  of size [BATCH_SIZE, SEQ_LENGTH], where SEQ_LENGTH
+        is the length of the longest sentence in the batch (at most
+        MAX_SEQUENCE_LENGTH). When length buckets are used, the pairs are drawn
+        from a single bucket.
 
-        :return: DataTuple: inputs [BATCH_SIZE, MAX_SEQUENCE_LENGTH], targets [BATCH_SIZE, MAX_SEQUENCE_LENGTH],
+        :return: DataTuple: inputs [BATCH_SIZE, SEQ_LENGTH], targets [BATCH_SIZE, SEQ_LENGTH],
                 TextAuxTuple: ('inputs_text', 'outputs_text', 'input_lang', 'output_lang')
 
         """
-        # generate a sample of size batch_size of random indexes without
-        # replacement
-        indexes = random.sample(population=range(
-            len(self.tensor_pairs)), k=self.batch_size)
+        if self.length_sampler is not None:
+            # generate random indexes (without replacement) of pairs from a
+            # single length bucket
+            indexes = self.length_sampler.sample(self.batch_size)
+        else:
+            # generate a sample of size batch_size of random indexes without
+            # replacement
+            indexes = random.sample(population=range(
+                len(self.pairs)), k=self.batch_size)
+
+        return self.generate_batch_from_indices(indexes)
+
+    def epoch_size(self):
+        """
+        Returns the number of pairs of sentences.
+        """
+        return len(self.pairs)
+
+    def return_epoch_generator(self, batch_size, num_workers=0, prefetch_factor=2):
+        """
+        Returns a generator yielding batches of all pairs, in order, exactly once
+        (see Problem.return_epoch_generator()).
+
+        Batches of the epoch are not drawn from length buckets, so the length
+        sampler is bypassed while the generator runs (i.e. index of the bucket
+        is not collected) and restored when it finishes.
+
+        """
+        loader = super(Translation, self).return_epoch_generator(
+            batch_size, num_workers, prefetch_factor)
+
+        def epoch_generator():
+            length_sampler, self.length_sampler = self.length_sampler, None
+            try:
+                for batch in loader:
+                    yield batch
+            finally:
+                self.length_sampler = length_sampler
+
+        return epoch_generator()
+
+    def generate_batch_from_indices(self, indexes):
+        """
+        Generates a batch of given pairs of sentences, of size [BATCH_SIZE, SEQ_LENGTH], where SEQ_LENGTH is the
+        length of the longest sentence in the batch.
 
-        # create main batch inputs & outputs tensor
-        inputs = torch.zeros(self.batch_size, self.max_sequence_length).type(
-            self.app_state.LongTensor)
-        targets = torch.zeros(self.batch_size, self.max_sequence_length).type(
-            self.app_state.LongTensor)
+        :param indexes: Indexes of pairs.
+        :return: DataTuple: inputs [BATCH_SIZE, SEQ_LENGTH], targets [BATCH_SIZE, SEQ_LENGTH],
+                TextAuxTuple: ('inputs_text', 'outputs_text', 'input_lang', 'output_lang')
 
-        # for TextAuxTuple
-        inputs_text = []
-        targets_text = []
+        """
+        indexes = np.asarray(indexes)
 
-        for i, index in enumerate(indexes):
-            input_tensor, target_tensor = self.tensor_pairs[index]
-            input_text, target_text = self.pairs[index]
+        # trim the batch to its longest sentence
+        seq_length = int(self.lengths[indexes].max())
 
-            inputs[i] = input_tensor
-            targets[i] = target_tensor
-            inputs_text.append(input_text)
-            targets_text.append(target_text)
+        # gather the pairs with a single index_select (on CPU, so that batches
+        # can be generated by DataLoader workers - moved to GPU in turn_on_cuda())
+        index_tensor = torch.from_numpy(indexes)
+        inputs = self.inputs[:, :seq_length].index_select(0, index_tensor)
+        targets = self.targets[:, :seq_length].index_select(0, index_tensor)
 
-        # Return tuples.
+        # Return tuples - sentences are retrieved only when needed.
         data_tuple = DataTuple(inputs, targets)
         aux_tuple = TextAuxTuple(
-            inputs_text, targets_text, self.input_lang, self.output_lang)
+            LazySentences(self.pairs, indexes, 0), LazySentences(self.pairs, indexes, 1),
+            self.input_lang, self.output_lang)
 
         return data_tuple, aux_tuple
 
+    def add_statistics(self, stat_col):
+        """
+        Add BLEU score and (if used) index of the length bucket to collector.
+
+        :param stat_col: Statistics collector.
+
+        """
+        super(Translation, self).add_statistics(stat_col)
+        if self.length_sampler is not None:
+            stat_col.add_statistic('bucket', '{:d}')
+
+    def collect_statistics(self, stat_col, data_tuple, logits, aux_tuple):
+        """
+        Collects BLEU score and (if used) index of the length bucket.
+
+        :param stat_col: Statistics collector.
+        :param data_tuple: Data tuple containing inputs and targets.
+        :param logits: Logits being output of the model.
+        :param aux_tuple: auxiliary tuple (aux_tuple).
+
+        """
+        super(Translation, self).collect_statistics(
+            stat_col, data_tuple, logits, aux_tuple)
+        if 'bucket' in stat_col.statistics:
+            # Not collected for batches of the epoch generator.
+            stat_col['bucket'] = None if self.length_sampler is None else int(self.length_sampler.last_bucket)
+
     def plot_preprocessing(self, data_tuple, aux_tuple, logits):
         """
         Does some preprocessing to logits to then plot the attention weights
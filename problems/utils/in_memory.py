@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""in_memory.py: helpers of problems keeping their datasets in memory - loading of torchvision datasets and sampling of batches epoch by epoch"""
+__author__ = "Tomasz Kornuta"
+
+import os
+import numpy as np
+import torch
+
+from problems.utils.shared_arrays import dataset_key, shared_tensor
+
+
+def load_torchvision_dataset(dataset, start_index, stop_index, shared=False):
+    """
+    Loads (a range of) samples of a torchvision dataset (e.g. MNIST or CIFAR10) into memory, as a single uint8
+    tensor of images [N x C x H x W] and a tensor of labels.
+
+    :param dataset: torchvision dataset.
+    :param start_index: Index of the first sample.
+    :param stop_index: Index following the last sample.
+    :param shared: Share the tensors with other processes on the node (see shared_arrays.py) (DEFAULT: False).
+    :return: Tensor of images, tensor of labels (int64).
+
+    """
+    # Newer torchvision keeps samples in data/targets, older in train_/test_ attributes.
+    if hasattr(dataset, 'data'):
+        data, targets = dataset.data, dataset.targets
+    elif dataset.train:
+        data, targets = dataset.train_data, dataset.train_labels
+    else:
+        data, targets = dataset.test_data, dataset.test_labels
+
+    def load_images():
+        images = torch.as_tensor(np.asarray(data))[start_index:stop_index]
+        if images.dim() == 3:
+            # Grayscale images [N x H x W].
+            images = images.unsqueeze(1)
+        else:
+            # Color images [N x H x W x C].
+            images = images.permute(0, 3, 1, 2)
+        return images.contiguous()
+
+    def load_labels():
+        return torch.as_tensor(np.asarray(targets), dtype=torch.int64)[start_index:stop_index]
+
+    if not shared:
+        return load_images(), load_labels()
+
+    key = dataset_key(type(dataset).__name__, os.path.abspath(os.path.expanduser(dataset.root)),
+                      dataset.train, start_index, stop_index)
+    return shared_tensor(key, 'images', lambda: load_images().numpy()), \
+        shared_tensor(key, 'labels', lambda: load_labels().numpy())
+
+
+class EpochSampler(object):
+    """
+    Samples batches of indices of a dataset epoch by epoch: indices are
+    (optionally) permuted once per epoch and walked batch by batch, and the
+    epoch ends when there are not enough indices left for a whole batch.
+
+    """
+
+    def __init__(self, num_samples, shuffle=True):
+        """
+        Constructor.
+
+        :param num_samples: Number of samples of the dataset.
+        :param shuffle: Permute the indices every epoch (DEFAULT: True).
+
+        """
+        self.num_samples = num_samples
+        self.shuffle = shuffle
+        # Number of completed epochs.
+        self.epoch = 0
+        self.permutation = None
+        self.position = 0
+
+    def next_batch(self, batch_size):
+        """
+        Returns indices of samples forming the next batch.
+
+        :param batch_size: Size of the batch (can change between batches).
+        :return: Array of indices.
+
+        """
+        if self.permutation is None or self.position + batch_size > self.num_samples:
+            if self.permutation is not None:
+                self.epoch += 1
+            # New epoch.
+            if self.shuffle:
+                self.permutation = np.random.permutation(self.num_samples)
+            else:
+                self.permutation = np.arange(self.num_samples)
+            self.position = 0
+
+        indices = self.permutation[self.position:self.position + batch_size]
+        self.position += batch_size
+        return indices
@@ -44,6 +44,9 @@ __author__ = "Vincent Marois, Ryan L. McAvoy"
 
 """
 
+import os
+import hashlib
+import numpy as np
 import torch
 from collections import Counter, OrderedDict
 import torchtext.vocab as vocab
@@ -78,14 +81,62 @@ class Language(object):
         :returns: FloatTensor of embedded vectors [max_sentence_length, embedding size]
 
         """
-        outsentence = torch.zeros(
-            (len(sentence.split()), self.vocab.vectors.size()[1]))
+        # embed all words with a single look-up
+        return self.embed_indices(
+            torch.LongTensor(self.sentence_indices(sentence)))
 
-        # embed a word at a time
-        for i, word in enumerate(sentence.split()):
-            outsentence[i, :] = self.embed_word(word)
+    def embed_batch(self, indices):
+        """
+        Embeds a batch of sentences (given by indexes of their words, see
+        sentence_indices()) with a single look-up.
+
+        :param indices: List of LongTensors of indexes of words of sentences
+        :returns: FloatTensor of embedded vectors [batch size x max_sentence_length x embedding size] (zeros after \
+        the ends of sentences)
+
+        """
+        return Language.embed_padded(indices, self.embed_indices)
+
+    @staticmethod
+    def embed_padded(indices, embed):
+        """
+        Pads a batch of sentences (given by indexes of their words) and embeds
+        them with a single call of the embedding.
 
-        return outsentence
+        :param indices: List of LongTensors of indexes of words of sentences
+        :param embed: Function embedding a LongTensor of indexes (e.g. embed_indices() or an nn.Embedding)
+        :returns: FloatTensor of embedded vectors [batch size x max_sentence_length x embedding size] (zeros after \
+        the ends of sentences)
+
+        """
+        lengths = torch.tensor([len(sentence_indices) for sentence_indices in indices])
+        tokens = torch.nn.utils.rnn.pad_sequence(indices, batch_first=True)
+
+        embedded = embed(tokens)
+
+        # clear the padding.
+        padding = torch.arange(tokens.size(1))[None, :] >= lengths[:, None]
+        return embedded.masked_fill(padding[:, :, None], 0)
+
+    def sentence_indices(self, sentence):
+        """
+        Converts a sentence into the indexes of its words in the vocab.
+
+        :param sentence: A string containing the words
+        :returns: List of indexes
+
+        """
+        return [self.vocab.stoi[word] for word in sentence.split()]
+
+    def embed_indices(self, indices):
+        """
+        Embeds words (e.g. padded batch of sentences) with a single look-up.
+
+        :param indices: LongTensor of indexes of words (of any shape)
+        :returns: FloatTensor of embedded vectors [indices shape x embedding size]
+
+        """
+        return self.vocab.vectors[indices]
 
     def embed_word(self, word):
         """
@@ -100,6 +151,17 @@ class Language(object):
         index = self.vocab.stoi[word]
         return self.vocab.vectors[index]
 
+    def embedding_index(self, metric='cosine', block_size=None):
+        """
+        Creates the nearest-neighbour index of vectors of the vocabulary.
+
+        :param metric: 'cosine' (similarity) or 'euclidean' (distance) (DEFAULT: 'cosine')
+        :param block_size: Number of words compared with queries at once (DEFAULT: None, i.e. all)
+        :returns: EmbeddingIndex object
+
+        """
+        return EmbeddingIndex(self.vocab.vectors, self.vocab.itos, metric, block_size)
+
     def return_index_from_word(self, word):
         """
         returns the index of a word in the vocab.
@@ -119,12 +181,17 @@ class Language(object):
 
         return self.vocab.itos[index]
 
-    def build_pretrained_vocab(self, data_set, **kwargs):
+    def build_pretrained_vocab(self, data_set, cache_dir=None, **kwargs):
         """
         Construct the torchtext Vocab object from a list of sentences. This
         allows us to load only vectors we actually need.
 
+        If cache_dir is given, the vectors of the words of the vocabulary are
+        cached there (see cache_filenames()), so that the (big) pretrained
+        vectors are loaded only once for a given vocabulary.
+
         :param data_set: A list containing strings (either sentences or just single word string work)
+        :param cache_dir: Directory of the cache of vectors (DEFAULT: None, i.e. no cache)
         :param \**kwargs: The keyword arguments for the vectors class from torch text. The most important kwarg is vectors which is a string containing the embedding type to be loaded
 
         """
@@ -140,8 +207,228 @@ class Language(object):
             tok for tok in [self.unk_token, self.pad_token, self.init_token,
                             self.eos_token]
             if tok is not None))
+        vectors = kwargs.get('vectors', None)
+        if cache_dir is None or not isinstance(vectors, str):
+            self.vocab = self.vocab_cls(counter, specials=specials, **kwargs)
+            return
+
+        # build the vocabulary only - its vectors are loaded from cache or
+        # loaded (and cached) separately.
+        vectors_kwargs = {}
+        if 'unk_init' in kwargs:
+            vectors_kwargs['unk_init'] = kwargs.pop('unk_init')
+        if 'vectors_cache' in kwargs:
+            vectors_kwargs['cache'] = kwargs.pop('vectors_cache')
+        kwargs.pop('vectors')
         self.vocab = self.vocab_cls(counter, specials=specials, **kwargs)
 
+        vectors_file, index_file = self.cache_filenames(cache_dir, vectors)
+        if not self.load_cached_vectors(vectors_file, index_file):
+            self.vocab.load_vectors(vectors, **vectors_kwargs)
+            self.save_cached_vectors(vectors_file, index_file)
+
+    def cache_filenames(self, cache_dir, vectors):
+        """
+        Returns the names of files of the cache of vectors: the vectors of
+        all words of the vocabulary (.npy) and the index file, listing the
+        words (one per line, in the order of vectors). The names contain a hash
+        of the vectors name and of the vocabulary.
+
+        :param cache_dir: Directory of the cache.
+        :param vectors: Name of the pretrained vectors (e.g. 'glove.6B.100d').
+
+        """
+        digest = hashlib.sha1('\n'.join([vectors] + self.vocab.itos).encode('utf-8')).hexdigest()[:12]
+        prefix = os.path.join(os.path.expanduser(cache_dir), '{}_{}'.format(vectors, digest))
+        return prefix + '.npy', prefix + '.vocab'
+
+    def load_cached_vectors(self, vectors_file, index_file):
+        """
+        Loads the vectors of the vocabulary from cache, as a (copy-on-write)
+        memory map shared by all processes using the same cache.
+
+        :param vectors_file: Name of the file with vectors (.npy).
+        :param index_file: Name of the index file.
+        :returns: True if the cache exists & matches the vocabulary.
+
+        """
+        if not (os.path.isfile(vectors_file) and os.path.isfile(index_file)):
+            return False
+        with open(index_file, encoding='utf-8') as f:
+            if f.read().split('\n') != self.vocab.itos:
+                return False
+
+        self.vocab.vectors = torch.from_numpy(np.load(vectors_file, mmap_mode='c'))
+        return True
+
+    def save_cached_vectors(self, vectors_file, index_file):
+        """
+        Saves the vectors of the vocabulary (and the index file) to cache.
+
+        :param vectors_file: Name of the file with vectors (.npy).
+        :param index_file: Name of the index file.
+
+        """
+        # write to temporary files first - concurrent runs never read a partial cache
+        suffix = '.%d.tmp' % os.getpid()
+        with open(vectors_file + suffix, 'wb') as f:
+            np.save(f, self.vocab.vectors.numpy())
+        with open(index_file + suffix, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.vocab.itos))
+        os.replace(vectors_file + suffix, vectors_file)
+        os.replace(index_file + suffix, index_file)
+
+
+class EmbeddingIndex(object):
+    """
+    Nearest-neighbour index of embedding vectors, answering top-k queries for
+    a batch of query vectors with a single matrix multiplication (per block of
+    vectors) followed by topk.
+
+    For the cosine metric, the vectors are normalized once, at creation. For
+    the euclidean metric, the squared distances are computed from the squared
+    norms of vectors (computed once) and the dot products.
+
+    In blocked mode (block_size), the vectors are compared with the queries
+    block by block, keeping the running top-k - the memory used is bounded by
+    [NUM_QUERIES x block_size], whatever the number of vectors.
+
+    """
+
+    def __init__(self, vectors, words=None, metric='cosine', block_size=None):
+        """
+        Constructor.
+
+        :param vectors: FloatTensor of vectors [NUM_WORDS x EMBEDDING_SIZE]
+        :param words: List of words, in the order of vectors (DEFAULT: None)
+        :param metric: 'cosine' (similarity) or 'euclidean' (distance) (DEFAULT: 'cosine')
+        :param block_size: Number of vectors compared with queries at once (DEFAULT: None, i.e. all)
+
+        """
+        assert metric in ['cosine', 'euclidean'], "Unsupported metric %r" % metric
+        assert block_size is None or block_size > 0, "Block size must be positive"
+        self.metric = metric
+        self.block_size = block_size
+        self.words = words
+        self.word_indexes = None if words is None else {
+            word: index for index, word in enumerate(words)}
+
+        vectors = vectors.float()
+        if metric == 'cosine':
+            self.vectors = self.normalize(vectors)
+        else:
+            self.vectors = vectors
+            self.squared_norms = (vectors * vectors).sum(dim=1)
+
+    @staticmethod
+    def normalize(vectors):
+        """
+        Normalizes the vectors (null vectors stay null).
+
+        :param vectors: FloatTensor [N x EMBEDDING_SIZE]
+
+        """
+        return vectors / vectors.norm(dim=1, keepdim=True).clamp(min=1e-12)
+
+    def __len__(self):
+        """
+        Returns the number of vectors.
+        """
+        return self.vectors.size(0)
+
+    def scores(self, queries, start, stop):
+        """
+        Computes the scores (the higher, the closer) of a block of vectors.
+
+        :param queries: FloatTensor of (normalized, for cosine) queries [NUM_QUERIES x EMBEDDING_SIZE]
+        :param start: Index of the first vector of the block.
+        :param stop: Index following the last vector of the block.
+        :returns: FloatTensor [NUM_QUERIES x (stop - start)]: similarities (cosine) or negated squared distances.
+
+        """
+        products = queries.matmul(self.vectors[start:stop].t())
+        if self.metric == 'cosine':
+            return products
+        return 2 * products - self.squared_norms[start:stop].unsqueeze(0) - \
+            (queries * queries).sum(dim=1, keepdim=True)
+
+    def search(self, queries, k=10):
+        """
+        Finds the k nearest neighbours of a batch of queries.
+
+        :param queries: FloatTensor of queries [NUM_QUERIES x EMBEDDING_SIZE] (or a single query [EMBEDDING_SIZE])
+        :param k: Number of neighbours (DEFAULT: 10)
+        :returns: similarities (cosine, decreasing) or distances (euclidean, increasing) [NUM_QUERIES x k], \
+        LongTensor of indexes of neighbours [NUM_QUERIES x k]
+
+        """
+        queries = queries.float()
+        if queries.dim() == 1:
+            queries = queries.unsqueeze(0)
+        if self.metric == 'cosine':
+            queries = self.normalize(queries)
+        k = min(k, len(self))
+        block_size = self.block_size or len(self)
+
+        best_scores, best_indexes = None, None
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            scores, indexes = self.scores(queries, start, stop).topk(min(k, stop - start), dim=1)
+            indexes += start
+            if best_scores is not None:
+                # merge with the running top-k
+                scores = torch.cat([best_scores, scores], dim=1)
+                scores, order = scores.topk(min(k, scores.size(1)), dim=1)
+                indexes = torch.cat([best_indexes, indexes], dim=1).gather(1, order)
+            best_scores, best_indexes = scores, indexes
+
+        if self.metric == 'euclidean':
+            best_scores = (-best_scores).clamp(min=0).sqrt()
+        return best_scores, best_indexes
+
+    def closest(self, queries, k=10, exclude=None):
+        """
+        Finds the words closest to a batch of queries.
+
+        :param queries: FloatTensor of queries [NUM_QUERIES x EMBEDDING_SIZE] (or a single query [EMBEDDING_SIZE])
+        :param k: Number of words (DEFAULT: 10)
+        :param exclude: List of lists of words to exclude from the results, one per query (DEFAULT: None)
+        :returns: List (one per query) of lists of k tuples (word, similarity or distance)
+
+        """
+        assert self.words is not None, "The index has no words"
+        if queries.dim() == 1:
+            queries = queries.unsqueeze(0)
+        exclude = [set(words) for words in exclude] if exclude is not None \
+            else [set() for _ in range(queries.size(0))]
+
+        # search for more neighbours, so that k remain after exclusion.
+        scores, indexes = self.search(queries, k + max(len(words) for words in exclude))
+
+        results = []
+        for query_scores, query_indexes, excluded in zip(scores.tolist(), indexes.tolist(), exclude):
+            neighbours = [(self.words[index], score)
+                          for score, index in zip(query_scores, query_indexes)
+                          if self.words[index] not in excluded]
+            results.append(neighbours[:k])
+        return results
+
+    def analogy(self, triples, k=5):
+        """
+        Answers a batch of analogies w1 : w2 :: w3 : ?, i.e. finds the words
+        closest to w2 - w1 + w3 (excluding w1, w2 & w3).
+
+        :param triples: List of tuples of words (w1, w2, w3)
+        :param k: Number of words per analogy (DEFAULT: 5)
+        :returns: List (one per analogy) of lists of k tuples (word, similarity or distance)
+
+        """
+        assert self.word_indexes is not None, "The index has no words"
+        indexes = torch.LongTensor([[self.word_indexes[word] for word in triple]
+                                    for triple in triples])
+        w1, w2, w3 = (self.vectors[indexes[:, i]] for i in range(3))
+        return self.closest(w2 - w1 + w3, k, exclude=triples)
+
 
 """
 The names of the classes available in torchtext vocab for reference
@@ -252,6 +539,9 @@ if __name__ == '__main__':
 
     print(len(lang.embed_word('<pad>')))
 
+    # euclidean distances, as in the original example
+    embedding_index = lang.embedding_index(metric='euclidean')
+
     def closest(vec, n=10):
         """
         Find the closest words for a given vector.
@@ -259,9 +549,7 @@ if __name__ == '__main__':
         :param vec: vector of an embedded word
 
         """
-        all_dists = [(w, torch.dist(vec, lang.embed_word(w)))
-                     for w in lang.vocab.itos]
-        return sorted(all_dists, key=lambda t: t[1])[:n]
+        return embedding_index.closest(vec, n)[0]
 
     def print_tuples(tuples):
         """
@@ -291,12 +579,7 @@ if __name__ == '__main__':
         print('\n[%s : %s :: %s : ?]' % (w1, w2, w3))
 
         # w2 - w1 + w3 = w4
-        closest_words = closest(lang.embed_word(
-            w2) - lang.embed_word(w1) + lang.embed_word(w3))
-
-        closest_words = [t for t in closest_words if t[0] not in [w1, w2, w3]]
-
-        print_tuples(closest_words[:n])
+        print_tuples(embedding_index.analogy([(w1, w2, w3)], n)[0])
 
     print_tuples(closest(lang.embed_word('google')))
     #analogy('man', 'king', 'woman')
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+shared_arrays.py: read-only dataset arrays shared by all processes on a node.
+
+An array is identified by the key of its dataset (see dataset_key()) and its name. The first process needing it
+builds it and saves it as a .npy file in shared memory (/dev/shm, if available). All processes (e.g. concurrent
+trainers of a grid search) then memory-map the same file, i.e. share a single copy of its pages instead of each
+loading its own copy of the dataset.
+
+The arrays stay in shared memory (i.e. in RAM) and are reused by later runs. When a dataset file changes (e.g. is
+regenerated), the arrays of its previous versions are removed while building the new ones (processes still attached
+to them keep their pages until they exit). Arrays of datasets that are not used anymore have to be removed manually,
+e.g.:
+
+    python -m problems.utils.shared_arrays --list
+    python -m problems.utils.shared_arrays --clear
+
+"""
+__author__ = "Tomasz Kornuta"
+
+import os
+import glob
+import fcntl
+import hashlib
+import argparse
+import tempfile
+import logging
+import contextlib
+
+import numpy as np
+import torch
+
+# Prefix of names of files with shared arrays.
+PREFIX = 'mip_shared_'
+
+logger = logging.getLogger('SharedArrays')
+
+
+def default_directory():
+    """
+    Returns the directory of shared arrays: /dev/shm (shared memory) if available, temporary directory otherwise.
+    """
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def dataset_key(*identity):
+    """
+    Creates the key of a dataset from its identity, e.g. name, path and range of samples.
+
+    The key consists of the hash of the identity and the hash of its version: sizes and modification
+    times of the existing files (given by paths), so that modified files result in new versions.
+
+    :param identity: Values identifying the dataset.
+    :return: String key (<identity>-<version>).
+
+    """
+    parts = []
+    versions = []
+    for part in identity:
+        if isinstance(part, str) and os.path.isfile(part):
+            stat = os.stat(part)
+            part = os.path.abspath(part)
+            versions.append((stat.st_size, stat.st_mtime))
+        parts.append(part)
+
+    def digest(value):
+        return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()[:16]
+
+    return '{}-{}'.format(digest(parts), digest(versions)[:8])
+
+
+def remove_superseded(key, directory):
+    """
+    Removes the arrays (and their locks) of other versions of the dataset.
+
+    :param key: Key of the dataset (see dataset_key()).
+    :param directory: Directory of shared arrays.
+
+    """
+    identity = key.split('-')[0]
+    for filename in glob.glob(os.path.join(directory, '{}{}-*'.format(PREFIX, identity))):
+        if not os.path.basename(filename).startswith(PREFIX + key + '_'):
+            logger.info('Removing superseded shared array {}'.format(filename))
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                # Removed by another process.
+                pass
+
+
+def usage(directory=None):
+    """
+    Returns the total size (in bytes) of shared arrays.
+
+    :param directory: Directory of shared arrays (DEFAULT: None, i.e. default_directory()).
+
+    """
+    return sum(os.path.getsize(filename) for filename in shared_files(directory)
+               if os.path.isfile(filename))
+
+
+@contextlib.contextmanager
+def locked(filename):
+    """
+    Context manager holding an exclusive lock of the file (<filename>.lock).
+
+    :param filename: Name of the file.
+
+    """
+    with open(filename + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def shared_array(key, name, loader, directory=None):
+    """
+    Returns a shared array, building it (once per node) if needed.
+
+    :param key: Key of the dataset (see dataset_key()).
+    :param name: Name of the array (e.g. 'images').
+    :param loader: Function returning the (numpy) array, called only if the array is not shared yet.
+    :param directory: Directory of shared arrays (DEFAULT: None, i.e. default_directory()).
+    :return: Numpy memory map (copy-on-write, i.e. pages are shared as long as they are not modified).
+
+    """
+    directory = directory or default_directory()
+    filename = os.path.join(directory, '{}{}_{}.npy'.format(PREFIX, key, name))
+
+    if not os.path.isfile(filename):
+        with locked(filename):
+            # Another process could have built it in the meantime.
+            if not os.path.isfile(filename):
+                # Do not keep the previous versions of the dataset in memory.
+                remove_superseded(key, directory)
+
+                array = np.ascontiguousarray(loader())
+                # Write to a temporary file first - never attach to a partial array.
+                tmp_filename = filename + '.%d.tmp' % os.getpid()
+                with open(tmp_filename, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp_filename, filename)
+                logger.info('Shared array {} ({:.1f} MB), shared arrays in {} use {:.1f} MB in total'.format(
+                    filename, array.nbytes / 2**20, directory, usage(directory) / 2**20))
+
+    return np.load(filename, mmap_mode='c')
+
+
+def shared_tensor(key, name, loader, directory=None):
+    """
+    Returns a shared array (see shared_array()) as a tensor.
+    """
+    return torch.from_numpy(shared_array(key, name, loader, directory))
+
+
+def shared_files(directory=None):
+    """
+    Returns the names of all files with shared arrays (and their locks).
+
+    :param directory: Directory of shared arrays (DEFAULT: None, i.e. default_directory()).
+
+    """
+    return sorted(glob.glob(os.path.join(directory or default_directory(), PREFIX + '*')))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--directory', type=str, default=None,
+                        help='Directory of shared arrays (DEFAULT: /dev/shm)')
+    parser.add_argument('--list', action='store_true',
+                        help='List the shared arrays')
+    parser.add_argument('--clear', action='store_true',
+                        help='Remove all shared arrays (do not use while experiments are running)')
+    FLAGS, _ = parser.parse_known_args()
+
+    files = shared_files(FLAGS.directory)
+    if FLAGS.list or not FLAGS.clear:
+        total = 0
+        for filename in files:
+            size = os.path.getsize(filename)
+            total += size
+            print('{:>12d}  {}'.format(size, filename))
+        print('Total: {:.1f} MB in {} files'.format(total / 2**20, len(files)))
+    if FLAGS.clear:
+        for filename in files:
+            os.remove(filename)
+        print('Removed {} files'.format(len(files)))
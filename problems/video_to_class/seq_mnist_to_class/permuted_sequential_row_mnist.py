@@ -18,15 +18,10 @@
 """permuted_sequential_row_mnist.py: load MNIST dataset using torchvision and apply a permutation over the rows"""
 __author__ = "Younes Bouhadjar"
 
-import torch
-from torchvision import datasets, transforms
-from torch.utils.data.sampler import SubsetRandomSampler
+from problems.video_to_class.seq_mnist_to_class.sequential_mnist_problem import SequentialMnistProblem
 
-from problems.problem import DataTuple, MaskAuxTuple
-from problems.video_to_class.video_to_class_problem import VideoToClassProblem
 
-
-class PermutedSequentialRowMnist(VideoToClassProblem):
+class PermutedSequentialRowMnist(SequentialMnistProblem):
     """
     Class generating permuted sequences of rows for sequential mnist.
     """
@@ -40,51 +35,8 @@ class PermutedSequentialRowMnist(VideoToClassProblem):
         """
 
         # Call base class constructors.
-        super(PermutedSequentialRowMnist, self).__init__(params)
-
-        # Retrieve parameters from the dictionary.
-        self.batch_size = params['batch_size']
-        self.start_index = params['start_index']
-        self.stop_index = params['stop_index']
-        self.num_rows = 28
-        self.num_columns = 28
-        self.use_train_data = params['use_train_data']
-        self.datasets_folder = params['mnist_folder']
-
-    def generate_batch(self):
-        # define transforms
-        pixel_permutation = torch.randperm(28)
-        train_transform = transforms.Compose([
-            transforms.ToTensor(), transforms.Lambda(lambda x: x[:, pixel_permutation])])
-
-        # load the datasets
-        train_datasets = datasets.MNIST(
-            self.datasets_folder,
-            train=True,
-            download=True,
-            transform=train_transform)
-        # set split
-        num_train = len(train_datasets)
-        indices = list(range(num_train))
-
-        idx = indices[self.start_index: self.stop_index]
-        sampler = SubsetRandomSampler(idx)
-
-        # loader
-        train_loader = torch.utils.data.DataLoader(
-            train_datasets, batch_size=self.batch_size, sampler=sampler)
-        # create an iterator
-        train_loader = iter(train_loader)
-
-        # create mask
-        mask = torch.zeros(self.num_rows)
-        mask[-1] = 1
-
-        # train_loader a generator: (data, label)
-        (data, label) = next(train_loader)
-
-        # Return DataTuple(!) and an empty (aux) tuple.
-        return DataTuple(data, label), MaskAuxTuple(mask.type(torch.uint8))
+        super(PermutedSequentialRowMnist, self).__init__(
+            params, sequence='rows', permute=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""sequential_mnist_problem.py: base class of sequential MNIST problems, serving sequences from MNIST loaded once into memory"""
+__author__ = "Tomasz Kornuta, Younes Bouhadjar"
+
+import torch
+from torchvision import datasets
+
+from problems.problem import DataTuple, MaskAuxTuple
+from problems.utils.in_memory import load_torchvision_dataset, EpochSampler
+from problems.video_to_class.video_to_class_problem import VideoToClassProblem
+
+
+class SequentialMnistProblem(VideoToClassProblem):
+    """
+    Base class of sequential MNIST problems.
+
+    Loads (a range of) MNIST digits once into memory, as a single uint8 tensor,
+    and serves batches of sequences of rows or pixels:
+
+    - sampled from a permutation of indices, drawn once per epoch,
+    - (optionally) permuted along the sequence, with a single gather on the \
+    whole batch - using a fixed permutation or a new one every episode.
+
+    """
+
+    def __init__(self, params, sequence='rows', permute=False):
+        """
+        Initializes the problem: loads MNIST into memory.
+
+        :param params: Dictionary of parameters (read from configuration file).
+        :param sequence: Elements of sequences: 'rows' [BATCH x 1 x 28 x 28] or 'pixels' [BATCH x 1 x 784 x 1].
+        :param permute: Default value of the 'permute' parameter.
+
+        """
+        # Call base class constructors.
+        super(SequentialMnistProblem, self).__init__(params)
+
+        # Retrieve parameters from the dictionary.
+        self.batch_size = params['batch_size']
+        self.start_index = params['start_index']
+        self.stop_index = params['stop_index']
+        self.use_train_data = params['use_train_data']
+        self.datasets_folder = params['mnist_folder']
+        self.num_rows = 28
+        self.num_columns = 28
+
+        assert sequence in ['rows', 'pixels'], "Unsupported sequence %r" % sequence
+        self.sequence = sequence
+        if sequence == 'rows':
+            self.sequence_length = self.num_rows
+        else:
+            self.sequence_length = self.num_rows * self.num_columns
+
+        # Permutation of elements of sequences.
+        self.permute = params.get('permute', permute)
+        # Permutation drawn once (True) or every episode (False).
+        self.fixed_permutation = params.get('fixed_permutation', False)
+        self.permutation = torch.randperm(self.sequence_length) if self.permute else None
+
+        # Share the dataset with other processes on the node.
+        self.shared_memory = params.get('shared_memory', False)
+
+        # Load the datasets - only once.
+        mnist = datasets.MNIST(
+            self.datasets_folder,
+            train=self.use_train_data,
+            download=True)
+        # Set split - images [N x H x W] (a view of the same arrays as of the
+        # in-memory MNIST problem [N x 1 x H x W], shared if requested).
+        images, self.labels = load_torchvision_dataset(
+            mnist, self.start_index, self.stop_index, self.shared_memory)
+        self.images = images[:, 0]
+
+        # Epoch-based sampling: permutation of indices walked batch by batch.
+        self.epoch_sampler = EpochSampler(len(self.labels))
+
+        # Create mask - the prediction is made at the last element.
+        mask = torch.zeros(self.sequence_length)
+        mask[-1] = 1
+        self.mask = mask.type(torch.uint8)
+
+    def next_batch_indices(self):
+        """
+        Returns indices of samples forming the next batch (see EpochSampler).
+
+        :return: Array of indices.
+
+        """
+        return self.epoch_sampler.next_batch(self.batch_size)
+
+    def generate_batch(self):
+        """
+        Generates a batch of sequences.
+
+        :return: DataTuple and MaskAuxTuple object.
+
+        """
+        return self.generate_batch_from_indices(self.next_batch_indices())
+
+    def epoch_size(self):
+        """
+        Returns the number of samples (of the split).
+        """
+        return len(self.labels)
+
+    def generate_batch_from_indices(self, indices):
+        """
+        Generates a batch of sequences of given samples.
+
+        :param indices: Indices of samples.
+        :return: DataTuple and MaskAuxTuple object.
+
+        """
+        batch_size = len(indices)
+
+        # Scale to [0, 1] and form sequences [BATCH x SEQ_LEN x ELEMENT].
+        data = self.images[indices].float().div_(255).view(
+            batch_size, self.sequence_length, -1)
+
+        # Permute elements of sequences - a single gather on the whole batch.
+        if self.permute:
+            if not self.fixed_permutation:
+                self.permutation = torch.randperm(self.sequence_length)
+            data = data[:, self.permutation]
+
+        # Rows: [BATCH x 1 x 28 x 28], pixels: [BATCH x 1 x 784 x 1].
+        data = data.unsqueeze(1)
+
+        # Return DataTuple(!) and an empty (aux) tuple.
+        return DataTuple(data, self.labels[indices]), MaskAuxTuple(self.mask)
@@ -18,15 +18,10 @@
 """sequential_pixel_mnist.py: load MNIST dataset using torchvision and transform it to a sequence of pixels"""
 __author__ = "Younes Bouhadjar"
 
-import torch
-from torchvision import datasets, transforms
-from torch.utils.data.sampler import SubsetRandomSampler
+from problems.video_to_class.seq_mnist_to_class.sequential_mnist_problem import SequentialMnistProblem
 
-from problems.problem import DataTuple, MaskAuxTuple
-from problems.video_to_class.video_to_class_problem import VideoToClassProblem
 
-
-class SequentialPixelMNIST(VideoToClassProblem):
+class SequentialPixelMNIST(SequentialMnistProblem):
     """
     Class generating a sequence of pixels for sequential mnist.
     """
@@ -36,52 +31,7 @@ class SequentialPixelMNIST(VideoToClassProblem):
         Initialize.
         """
         # Call base class constructors.
-        super(SequentialPixelMNIST, self).__init__(params)
-
-        # Retrieve parameters from the dictionary.
-        self.batch_size = params['batch_size']
-        self.start_index = params['start_index']
-        self.stop_index = params['stop_index']
-        self.num_rows = 28
-        self.num_columns = 28
-        self.use_train_data = params['use_train_data']
-        self.datasets_folder = params['mnist_folder']
-
-        # define transforms
-        train_transform = transforms.Compose([
-            transforms.ToTensor(), transforms.Lambda(lambda x: x.view(1, -1, 1))])
-
-        # load the datasets
-        self.train_datasets = datasets.MNIST(
-            self.datasets_folder,
-            train=self.use_train_data,
-            download=True,
-            transform=train_transform)
-        # set split
-        num_train = len(self.train_datasets)
-        indices = list(range(num_train))
-
-        idx = indices[self.start_index: self.stop_index]
-        self.sampler = SubsetRandomSampler(idx)
-
-    def generate_batch(self):
-        # data loader
-        train_loader = torch.utils.data.DataLoader(
-            self.train_datasets,
-            batch_size=self.batch_size,
-            sampler=self.sampler)
-        # create an iterator
-        train_loader = iter(train_loader)
-
-        # create mask
-        mask = torch.zeros(self.num_rows * self.num_columns)
-        mask[-1] = 1
-
-        # train_loader a generator: (data, label)
-        (data, label) = next(train_loader)
-
-        # Return DataTuple(!) and an empty (aux) tuple.
-        return DataTuple(data, label), MaskAuxTuple(mask.type(torch.uint8))
+        super(SequentialPixelMNIST, self).__init__(params, sequence='pixels')
 
 
 if __name__ == "__main__":
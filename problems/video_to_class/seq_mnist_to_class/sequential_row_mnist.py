@@ -18,66 +18,22 @@
 """sequential_row_mnist.py: load MNIST dataset using torchvision"""
 __author__ = "Younes Bouhadjar"
 
-import torch
-from torchvision import datasets, transforms
-from torch.utils.data.sampler import SubsetRandomSampler
+from problems.video_to_class.seq_mnist_to_class.sequential_mnist_problem import SequentialMnistProblem
 
-from problems.problem import DataTuple, MaskAuxTuple
-from problems.video_to_class.video_to_class_problem import VideoToClassProblem
 
-
-class SequentialRowMNIST(VideoToClassProblem):
+class SequentialRowMNIST(SequentialMnistProblem):
     """
     Class generating a sequence of rows for sequential mnist.
     """
 
     def __init__(self, params):
-        super(SequentialRowMNIST, self).__init__(params)
-        # Retrieve parameters from the dictionary.
-        self.batch_size = params['batch_size']
-        self.start_index = params['start_index']
-        self.stop_index = params['stop_index']
-        self.use_train_data = params['use_train_data']
-        self.num_rows = 28
-        self.num_columns = 28
-        self.datasets_folder = params['mnist_folder']
-
-        # define transforms
-        train_transform = transforms.Compose([
-            transforms.ToTensor()])
-
-        # load the datasets
-        self.train_datasets = datasets.MNIST(
-            self.datasets_folder,
-            train=self.use_train_data,
-            download=True,
-            transform=train_transform)
-        # set split
-        num_train = len(self.train_datasets)
-        indices = list(range(num_train))
-
-        idx = indices[self.start_index: self.stop_index]
-        self.sampler = SubsetRandomSampler(idx)
-
-    def generate_batch(self):
-
-        # data loader
-        train_loader = torch.utils.data.DataLoader(
-            self.train_datasets,
-            batch_size=self.batch_size,
-            sampler=self.sampler)
-        # create an iterator
-        train_loader = iter(train_loader)
-
-        # create mask
-        mask = torch.zeros(self.num_rows)
-        mask[-1] = 1
+        """
+        Initializes the problem, loads MNIST into memory.
 
-        # train_loader a generator: (data, label)
-        (data, label) = next(train_loader)
+        :param params: Dictionary of parameters (read from configuration file).
 
-        # Return DataTuple(!) and an empty (aux) tuple.
-        return DataTuple(data, label), MaskAuxTuple(mask.type(torch.uint8))
+        """
+        super(SequentialRowMNIST, self).__init__(params, sequence='rows')
 
 
 if __name__ == "__main__":
@@ -26,7 +26,7 @@ import yaml
 from random import randrange
 
 from datetime import datetime
-from time import sleep
+from time import sleep, perf_counter
 
 import torch
 import argparse
@@ -35,6 +35,7 @@ import logging
 import logging.config
 
 from problems.problem_factory import ProblemFactory
+from problems.problem_dataset import ProblemDataset
 from models.model_factory import ModelFactory
 
 from utils.app_state import AppState
@@ -194,6 +195,30 @@ if __name__ == '__main__':
     problem = ProblemFactory.build_problem(
         param_interface['testing']['problem'])
 
+    # Exhaustive evaluation (optional): a single pass over all samples of the
+    # split, in order, instead of max_test_episodes random batches, e.g.:
+    #
+    #   testing:
+    #       exhaustive:
+    #           batch_size: 256
+    #           num_workers: 4
+    exhaustive = 'exhaustive' in param_interface['testing']
+    if exhaustive:
+        exhaustive_params = param_interface['testing']['exhaustive']
+        exhaustive_params.add_default_params({
+            'batch_size': param_interface['testing']['problem']['batch_size'],
+            'num_workers': 0,
+            'prefetch_factor': 2})
+        batches = problem.return_epoch_generator(
+            exhaustive_params['batch_size'], exhaustive_params['num_workers'],
+            exhaustive_params['prefetch_factor'])
+        logger.info('Exhaustive evaluation of {} samples (batch size {}, {} workers)'.format(
+            problem.epoch_size(), exhaustive_params['batch_size'], exhaustive_params['num_workers']))
+    else:
+        # Batches are generated by the problem or (optionally) by DataLoader workers.
+        batches, _ = ProblemDataset.batch_generator(
+            problem, param_interface['testing'], logger)
+
     # Create statistics collector.
     stat_col = StatisticsCollector()
     # Add model/problem dependent statistics.
@@ -209,17 +234,31 @@ if __name__ == '__main__':
         yaml.dump(param_interface.to_dict(),
                   yaml_backup_file, default_flow_style=False)
 
+    # Sums of statistics weighted by sizes of batches (exhaustive evaluation).
+    split_sums = {}
+    num_samples = 0
+    start_time = perf_counter()
+
     # Run test
+    problem.reset_statistics()
     with torch.no_grad():
-        for episode, (data_tuple, aux_tuple) in enumerate(
-                problem.return_generator()):
+        for episode, (data_tuple, aux_tuple) in enumerate(batches):
 
-            if episode == param_interface["testing"]["problem"][
+            if not exhaustive and episode == param_interface["testing"]["problem"][
                     "max_test_episodes"]:
                 break
 
             logits, loss = forward_step(
-                model, problem, episode, stat_col, data_tuple, aux_tuple)
+                model, problem, episode, stat_col, data_tuple, aux_tuple, evaluation=True)
+            problem.collect_accumulated_statistics(stat_col)
+
+            if exhaustive:
+                # The last batch can be smaller - weight the statistics by batch size.
+                batch_size = len(data_tuple.targets)
+                num_samples += batch_size
+                for key in stat_col.aggregated_statistics():
+                    if stat_col.aggregation[key] == 'mean':
+                        split_sums[key] = split_sums.get(key, 0.0) + float(stat_col[key]) * batch_size
 
             # Log to logger.
             logger.info(stat_col.export_statistics_to_string('[Test]'))
@@ -235,3 +274,27 @@ if __name__ == '__main__':
                 is_closed = model.plot(data_tuple, logits)
                 if is_closed:
                     break
+
+    if exhaustive:
+        elapsed_time = perf_counter() - start_time
+
+        # Split-level statistics: means over all samples and last values of
+        # statistics accumulated over all batches. Statistics that are not
+        # aggregated (e.g. index of a length bucket) are not reported.
+        split_col = StatisticsCollector()
+        split_col['episode'] = episode
+        for key in stat_col.aggregated_statistics():
+            split_col.add_statistic(key, stat_col.formatting[key])
+            if stat_col.aggregation[key] == 'mean':
+                split_col[key] = split_sums.get(key, 0.0) / max(num_samples, 1)
+            else:
+                split_col[key] = stat_col[key]
+        split_col.add_statistic('samples', '{:d}')
+        split_col.add_statistic('samples_per_second', '{:.1f}')
+        split_col['samples'] = num_samples
+        split_col['samples_per_second'] = num_samples / max(elapsed_time, 1e-9)
+
+        # Log and export to a separate csv file.
+        logger.info(split_col.export_statistics_to_string('[Split]'))
+        split_file = split_col.initialize_csv_file(log_dir, 'testing_split.csv')
+        split_col.export_statistics_to_csv(split_file)
@@ -43,9 +43,11 @@ from utils.app_state import AppState
 from utils.statistics_collector import StatisticsCollector
 from utils.param_interface import ParamInterface
 from utils.worker_utils import forward_step, check_and_set_cuda, recurrent_config_parse
+from utils.batch_size_finder import BatchSizeFinder
 
 # Import model and problem factories.
 from problems.problem_factory import ProblemFactory
+from problems.problem_dataset import ProblemDataset
 from models.model_factory import ModelFactory
 
 def validation(
@@ -69,10 +71,13 @@ def validation(
     """
     # Turn on evaluation mode.
     model.eval()
+    # Every validation pass starts with fresh accumulated statistics.
+    problem.reset_statistics()
     # Calculate loss of the validation data.
     with torch.no_grad():
         logits_valid, loss_valid = forward_step(
-            model, problem, episode, stat_col, data_valid, aux_valid)
+            model, problem, episode, stat_col, data_valid, aux_valid, evaluation=True)
+    problem.collect_accumulated_statistics(stat_col)
 
     # Log to logger.
     logger.info(stat_col.export_statistics_to_string('[Validation]'))
@@ -157,6 +162,12 @@ if __name__ == '__main__':
         "1: During both training and validation\n"
         "2: Only during validation\n"
         "3: Only during last validation, after training is completed\n")
+    parser.add_argument(
+        '--find-batch-size',
+        dest='find_batch_size',
+        action='store_true',
+        help='Instead of training, sweep the batch sizes (configured in the training:batch_size_finder section)\n'
+        'with short timed probes and recommend the one maximizing throughput under the memory budget (Default: False)')
 
     # Parse arguments.
     FLAGS, unparsed = parser.parse_known_args()
@@ -355,6 +366,19 @@ if __name__ == '__main__':
             model.parameters()),
         **optimizer_conf)
 
+    # Find the batch size maximizing the throughput - instead of training.
+    if FLAGS.find_batch_size:
+        finder = BatchSizeFinder(
+            model, problem, optimizer, param_interface['training'])
+        probes = finder.sweep()
+        recommended = finder.recommend(probes)
+        logger.info(finder.summarize(probes, recommended))
+        # Write the recommended setting into a config that can be passed (first) to --config.
+        if recommended is not None and finder.export_config_file:
+            finder.export_config(
+                log_dir + 'batch_size_configuration.yaml', recommended)
+        exit(0)
+
     # Ok, finished loading the configuration.
     # Save the resulting configuration into a yaml settings file, under log_dir
     with open(log_dir + "training_configuration.yaml", 'w') as yaml_backup_file:
@@ -381,11 +405,18 @@ if __name__ == '__main__':
     # Flag denoting whether we converged (or reached last episode).
     terminal_condition = False
 
+    # Batches are generated by the problem or (optionally) by DataLoader workers.
+    batches, problem_dataset = ProblemDataset.batch_generator(
+        problem, param_interface['training'], logger)
+
     # Main training and verification loop.
-    for data_tuple, aux_tuple in problem.return_generator():
+    for data_tuple, aux_tuple in batches:
 
         # apply curriculum learning - change problem max seq_length
         curric_done = problem.curriculum_learning_update_params(episode)
+        if problem_dataset is not None:
+            # Propagate the episode to workers.
+            problem_dataset.set_episode(episode)
 
         # reset gradients
         optimizer.zero_grad()
@@ -1,4 +1,5 @@
 from .app_state import AppState
+from .batch_size_finder import BatchSizeFinder, BatchSizeProbe
 from .param_interface import ParamInterface
 from .param_registry import MetaSingletonABC, ParamRegistry
 from .singleton import SingletonMetaClass
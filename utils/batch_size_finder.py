@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) IBM Corporation 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""batch_size_finder.py: contains class sweeping batch sizes with short timed training probes"""
+__author__ = "Tomasz Kornuta"
+
+import sys
+import time
+import resource
+import logging
+import collections
+
+import yaml
+import torch
+
+from .app_state import AppState
+from .statistics_collector import StatisticsCollector
+from .worker_utils import forward_step
+
+_BatchSizeProbe = collections.namedtuple(
+    'BatchSizeProbe', ('batch_size', 'episode_time', 'samples_per_second', 'peak_memory', 'within_budget'))
+
+
+class BatchSizeProbe(_BatchSizeProbe):
+    """
+    Tuple used by storing the results of probing a single batch size.
+
+    Contains five elements:
+
+    - batch size
+    - mean episode time (in seconds)
+    - throughput (samples per second)
+    - peak memory during the probe (in MB): allocated GPU memory when using CUDA, resident set size otherwise
+    - flag indicating whether the probe fitted into the memory budget
+
+    """
+    __slots__ = ()
+
+
+class BatchSizeFinder(object):
+    """
+    Class sweeping the batch size of a problem with short, timed forward/backward probes
+    and recommending the value maximizing the throughput under a given memory budget.
+    """
+
+    def __init__(self, model, problem, optimizer, params):
+        """
+        Initializes the finder, sets default values of its parameters.
+
+        :param model: Model (built by the ModelFactory) that will be probed.
+        :param problem: Problem (built by the ProblemFactory) used for generation of batches.
+        :param optimizer: Optimizer used in the training.
+        :param params: Interface to parameters (training view of the registry).
+
+        """
+        self.model = model
+        self.problem = problem
+        self.optimizer = optimizer
+
+        # Gradient clipping - the same as in training (if present).
+        try:
+            self.gradient_clipping = params['gradient_clipping']
+        except KeyError:
+            self.gradient_clipping = None
+
+        # Set default values of the batch_size_finder section.
+        params.add_default_params({'batch_size_finder': {
+            'candidates': [1, 2, 4, 8, 16, 32, 64, 128, 256, 512],
+            'warmup_episodes': 1,
+            'probe_episodes': 5,
+            'memory_budget': -1,
+            'throughput_tolerance': 0.05,
+            'export_config': True
+        }})
+        params = params['batch_size_finder']
+        # Batch sizes to be checked - always in ascending order, as peak memory grows with the batch size.
+        self.candidates = sorted(params['candidates'])
+        # Number of episodes that will be excluded from time measurements.
+        self.warmup_episodes = params['warmup_episodes']
+        # Number of timed episodes.
+        self.probe_episodes = params['probe_episodes']
+        # Memory budget in MB (-1 means no budget).
+        self.memory_budget = params['memory_budget']
+        # The smallest batch size whose throughput is within that fraction of
+        # the best one will be recommended.
+        self.throughput_tolerance = params['throughput_tolerance']
+        # Flag indicating whether the recommendation should be written to a config file.
+        self.export_config_file = params['export_config']
+
+        self.logger = logging.getLogger('BatchSizeFinder')
+
+    @staticmethod
+    def reset_peak_memory():
+        """
+        Resets the peak memory, so that it is measured for every probe separately.
+
+        :returns: False if the peak cannot be reset (i.e. is the peak of the whole process).
+
+        """
+        if AppState().use_CUDA:
+            torch.cuda.reset_peak_memory_stats()
+            return True
+        try:
+            # Linux: resets the peak resident set size (VmHWM) to the current one.
+            with open('/proc/self/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def peak_memory():
+        """
+        Returns peak memory (in MB) since the last reset_peak_memory(): allocated
+        GPU memory when using CUDA, resident set size of the process otherwise.
+        """
+        if AppState().use_CUDA:
+            return torch.cuda.max_memory_allocated() / (1024 * 1024)
+        try:
+            with open('/proc/self/status') as status:
+                for line in status:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is returned in bytes on OS X and in kilobytes on Linux.
+        if sys.platform == 'darwin':
+            return usage / (1024 * 1024)
+        return usage / 1024
+
+    def synchronize(self):
+        """
+        Waits for all pending CUDA kernels, so the measured times are not underestimated.
+        """
+        if AppState().use_CUDA:
+            torch.cuda.synchronize()
+
+    def probe(self, batch_size):
+        """
+        Runs a short training probe (batch generation, forward, backward and
+        optimization step) for a given batch size.
+
+        :param batch_size: Batch size to be probed.
+        :returns: BatchSizeProbe tuple.
+
+        """
+        # Change batch size of the problem - all problems keep it in the batch_size attribute.
+        self.problem.batch_size = batch_size
+        generator = self.problem.return_generator()
+        stat_col = StatisticsCollector()
+        self.problem.add_statistics(stat_col)
+        self.model.add_statistics(stat_col)
+
+        self.model.train()
+        self.reset_peak_memory()
+        timed_episodes = 0
+        elapsed = 0.0
+        for episode in range(self.warmup_episodes + self.probe_episodes):
+            self.synchronize()
+            start = time.perf_counter()
+
+            data_tuple, aux_tuple = next(generator)
+            self.optimizer.zero_grad()
+            _, loss = forward_step(self.model, self.problem, episode,
+                                   stat_col, data_tuple, aux_tuple)
+            loss.backward()
+            if self.gradient_clipping is not None:
+                torch.nn.utils.clip_grad_value_(
+                    self.model.parameters(), self.gradient_clipping)
+            self.optimizer.step()
+
+            self.synchronize()
+            if episode >= self.warmup_episodes:
+                elapsed += time.perf_counter() - start
+                timed_episodes += 1
+
+        episode_time = elapsed / max(timed_episodes, 1)
+        peak_memory = self.peak_memory()
+        within_budget = self.memory_budget <= 0 or peak_memory <= self.memory_budget
+        return BatchSizeProbe(batch_size, episode_time,
+                              batch_size / episode_time, peak_memory, within_budget)
+
+    def sweep(self):
+        """
+        Probes all candidate batch sizes in ascending order. Stops at the first
+        candidate that exceeds the memory budget (or runs out of memory).
+
+        :returns: List of BatchSizeProbe tuples.
+
+        """
+        # Probe at the final settings of curriculum learning (e.g. the longest
+        # sequences), as those determine the peak memory consumption.
+        self.problem.curriculum_learning_update_params(sys.maxsize)
+
+        if not self.reset_peak_memory():
+            self.logger.warning(
+                "Peak memory cannot be reset - reported values are peaks of the whole process so far")
+
+        probes = []
+        for batch_size in self.candidates:
+            try:
+                result = self.probe(batch_size)
+            except RuntimeError as e:
+                # Out of memory (or other failure) - bigger batches will fail as well.
+                self.logger.warning(
+                    "Probe of batch size {} failed: {}".format(batch_size, e))
+                break
+            self.logger.info(
+                "batch_size {:6d}; episode_time {:10.6f} s; samples/s {:12.2f}; peak_memory {:10.1f} MB".format(
+                    result.batch_size, result.episode_time,
+                    result.samples_per_second, result.peak_memory))
+            probes.append(result)
+            if not result.within_budget:
+                self.logger.warning(
+                    "Batch size {} exceeded the memory budget of {} MB".format(
+                        batch_size, self.memory_budget))
+                break
+        return probes
+
+    def recommend(self, probes):
+        """
+        Selects the smallest batch size whose throughput is within the
+        tolerance of the best throughput observed within the memory budget.
+
+        :param probes: List of BatchSizeProbe tuples.
+        :returns: Recommended batch size or None if no candidate fitted into budget.
+
+        """
+        valid = [p for p in probes if p.within_budget]
+        if not valid:
+            return None
+        best_throughput = max(p.samples_per_second for p in valid)
+        for p in valid:
+            if p.samples_per_second >= (1 - self.throughput_tolerance) * best_throughput:
+                return p.batch_size
+
+    def summarize(self, probes, recommended):
+        """
+        Creates a table summarizing the sweep.
+
+        :param probes: List of BatchSizeProbe tuples.
+        :param recommended: Recommended batch size.
+        :returns: Summary string.
+
+        """
+        summary_str = '\n' + '='*80 + '\n'
+        summary_str += '{:>12} {:>16} {:>16} {:>16} {:>12}\n'.format(
+            'batch_size', 'episode_time [s]', 'samples/s', 'peak_mem [MB]', 'in budget')
+        summary_str += '='*80 + '\n'
+        for p in probes:
+            summary_str += '{:>12d} {:>16.6f} {:>16.2f} {:>16.1f} {:>12}{}\n'.format(
+                p.batch_size, p.episode_time, p.samples_per_second, p.peak_memory,
+                str(p.within_budget), ' <-' if p.batch_size == recommended else '')
+        summary_str += '='*80 + '\n'
+        summary_str += 'Recommended batch size: {}\n'.format(recommended)
+        return summary_str
+
+    def export_config(self, filename, recommended):
+        """
+        Writes the recommended batch size into a configuration file, that can
+        be passed to the trainer (in front of other configs) with --config.
+
+        :param filename: Name of the yaml file to be created.
+        :param recommended: Recommended batch size.
+
+        """
+        with open(filename, 'w') as yaml_file:
+            yaml.dump({'training': {'problem': {'batch_size': recommended}}},
+                      yaml_file, default_flow_style=False)
+        self.logger.info(
+            "Recommended batch size exported to {}".format(filename))
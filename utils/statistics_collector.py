@@ -38,21 +38,38 @@ class StatisticsCollector(Mapping):
         super(StatisticsCollector, self).__init__()
         self.statistics = dict()
         self.formatting = dict()
+        # How the statistics are aggregated over batches (e.g. of a whole split).
+        self.aggregation = dict()
 
         # Add default statistics with formatting.
         self.add_statistic('episode', '{:06d}')
         self.add_statistic('loss', '{:12.10f}')
 
-    def add_statistic(self, key, formatting):
+    def add_statistic(self, key, formatting, aggregation=None):
         """
         Add statistic to collector.
 
         :param key: Key of the statistic.
         :param formatting: Formatting that will be used when logging and exporting to CSV.
+        :param aggregation: How the statistic is aggregated over batches: 'mean' (weighted by sizes of batches), \
+        'last' (statistic already accumulated over all batches, e.g. corpus-level score) or 'none' (e.g. index \
+        of a length bucket). DEFAULT: None, i.e. 'none' for integer formatting, 'mean' otherwise.
 
         """
+        if aggregation is None:
+            aggregation = 'none' if formatting.rstrip('}').endswith('d') else 'mean'
+        assert aggregation in ['mean', 'last', 'none'], \
+            "Unknown aggregation of statistic {}: {}".format(key, aggregation)
+
         self.formatting[key] = formatting
         self.statistics[key] = -1
+        self.aggregation[key] = aggregation
+
+    def aggregated_statistics(self):
+        """
+        Returns the keys of statistics aggregated over batches (see add_statistic()).
+        """
+        return [key for key in self.statistics if self.aggregation.get(key, 'none') != 'none']
 
     def __getitem__(self, key):
         """
@@ -69,7 +86,7 @@ class StatisticsCollector(Mapping):
         Add/overwrites value of statistic associated with a given key.
 
         :param key: Key to value in parameters.
-        :param value: Statistics value associated with given key.
+        :param value: Statistics value associated with given key (None if not collected, e.g. for training batches).
 
         """
         self.statistics[key] = value
@@ -111,6 +128,21 @@ class StatisticsCollector(Mapping):
 
         return csv_file
 
+    def format_statistic(self, key, value, missing=''):
+        """
+        Formats value of a statistic using the possessed formatting.
+
+        :param key: Key of the statistic.
+        :param value: Value of the statistic.
+        :param missing: String returned when the statistic was not collected (value is None).
+        :return: Formatted value.
+
+        """
+        if value is None:
+            return missing
+        # Get formatting - using '{}' as default.
+        return self.formatting.get(key, '{}').format(value)
+
     def export_statistics_to_csv(self, csv_file):
         """
         Method writes current statistics to csv using the possessed formatting.
@@ -121,10 +153,8 @@ class StatisticsCollector(Mapping):
         # Iterate through values and concatenate them.
         values_str = ''
         for key, value in self.statistics.items():
-            # Get formatting - using '{}' as default.
-            format_str = self.formatting.get(key, '{}')
-            # Add value to string using formatting.
-            values_str += format_str.format(value) + ","
+            # Add value to string using formatting (empty if not collected).
+            values_str += self.format_statistic(key, value) + ","
         # Remove last coma and add \n.
         values_str = values_str[:-1] + '\n'
         csv_file.write(values_str)
@@ -141,10 +171,8 @@ class StatisticsCollector(Mapping):
         stat_str = ''
         for key, value in self.statistics.items():
             stat_str += key + ' '
-            # Get formatting - using '{}' as default.
-            format_str = self.formatting.get(key, '{}')
             # Add value to string using formatting.
-            stat_str += format_str.format(value) + "; "
+            stat_str += self.format_statistic(key, value, missing='-') + "; "
         # Remove last two element.
         stat_str = stat_str[:-2] + " " + additional_tag
         return stat_str
@@ -164,8 +192,8 @@ class StatisticsCollector(Mapping):
         # Iterate through keys and values and concatenate them.
         stat_str = ''
         for key, value in self.statistics.items():
-            # Skip episode.
-            if key == 'episode':
+            # Skip episode and statistics that were not collected.
+            if key == 'episode' or value is None:
                 continue
             tb_writer.add_scalar(key, value, episode)
 
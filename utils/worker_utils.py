@@ -27,10 +27,12 @@ from torch.nn.modules.module import _addindent
 from .app_state import AppState
 
 
-def forward_step(model, problem, episode, stat_col, data_tuple, aux_tuple):
+def forward_step(model, problem, episode, stat_col, data_tuple, aux_tuple, evaluation=False):
     """
     Function performs a single forward step.
 
+    :param evaluation: If True, the batch is a part of the evaluated (validation/test) set, and the \
+    statistics accumulated over the whole set are updated (DEFAULT: False).
     :returns: logits, loss and accuracy (former using provided criterion)
 
     """
@@ -52,6 +54,10 @@ def forward_step(model, problem, episode, stat_col, data_tuple, aux_tuple):
     problem.collect_statistics(stat_col, data_tuple, logits, aux_tuple)
     model.collect_statistics(stat_col, data_tuple, logits)
 
+    # Accumulate statistics over the evaluated set.
+    if evaluation:
+        problem.accumulate_statistics(data_tuple, logits, aux_tuple)
+
     # Return tuple: logits, loss.
     return logits, loss
 